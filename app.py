@@ -16,8 +16,9 @@ Autor: Sistema de Gestión de Guardias
 Versión: 4.0 - Con Generador Integrado
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, session
+from flask import Flask, render_template, request, jsonify, send_file, session, make_response
 from flask_cors import CORS
+from werkzeug.http import is_resource_modified
 import openpyxl
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import PatternFill
@@ -26,8 +27,18 @@ import os
 import json
 import hashlib
 import secrets
+import sqlite3
+import threading
+import heapq
+import math
+import time
+import atexit
+import traceback
 from datetime import datetime, date, timedelta
-from collections import defaultdict
+from collections import defaultdict, namedtuple, deque, OrderedDict
+from bisect import bisect_left, bisect_right
+from copy import deepcopy
+from contextlib import contextmanager, ExitStack
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
@@ -38,9 +49,34 @@ CORS(app, supports_credentials=True)
 # ============================================================================
 
 EXCEL_FILE = "calendario_guardias_2026.xlsx"
-HISTORIAL_FILE = "historial_guardias.json"
+HISTORIAL_FILE = "historial_guardias.jsonl"
+HISTORIAL_LEGACY_FILE = "historial_guardias.json"  # Formato anterior (array JSON), se migra al iniciar
+HISTORIAL_INDICE_FILE = "historial_guardias.idx"   # Índice de offsets del historial (una línea por evento)
 DISPONIBILIDAD_FILE = "disponibilidad.json"
 USUARIOS_FILE = "usuarios.json"
+INDICE_CELDAS_FILE = "indice_celdas.json"
+
+# Backend de almacenamiento: "archivos" (Excel + JSON, formato original) o "sqlite"
+ALMACENAMIENTO = os.environ.get('GUARDIAS_ALMACENAMIENTO', 'archivos')
+DB_FILE = os.environ.get('GUARDIAS_DB', "guardias.db")
+
+# Archivos de bloqueo para coordinar escrituras entre procesos (workers de gunicorn)
+BLOQUEOS_DIR = "bloqueos"
+
+# Escrituras al Excel: se registran en el journal (durable) y un hilo las vuelca
+# al Excel agrupadas, como mucho cada INTERVALO_GUARDADO segundos
+JOURNAL_FILE = "calendario_guardias_2026.journal"
+# Últimos volcados del journal al Excel, para que los workers sigan aplicando el
+# journal sobre su modelo en vez de recargarlo entero
+VOLCADOS_FILE = "calendario_guardias_2026.volcados"
+VOLCADOS_GUARDADOS = 20
+INTERVALO_GUARDADO = float(os.environ.get('GUARDIAS_INTERVALO_GUARDADO', '2.0'))
+
+# Tope de tiempo (segundos) de los métodos de distribución "local" y "exacto"; si no terminan se usa el greedy
+TIEMPO_OPTIMIZADOR = float(os.environ.get('GUARDIAS_TIEMPO_OPTIMIZADOR', '2.0'))
+
+# Máximo de combinaciones por persona que arma el método "exacto"; si se pasa se usa el greedy
+MAX_OPCIONES_EXACTO = 200_000
 
 # ============================================================================
 # TABLA DE PERSONAL — fuente única de verdad
@@ -97,6 +133,9 @@ FERIADOS_2026 = {
     date(2026, 12, 25)  # Navidad
 }
 
+# Puntos por tipo de día (sistema equitativo)
+PUNTOS_POR_TIPO = {'habil': 1.0, 'vispera': 1.5, 'feriado': 2.0}
+
 # Convertir feriados a strings para búsquedas
 FERIADOS_2026_STR = {f.strftime("%Y-%m-%d") for f in FERIADOS_2026}
 
@@ -104,9 +143,9 @@ FERIADOS_2026_STR = {f.strftime("%Y-%m-%d") for f in FERIADOS_2026}
 # GENERADOR DE CALENDARIO INTEGRADO
 # ============================================================================
 
-def generar_calendario_guardias_2026():
+def construir_libro_calendario():
     """
-    Genera el calendario 2026 tipo grilla semanal con:
+    Construye (sin guardar) el libro del calendario 2026 tipo grilla semanal con:
     - Feriados en rojo
     - Fin de semana en rojo
     - Lunes a jueves en azul
@@ -118,8 +157,6 @@ def generar_calendario_guardias_2026():
     - Filas pares (2,4,6...): Números de días
     - Filas impares (3,5,7...): Asignaciones de personas
     """
-    print("📅 Generando calendario 2026...")
-    
     fill_red = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
     fill_blue = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")
     fill_yellow = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
@@ -184,8 +221,17 @@ def generar_calendario_guardias_2026():
             if not any(week):
                 break
 
-    wb.save(EXCEL_FILE)
-    print(f"✅ Calendario generado: {EXCEL_FILE}")
+    return wb
+
+
+def generar_calendario_guardias_2026():
+    """Genera un calendario 2026 vacío en el almacenamiento configurado"""
+    print("📅 Generando calendario 2026...")
+    
+    almacenamiento().guardar_calendario_nuevo(construir_libro_calendario())
+    print(f"✅ Calendario generado ({almacenamiento().nombre})")
+    
+    cargar_modelo_calendario()
 
 
 
@@ -194,99 +240,286 @@ def inicializar_calendario():
     Inicializa el calendario al arrancar la aplicación.
     Solo genera si no existe o si el usuario lo solicita.
     """
-    if not os.path.exists(EXCEL_FILE):
-        print("📋 No se encontró archivo de calendario. Generando...")
-        generar_calendario_guardias_2026()
-    else:
-        print(f"✅ Calendario encontrado: {EXCEL_FILE}")
+    # Varios workers pueden arrancar a la vez: solo uno genera el calendario faltante
+    with bloqueo_entre_procesos("inicializacion"):
+        generar = not existe_calendario()
+        if generar:
+            print("📋 No se encontró calendario. Generando...")
+            generar_calendario_guardias_2026()
+    
+    if not generar:
+        print(f"✅ Calendario encontrado ({almacenamiento().nombre})")
+        if almacenamiento().nombre == "archivos" and tamano_journal():
+            # Cambios confirmados que no llegaron al Excel (caída o cierre abrupto)
+            print("💾 Aplicando al Excel los cambios pendientes del journal...")
+            volcar_journal_excel()
+        cargar_modelo_calendario()
+    
+    migrar_historial_legacy()
+
+
+_inicializacion = {"hecha": False}
+_inicializacion_lock = threading.Lock()
+
+
+def inicializar_una_vez():
+    """Corre inicializar_calendario la primera vez que se llama en este proceso"""
+    if _inicializacion["hecha"]:
+        return
+    with _inicializacion_lock:
+        if not _inicializacion["hecha"]:
+            inicializar_calendario()
+            _inicializacion["hecha"] = True
+
+
+@app.before_request
+def inicializar_antes_del_primer_pedido():
+    """Con gunicorn no se ejecuta __main__: cada worker se inicializa con su primer pedido"""
+    inicializar_una_vez()
 
 
 # ============================================================================
 # FUNCIONES DE DISPONIBILIDAD
 # ============================================================================
 
+# Cada persona tiene cualquier cantidad de ventanas de inactividad
+# {"desde", "hasta", "motivo"} (sin desde o sin hasta = abierta hacia ese lado),
+# guardadas ordenadas: {persona: {"inactividades": [...]}}. Los registros del
+# formato anterior ({activo, motivo, desde, hasta}) se convierten al leerlos.
+#
+# Motor de disponibilidad: los datos se leen una vez y se precalcula una matriz
+# día-del-año × persona, más un índice de intervalos por persona para fechas
+# fuera del año y consultas por rango. Se invalida si cambia la firma del
+# almacenamiento (otro worker, edición manual) o cuando guardar_disponibilidad
+# escribe datos nuevos.
+
+INICIO_ANIO = date(2026, 1, 1)
+DIAS_ANIO = (date(2027, 1, 1) - INICIO_ANIO).days
+
+PERSONA_INDICE = {persona: idx for idx, persona in enumerate(PERSONAS)}
+
+_motor_disponibilidad = {
+    "firma": None,      # Firma del almacenamiento de disponibilidad al cargarlo
+    "version": None,    # Hash del contenido (para ETag)
+    "datos": None,      # {persona: {"inactividades": [...]}}
+    "indices": {},      # {persona: IndiceInactividad}
+    "todas": None,      # IndiceInactividad con las ventanas de todos (con "persona")
+    "matriz": [],       # [dia_del_anio] -> tuple(bool por persona, en orden de PERSONAS)
+    "activos": []       # [dia_del_anio] -> tuple(personas disponibles ese día)
+}
+_disponibilidad_lock = threading.RLock()
+
+
+def _fecha_a_date(fecha):
+    """Convierte string YYYY-MM-DD o date a date (None si no se puede)"""
+    if isinstance(fecha, date):
+        return fecha
+    if isinstance(fecha, str):
+        try:
+            return date.fromisoformat(fecha)
+        except ValueError:
+            return None
+    return None
+
+
+def validar_ventana_inactividad(ventana):
+    """
+    Normaliza una ventana {desde, hasta, motivo}.
+    
+    Raises:
+        ValueError: Si una fecha no es YYYY-MM-DD o desde es posterior a hasta
+    """
+    limpia = {}
+    for campo in ("desde", "hasta"):
+        valor = ventana.get(campo) or None
+        if valor is not None and _fecha_a_date(valor) is None:
+            raise ValueError(f"Fecha '{valor}' inválida (formato YYYY-MM-DD)")
+        limpia[campo] = _fecha_a_date(valor).isoformat() if valor else None
+    if limpia["desde"] and limpia["hasta"] and limpia["desde"] > limpia["hasta"]:
+        raise ValueError("La fecha 'desde' es posterior a 'hasta'")
+    limpia["motivo"] = ventana.get("motivo") or None
+    return limpia
+
+
+def normalizar_registro_disponibilidad(info):
+    """
+    Registro de una persona en el formato actual, con las ventanas ordenadas.
+    Acepta el formato anterior: activo=False con desde/hasta (o sin fechas,
+    inactivo siempre) pasa a ser una única ventana.
+    """
+    if info is None:
+        return {"inactividades": []}
+    if "inactividades" in info:
+        ventanas = [validar_ventana_inactividad(v) for v in info["inactividades"]]
+    elif info.get("activo", True):
+        ventanas = []
+    else:
+        ventanas = [validar_ventana_inactividad(info)]
+    ventanas.sort(key=lambda v: (v["desde"] or "", v["hasta"] or "9999-12-31"))
+    return {"inactividades": ventanas}
+
+
+class IndiceInactividad:
+    """
+    Ventanas ordenadas por inicio con el máximo acumulado de los fines: saber si
+    una fecha cae en alguna ventana es una búsqueda binaria (O(log k)), y las
+    ventanas que se superponen con un rango se recorren sin mirar las que
+    terminaron antes.
+    """
+    
+    def __init__(self, ventanas):
+        self.ventanas = sorted(ventanas, key=lambda v: (v["desde"] or "", v["hasta"] or "9999-12-31"))
+        self.inicios = [_fecha_a_date(v["desde"]) or date.min for v in self.ventanas]
+        self.fines = [_fecha_a_date(v["hasta"]) or date.max for v in self.ventanas]
+        self.max_fin = []
+        for i, fin in enumerate(self.fines):
+            if not self.max_fin or fin > self.max_fin[-1][0]:
+                self.max_fin.append((fin, i))
+            else:
+                self.max_fin.append(self.max_fin[-1])
+    
+    def ventana_en(self, fecha):
+        """Una ventana que contiene la fecha, o None"""
+        i = bisect_right(self.inicios, fecha)
+        if i == 0:
+            return None
+        fin, j = self.max_fin[i - 1]
+        return self.ventanas[j] if fin >= fecha else None
+    
+    def superpuestas(self, desde, hasta):
+        """Ventanas que tocan algún día entre desde y hasta (inclusive), en orden"""
+        resultado = []
+        for j in range(bisect_right(self.inicios, hasta) - 1, -1, -1):
+            if self.max_fin[j][0] < desde:
+                break
+            if self.fines[j] >= desde:
+                resultado.append(self.ventanas[j])
+        resultado.reverse()
+        return resultado
+
+
+def _construir_motor_disponibilidad(disponibilidad, firma):
+    """Precalcula los índices de intervalos y la matriz diaria del año"""
+    fin_anio = INICIO_ANIO + timedelta(days=DIAS_ANIO - 1)
+    indices = {}
+    todas = []
+    columnas = []
+    for persona in PERSONAS:
+        ventanas = disponibilidad.get(persona, {}).get("inactividades", [])
+        indices[persona] = IndiceInactividad(ventanas)
+        todas.extend(dict(v, persona=persona) for v in ventanas)
+        
+        # Marcar solo los días cubiertos por alguna ventana
+        columna = [True] * DIAS_ANIO
+        for inicio, fin in zip(indices[persona].inicios, indices[persona].fines):
+            inicio = max(inicio, INICIO_ANIO)
+            fin = min(fin, fin_anio)
+            if inicio <= fin:
+                i = (inicio - INICIO_ANIO).days
+                j = (fin - INICIO_ANIO).days
+                columna[i:j + 1] = [False] * (j - i + 1)
+        columnas.append(columna)
+    
+    matriz = list(zip(*columnas))
+    activos = [
+        tuple(p for p, disponible in zip(PERSONAS, fila) if disponible)
+        for fila in matriz
+    ]
+    
+    _motor_disponibilidad.update({
+        "firma": firma,
+        "version": hashlib.md5(json.dumps(disponibilidad, sort_keys=True).encode('utf-8')).hexdigest(),
+        "datos": disponibilidad,
+        "indices": indices,
+        "todas": IndiceInactividad(todas),
+        "matriz": matriz,
+        "activos": activos
+    })
+
+
+def motor_disponibilidad():
+    """Retorna el motor de disponibilidad, recargándolo si el archivo cambió"""
+    with _disponibilidad_lock:
+        firma = almacenamiento().firma_disponibilidad()
+        if _motor_disponibilidad["datos"] is None or _motor_disponibilidad["firma"] != firma:
+            disponibilidad = almacenamiento().leer_disponibilidad()
+            if disponibilidad is None:
+                # Crear registro inicial con todos activos
+                guardar_disponibilidad({persona: {"inactividades": []} for persona in PERSONAS})
+            else:
+                disponibilidad = {
+                    persona: normalizar_registro_disponibilidad(info)
+                    for persona, info in disponibilidad.items()
+                }
+                _construir_motor_disponibilidad(disponibilidad, firma)
+        return _motor_disponibilidad
+
+
 def cargar_disponibilidad():
-    """Carga el estado de disponibilidad desde archivo JSON"""
+    """Carga el estado de disponibilidad (copia modificable del motor)"""
+    return deepcopy(motor_disponibilidad()["datos"])
+
+
+def guardar_disponibilidad(disponibilidad):
+    """Guarda el estado de disponibilidad y reconstruye el motor"""
+    disponibilidad = {
+        persona: normalizar_registro_disponibilidad(info)
+        for persona, info in disponibilidad.items()
+    }
+    with _disponibilidad_lock:
+        almacenamiento().escribir_disponibilidad(disponibilidad)
+        _construir_motor_disponibilidad(deepcopy(disponibilidad), almacenamiento().firma_disponibilidad())
+
+
+def leer_disponibilidad_json():
+    """Lee DISPONIBILIDAD_FILE (None si no existe)"""
     if not os.path.exists(DISPONIBILIDAD_FILE):
-        # Crear archivo inicial con todos activos
-        disponibilidad = {
-            persona: {
-                "activo": True,
-                "motivo": None,
-                "desde": None,
-                "hasta": None
-            } for persona in PERSONAS
-        }
-        guardar_disponibilidad(disponibilidad)
-        return disponibilidad
-    
+        return None
     with open(DISPONIBILIDAD_FILE, 'r', encoding='utf-8') as f:
         return json.load(f)
 
 
-def guardar_disponibilidad(disponibilidad):
+def escribir_disponibilidad_json(disponibilidad):
     """Guarda el estado de disponibilidad en archivo JSON"""
     with open(DISPONIBILIDAD_FILE, 'w', encoding='utf-8') as f:
         json.dump(disponibilidad, f, indent=2, ensure_ascii=False)
 
 
+def _indice_dia_anio(fecha):
+    """Posición de la fecha en la matriz del año, o None si está fuera de 2026"""
+    fecha_obj = _fecha_a_date(fecha)
+    if fecha_obj is None:
+        return None
+    idx = (fecha_obj - INICIO_ANIO).days
+    return idx if 0 <= idx < DIAS_ANIO else None
+
+
 def persona_disponible(persona, fecha=None):
     """
     Verifica si una persona está disponible en una fecha específica.
     
     Args:
         persona: Nombre de la persona
-        fecha: Fecha a verificar (string YYYY-MM-DD, objeto date, o None para verificación general)
+        fecha: Fecha a verificar (string YYYY-MM-DD, objeto date, o None para hoy)
     
     Returns:
         bool: True si está disponible, False si no
     """
-    disponibilidad = cargar_disponibilidad()
+    motor = motor_disponibilidad()
     
-    if persona not in disponibilidad:
+    if persona not in motor["indices"]:
         return True
     
-    info = disponibilidad[persona]
-    
-    # Si está marcado como activo, está disponible
-    if info['activo']:
+    fecha_obj = date.today() if fecha is None else _fecha_a_date(fecha)
+    if fecha_obj is None:
         return True
     
-    # Si está inactivo sin fechas, NO está disponible nunca
-    if not info['desde'] and not info['hasta']:
-        return False
-    
-    # Si no se proporciona fecha, retornar estado general
-    if fecha is None:
-        return False
+    idx = _indice_dia_anio(fecha_obj)
+    if idx is None:
+        # Fuera del año del calendario: búsqueda en el índice de ventanas
+        return motor["indices"][persona].ventana_en(fecha_obj) is None
     
-    # Verificar si la fecha está en el rango de inactividad
-    try:
-        if isinstance(fecha, str):
-            fecha_obj = datetime.strptime(fecha, "%Y-%m-%d").date()
-        elif isinstance(fecha, date):
-            fecha_obj = fecha
-        else:
-            return False
-        
-        # Verificar límite inferior (desde)
-        if info['desde']:
-            desde = datetime.strptime(info['desde'], "%Y-%m-%d").date()
-            if fecha_obj < desde:
-                return True  # Fecha anterior a inicio de inactividad
-        
-        # Verificar límite superior (hasta)
-        if info['hasta']:
-            hasta = datetime.strptime(info['hasta'], "%Y-%m-%d").date()
-            if fecha_obj > hasta:
-                return True  # Fecha posterior a fin de inactividad
-        
-        # Está dentro del rango de inactividad
-        return False
-        
-    except Exception as e:
-        print(f"Error al verificar disponibilidad: {e}")
-        return not info['activo']
+    return motor["matriz"][idx][PERSONA_INDICE[persona]]
 
 
 def obtener_personas_activas(fecha=None):
@@ -299,9 +532,72 @@ def obtener_personas_activas(fecha=None):
     Returns:
         list: Lista de personas disponibles
     """
+    if fecha is not None:
+        idx = _indice_dia_anio(fecha)
+        if idx is not None:
+            return list(motor_disponibilidad()["activos"][idx])
     return [p for p in PERSONAS if persona_disponible(p, fecha)]
 
 
+def personas_activas_en_rango(desde, hasta):
+    """
+    Personas disponibles al menos un día entre desde y hasta (inclusive),
+    resuelto como un corte de la matriz del año.
+    """
+    motor = motor_disponibilidad()
+    i = _indice_dia_anio(desde)
+    j = _indice_dia_anio(hasta)
+    if i is None or j is None:
+        activos = set()
+        d = _fecha_a_date(desde)
+        fin = _fecha_a_date(hasta)
+        while d <= fin:
+            activos.update(obtener_personas_activas(d))
+            d += timedelta(days=1)
+        return activos
+    
+    activos = set()
+    for fila in motor["activos"][i:j + 1]:
+        activos.update(fila)
+    return activos
+
+
+def personas_activas_en_dias(dias):
+    """Personas disponibles en al menos uno de los días dados ({dia: info} de un mes)"""
+    if not dias:
+        return set()
+    fechas = [info['fecha'] for info in dias.values()]
+    return personas_activas_en_rango(min(fechas), max(fechas))
+
+
+def matriz_disponibilidad(desde, hasta, personas=None):
+    """
+    Disponibilidad de cada persona en cada día entre desde y hasta (inclusive),
+    en una sola pasada: dentro del año son cortes de la matriz precalculada,
+    fuera del año se evalúa cada día.
+    
+    Returns:
+        tuple: ([fechas date], {persona: [bool por fecha]})
+    """
+    inicio = _fecha_a_date(desde)
+    fin = _fecha_a_date(hasta)
+    fechas = [inicio + timedelta(days=k) for k in range((fin - inicio).days + 1)]
+    personas = personas or PERSONAS
+    
+    motor = motor_disponibilidad()
+    i = _indice_dia_anio(inicio)
+    j = _indice_dia_anio(fin)
+    
+    resultado = {}
+    for persona in personas:
+        if i is not None and j is not None and persona in PERSONA_INDICE:
+            k = PERSONA_INDICE[persona]
+            resultado[persona] = [fila[k] for fila in motor["matriz"][i:j + 1]]
+        else:
+            resultado[persona] = [persona_disponible(persona, fecha) for fecha in fechas]
+    return fechas, resultado
+
+
 def get_motivo_indisponibilidad(persona, fecha=None):
     """
     Obtiene el motivo de indisponibilidad de una persona.
@@ -309,15 +605,59 @@ def get_motivo_indisponibilidad(persona, fecha=None):
     Returns:
         str or None: Motivo si está indisponible, None si está disponible
     """
-    disponibilidad = cargar_disponibilidad()
-    
-    if persona not in disponibilidad:
+    indice = motor_disponibilidad()["indices"].get(persona)
+    fecha_obj = date.today() if fecha is None else _fecha_a_date(fecha)
+    if indice is None or fecha_obj is None:
         return None
     
-    if persona_disponible(persona, fecha):
+    ventana = indice.ventana_en(fecha_obj)
+    if ventana is None:
         return None
-    
-    return disponibilidad[persona].get('motivo', 'No especificado')
+    return ventana["motivo"] or 'No especificado'
+
+
+def inactividades_en_rango(desde, hasta, persona=None):
+    """
+    Ventanas de inactividad que se superponen con el rango (inclusive), de una
+    persona o de todas (cada ventana lleva "persona").
+    """
+    motor = motor_disponibilidad()
+    inicio = _fecha_a_date(desde)
+    fin = _fecha_a_date(hasta)
+    if persona is None:
+        return [dict(v) for v in motor["todas"].superpuestas(inicio, fin)]
+    indice = motor["indices"].get(persona)
+    if indice is None:
+        return []
+    return [dict(v, persona=persona) for v in indice.superpuestas(inicio, fin)]
+
+
+def resumen_disponibilidad(persona, fecha=None):
+    """
+    Registro de una persona para la API en una fecha (por defecto hoy): sus
+    ventanas más los campos del formato anterior (activo = ninguna ventana
+    cubre la fecha; motivo/desde/hasta de la ventana que la cubre, o si no la
+    próxima, o si no la última).
+    """
+    motor = motor_disponibilidad()
+    ventanas = motor["datos"].get(persona, {}).get("inactividades", [])
+    fecha_obj = _fecha_a_date(fecha) or date.today()
+    indice = motor["indices"].get(persona)
+    cubre = indice.ventana_en(fecha_obj) if indice else None
+    vigente = cubre
+    if vigente is None and ventanas:
+        dia = fecha_obj.isoformat()
+        vigente = next(
+            (v for v in ventanas if (v["hasta"] or "9999-12-31") >= dia),
+            ventanas[-1]
+        )
+    return {
+        "activo": cubre is None,
+        "motivo": vigente["motivo"] if vigente else None,
+        "desde": vigente["desde"] if vigente else None,
+        "hasta": vigente["hasta"] if vigente else None,
+        "inactividades": [dict(v) for v in ventanas]
+    }
 
 
 # ============================================================================
@@ -362,6 +702,16 @@ def obtener_dias_del_mes_mejorado(hoja, mes_nombre):
     Detección robusta de días en formato calendario grid.
     Busca cualquier número entero que sea un día válido del mes.
     """
+    dias = leer_dias_de_hoja(hoja, mes_nombre)
+    agregar_disponibilidad_a_dias(dias)
+    return dias
+
+
+def leer_dias_de_hoja(hoja, mes_nombre):
+    """
+    Lee la estructura de días de una hoja (tipo, celda, persona, día de la semana, fecha)
+    sin calcular disponibilidad. Es la parte "estable" que guarda el modelo en memoria.
+    """
     # Mapeo de días de la semana a español
     dias_semana_map = {
         'Lun': 'Lunes', 'Mar': 'Martes', 'Mié': 'Miércoles', 'Miercoles': 'Miércoles',
@@ -378,26 +728,7 @@ def obtener_dias_del_mes_mejorado(hoja, mes_nombre):
     if not mes_num:
         return {}
 
-    # Buscar en toda la hoja (primeras 50 filas y 10 columnas deberían ser suficiente)
-    dias_encontrados = {}  # {dia_num: (row, col)}
-    
-    for row in range(1, 50):
-        for col in range(1, 10):
-            celda = hoja.cell(row=row, column=col)
-            
-            # Detectar número de día
-            if isinstance(celda.value, int) and 1 <= celda.value <= 31:
-                dia_num = celda.value
-                
-                # Validar que sea un día real del mes
-                try:
-                    fecha_dia = date(anio, mes_num, dia_num)
-                except ValueError:
-                    continue
-                
-                # Guardar solo la primera ocurrencia de cada día
-                if dia_num not in dias_encontrados:
-                    dias_encontrados[dia_num] = (row, col)
+    dias_encontrados = obtener_indice_celdas(hoja, mes_nombre)  # {dia_num: (row, col)}
     
     # Procesar cada día encontrado
     for dia_num, (row, col) in dias_encontrados.items():
@@ -441,119 +772,1767 @@ def obtener_dias_del_mes_mejorado(hoja, mes_nombre):
         }
         dia_semana = dias_en_es.get(dia_semana, dia_semana)
         
-        # VERIFICAR DISPONIBILIDAD
-        fecha_str = fecha_dia.strftime("%Y-%m-%d")
-        disponible = persona_disponible(persona_actual, fecha_str) if persona_actual else True
-        motivo_indisponible = None if disponible else get_motivo_indisponibilidad(persona_actual, fecha_str)
-        
         dias[dia_num] = {
             "tipo": tipo_dia,
             "celda_ref": celda_ref,
             "persona": persona_actual,
             "dia_semana": dia_semana,
-            "fecha": fecha_str,
-            "disponible": disponible,
-            "motivo_indisponible": motivo_indisponible
+            "fecha": fecha_dia.strftime("%Y-%m-%d")
         }
     
     return dias
 
 
 # ============================================================================
-# LÓGICA DE SUGERENCIAS
+# ÍNDICE DE CELDAS (día → celda)
 # ============================================================================
+# Para cada hoja se guarda {dia: (fila_numero, columna)}. El índice se valida
+# leyendo solo las celdas indexadas (O(días)); si la estructura de la hoja cambió
+# se prueba el layout del generador y, como último recurso, el escaneo de la grilla.
+
+_indices_celdas = None  # {mes: {dia: (row, col)}}, espejo de INDICE_CELDAS_FILE
 
-def sugerir_persona_para_dia_mejorado(wb, mes, dia_num, excluir=[]):
+
+def indice_celdas_esperado(mes_nombre):
     """
-    Sugiere la mejor persona para un día considerando SOLO personas activas.
-    
-    CAMBIO CLAVE: Solo considera personas que estén disponibles en esa fecha específica.
+    Índice que produce generar_calendario_guardias_2026: encabezados en la fila 1,
+    números de día en las filas pares (2, 4, 6...) y columna = día de la semana.
     """
-    if mes not in MAP_MESES:
-        return None
+    mes_num = MAP_MESES.get(mes_nombre)
+    if not mes_num:
+        return {}
     
-    mes_num = MAP_MESES[mes]
-    anio = 2026
+    indice = {}
+    d = date(2026, mes_num, 1)
+    semana = 0
+    while d.month == mes_num:
+        indice[d.day] = (2 + 2 * semana, d.weekday() + 1)
+        if d.weekday() == 6:
+            semana += 1
+        d += timedelta(days=1)
+    return indice
+
+
+def escanear_indice_celdas(hoja, mes_nombre):
+    """Búsqueda heurística de números de día en la grilla (para archivos editados a mano)"""
+    mes_num = MAP_MESES.get(mes_nombre)
+    if not mes_num:
+        return {}
     
-    try:
-        fecha = date(anio, mes_num, dia_num)
-        fecha_str = fecha.strftime("%Y-%m-%d")
-    except ValueError:
-        return None
+    dias_encontrados = {}
     
-    # OBTENER SOLO PERSONAS ACTIVAS EN ESA FECHA ESPECÍFICA
-    personas_disponibles = obtener_personas_activas(fecha_str)
+    # Buscar en toda la hoja (primeras 50 filas y 10 columnas deberían ser suficiente)
+    for row in range(1, 50):
+        for col in range(1, 10):
+            celda = hoja.cell(row=row, column=col)
+            
+            # Detectar número de día
+            if isinstance(celda.value, int) and 1 <= celda.value <= 31:
+                dia_num = celda.value
+                
+                # Validar que sea un día real del mes
+                try:
+                    date(2026, mes_num, dia_num)
+                except ValueError:
+                    continue
+                
+                # Guardar solo la primera ocurrencia de cada día
+                if dia_num not in dias_encontrados:
+                    dias_encontrados[dia_num] = (row, col)
     
-    # Excluir las personas que ya tienen guardia ese día o están en la lista de exclusión
-    personas_disponibles = [p for p in personas_disponibles if p not in excluir]
+    return dias_encontrados
+
+
+def indice_celdas_valido(hoja, mes_nombre, indice):
+    """True si el índice cubre todo el mes y cada celda indexada contiene su número de día"""
+    mes_num = MAP_MESES.get(mes_nombre)
+    if not indice or not mes_num:
+        return False
     
-    if not personas_disponibles:
-        return None
+    siguiente = date(2026, mes_num % 12 + 1, 1) if mes_num < 12 else date(2027, 1, 1)
+    if len(indice) != (siguiente - timedelta(days=1)).day:
+        return False
     
-    # Contar guardias hasta el mes anterior
-    contador = defaultdict(int)
+    return all(hoja.cell(row=row, column=col).value == dia for dia, (row, col) in indice.items())
+
+
+def cargar_indices_celdas():
+    """Carga el índice persistido (una sola vez por proceso)"""
+    global _indices_celdas
+    if _indices_celdas is not None:
+        return _indices_celdas
     
-    for persona in personas_disponibles:
-        contador[persona] = 0
+    _indices_celdas = {}
+    if os.path.exists(INDICE_CELDAS_FILE):
+        try:
+            with open(INDICE_CELDAS_FILE, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            _indices_celdas = {
+                mes: {int(dia): tuple(pos) for dia, pos in indice.items()}
+                for mes, indice in datos.items()
+            }
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ Índice de celdas inválido, se reconstruye: {e}")
+    return _indices_celdas
+
+
+def guardar_indices_celdas():
+    """Persiste el índice de celdas"""
+    datos = {
+        mes: {str(dia): list(pos) for dia, pos in sorted(indice.items())}
+        for mes, indice in _indices_celdas.items()
+    }
+    with open(INDICE_CELDAS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False)
+
+
+def obtener_indice_celdas(hoja, mes_nombre):
+    """
+    Retorna {dia: (row, col)} de la celda con el número de cada día.
+    Solo reconstruye (y vuelve a persistir) el índice si la hoja cambió de estructura.
+    """
+    indices = cargar_indices_celdas()
+    indice = indices.get(mes_nombre)
     
-    # Contar guardias en meses anteriores
-    idx_mes_actual = MESES.index(mes)
-    for mes_previo in MESES[:idx_mes_actual]:
-        if mes_previo not in wb.sheetnames:
-            continue
-        
-        hoja_previo = wb[mes_previo]
-        dias_previos = obtener_dias_del_mes_mejorado(hoja_previo, mes_previo)
-        
-        for info in dias_previos.values():
-            if info.get('persona') in contador:
-                contador[info['persona']] += 1
+    if indice_celdas_valido(hoja, mes_nombre, indice):
+        return indice
     
-    # Contar guardias en el mes actual (días anteriores)
-    if mes in wb.sheetnames:
-        hoja = wb[mes]
-        dias_mes = obtener_dias_del_mes_mejorado(hoja, mes)
-        
-        for dia, info in dias_mes.items():
-            if dia < dia_num and info.get('persona') in contador:
-                contador[info['persona']] += 1
+    indice = indice_celdas_esperado(mes_nombre)
+    if not indice_celdas_valido(hoja, mes_nombre, indice):
+        print(f"🔎 Hoja '{mes_nombre}' con estructura no estándar, escaneando grilla...")
+        indice = escanear_indice_celdas(hoja, mes_nombre)
     
-    # Retornar la persona con menos guardias
-    if contador:
-        persona_sugerida = min(contador.items(), key=lambda x: x[1])[0]
-        return persona_sugerida
+    if indices.get(mes_nombre) != indice:
+        indices[mes_nombre] = indice
+        try:
+            guardar_indices_celdas()
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar el índice de celdas: {e}")
     
-    return None
+    return indice
+
+
+def agregar_disponibilidad_a_dias(dias):
+    """Agrega a cada día los campos 'disponible' y 'motivo_indisponible' (in-place)"""
+    for info in dias.values():
+        persona_actual = info.get('persona')
+        fecha_str = info['fecha']
+        disponible = persona_disponible(persona_actual, fecha_str) if persona_actual else True
+        info['disponible'] = disponible
+        info['motivo_indisponible'] = None if disponible else get_motivo_indisponibilidad(persona_actual, fecha_str)
+    return dias
 
 
 # ============================================================================
-# CÁLCULO DE DISTRIBUCIÓN
+# MODELO DE CALENDARIO EN MEMORIA
 # ============================================================================
+# El calendario se lee una sola vez del almacenamiento y queda en memoria
+# ({mes: {dia: info}}). Las lecturas se sirven desde acá; el almacenamiento solo
+# se toca para persistir escrituras. Si cambia por fuera (otro worker, edición
+# manual del Excel) se detecta por su firma y el modelo se recarga.
+
+_modelo_calendario = {
+    "meses": {},     # {mes: {dia: {tipo, celda_ref, persona, dia_semana, fecha}}}
+    "hojas": [],     # Hojas del Excel que son meses válidos (en orden del archivo)
+    "firma": None    # Firma del almacenamiento al momento de cargarlo
+}
+_modelo_lock = threading.RLock()
 
-def calcular_distribucion_planificada_mejorada(wb, solo_activos=True):
+
+def firma_archivo(ruta):
+    """Retorna (mtime_ns, tamaño) del archivo o None si no existe"""
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def cargar_modelo_calendario():
+    """Lee el calendario completo del almacenamiento y reconstruye el modelo en memoria"""
+    with _modelo_lock:
+        firma = almacenamiento().firma_calendario()
+        if firma is None:
+            _modelo_calendario.update({"meses": {}, "hojas": [], "firma": None})
+            _contadores_guardias["valido"] = False
+            _indice_conflictos["valido"] = False
+            return
+        
+        hojas, meses, firma = almacenamiento().leer_calendario()
+        _modelo_calendario.update({"meses": meses, "hojas": hojas, "firma": firma})
+        _contadores_guardias["valido"] = False
+        _indice_conflictos["valido"] = False
+        print(f"📋 Modelo de calendario cargado ({len(hojas)} meses)")
+
+
+def asegurar_modelo_calendario():
+    """Recarga el modelo si nunca se cargó o si el calendario cambió desde la última lectura"""
+    with _modelo_lock:
+        firma_modelo = _modelo_calendario["firma"]
+        firma_actual = almacenamiento().firma_calendario()
+        if firma_modelo == firma_actual:
+            return
+        
+        # Si solo se agregaron cambios al journal alcanza con aplicarlos
+        cambios = None
+        if firma_modelo is not None and firma_actual is not None:
+            cambios = almacenamiento().cambios_calendario_desde(firma_modelo, firma_actual)
+        if cambios is None:
+            cargar_modelo_calendario()
+            return
+        
+        for mes, dias in cambios:
+            dias_modelo = _modelo_calendario["meses"].get(mes, {})
+            for dia, persona in dias.items():
+                if dia in dias_modelo:
+                    asignar_en_modelo(dias_modelo[dia], persona)
+        _modelo_calendario["firma"] = firma_actual
+
+
+def meses_en_calendario():
+    """Lista de meses presentes en el calendario"""
+    asegurar_modelo_calendario()
+    return list(_modelo_calendario["hojas"])
+
+
+def obtener_dias_mes(mes, con_disponibilidad=True):
     """
-    Calcula la distribución planificada de guardias por mes.
+    Días de un mes desde el modelo en memoria (misma estructura que
+    obtener_dias_del_mes_mejorado). Retorna None si el mes no está en el calendario.
+    
+    La copia que se retorna puede modificarse libremente.
     """
-    distribucion = {}
-    acumulado_real = defaultdict(int)
-    acumulado_ideal = defaultdict(float)
+    with _modelo_lock:
+        asegurar_modelo_calendario()
+        dias_modelo = _modelo_calendario["meses"].get(mes)
+        if dias_modelo is None:
+            return None
+        dias = {dia: dict(info) for dia, info in dias_modelo.items()}
     
-    # Determinar qué personas considerar
-    if solo_activos:
-        personas_considerar = obtener_personas_activas()
-    else:
-        personas_considerar = PERSONAS.copy()
+    if con_disponibilidad:
+        agregar_disponibilidad_a_dias(dias)
+    return dias
+
+
+class ConflictoAsignacion(Exception):
+    """Un día no tiene la asignación esperada: otro usuario o proceso lo modificó antes"""
     
-    for mes in MESES:
-        if mes not in wb.sheetnames:
-            continue
+    def __init__(self, mes, dia, esperado, actual):
+        super().__init__(
+            f"El día {dia} de {mes} cambió: se esperaba {esperado or 'vacío'} y tiene {actual or 'vacío'}"
+        )
+        self.mes = mes
+        self.dia = dia
+        self.esperado = esperado
+        self.actual = actual
+    
+    def respuesta(self):
+        """Cuerpo JSON para responder 409"""
+        return {
+            "error": "conflicto",
+            "mensaje": f"⚠️ {self}. Recargá el mes e intentá de nuevo.",
+            "mes": self.mes,
+            "dia": self.dia,
+            "esperado": self.esperado,
+            "actual": self.actual
+        }
+
+
+def guardar_asignaciones(mes, cambios, esperado=None):
+    """
+    Persiste cambios de asignación de un mes y actualiza el modelo.
+    
+    Args:
+        mes: Nombre del mes
+        cambios: {dia: persona o None para vaciar}
+        esperado: {dia: persona o None} que debe tener cada día para aplicar los
+                  cambios (compare-and-set). Si alguno difiere se lanza ConflictoAsignacion
+                  y no se escribe nada.
+    """
+    guardar_asignaciones_lote({mes: cambios}, {mes: esperado} if esperado else None)
+
+
+def guardar_asignaciones_lote(cambios_por_mes, esperado_por_mes=None):
+    """
+    Persiste cambios de asignación de uno o varios meses de forma atómica (se
+    escriben todos o ninguno) y actualiza el modelo.
+    
+    La escritura se hace con el bloqueo de cada mes tomado (entre procesos, en orden
+    alfabético para no trabarse), así que escrituras a meses distintos avanzan en
+    paralelo y las del mismo mes se serializan.
+    
+    Args:
+        cambios_por_mes: {mes: {dia: persona o None para vaciar}}
+        esperado_por_mes: {mes: {dia: persona o None}} para compare-and-set
+                          (ver guardar_asignaciones)
+    """
+    with ExitStack() as bloqueos:
+        for mes in sorted(cambios_por_mes):
+            bloqueos.enter_context(bloqueo_entre_procesos(f"mes_{mes}"))
+        
+        with _modelo_lock:
+            # Releer si otro proceso escribió desde la última lectura
+            asegurar_modelo_calendario()
+            dias_por_mes = {mes: _modelo_calendario["meses"][mes] for mes in cambios_por_mes}
+            for mes, esperado in (esperado_por_mes or {}).items():
+                for dia, persona_esperada in (esperado or {}).items():
+                    actual = dias_por_mes[mes][dia].get('persona')
+                    if actual != persona_esperada:
+                        raise ConflictoAsignacion(mes, dia, persona_esperada, actual)
+        
+        firma_antes, firma_despues = almacenamiento().escribir_asignaciones(cambios_por_mes, dias_por_mes)
+        marcar_trabajo_guardado()
+        
+        with _modelo_lock:
+            for mes, cambios in cambios_por_mes.items():
+                dias_modelo = _modelo_calendario["meses"][mes]
+                for dia, persona in cambios.items():
+                    asignar_en_modelo(dias_modelo[dia], persona)
+            # Si nadie más escribió entre medio el modelo queda al día; si no, se recarga en la próxima lectura
+            if _modelo_calendario["firma"] == firma_antes:
+                _modelo_calendario["firma"] = firma_despues
+
+
+def leer_calendario_excel():
+    """
+    Lee todas las hojas de meses del Excel y le aplica el journal pendiente:
+    (hojas, {mes: {dia: info}}, firma)
+    
+    Si el escritor vuelca el journal mientras se lee el Excel, se reintenta.
+    """
+    while True:
+        with bloqueo_entre_procesos("calendario_journal"):
+            firma_excel = firma_archivo(EXCEL_FILE)
+            entradas, tamano = leer_journal()
         
-        hoja = wb[mes]
-        dias_mes = obtener_dias_del_mes_mejorado(hoja, mes)
+        with LibroSoloLectura(EXCEL_FILE) as libro:
+            hojas = [hoja for hoja in libro.sheetnames if hoja in MESES]
+            meses = {mes: leer_dias_de_hoja(libro[mes], mes) for mes in hojas}
         
-        # Contar guardias asignadas en el mes
-        guardias_mes = defaultdict(int)
-        for info in dias_mes.values():
+        if firma_archivo(EXCEL_FILE) == firma_excel:
+            break
+    
+    # Las entradas son valores absolutos: reaplicar una que ya está en el Excel no cambia nada
+    for entrada in entradas:
+        for mes, cambios in entrada["meses"].items():
+            dias_mes = meses.get(mes, {})
+            for dia, (celda_ref, persona) in cambios.items():
+                if int(dia) in dias_mes:
+                    dias_mes[int(dia)]['persona'] = persona
+    
+    return hojas, meses, (firma_excel, tamano)
+
+
+CeldaValor = namedtuple('CeldaValor', 'value')
+
+
+class HojaValores:
+    """Grilla de valores de una hoja, con el mismo hoja.cell(row, column).value que usan los parsers"""
+    
+    def __init__(self, filas):
+        self.filas = filas
+    
+    def cell(self, row, column):
+        try:
+            return CeldaValor(self.filas[row - 1][column - 1])
+        except IndexError:
+            return CeldaValor(None)
+
+
+class LibroSoloLectura:
+    """
+    Excel abierto en modo solo lectura y solo valores (sin estilos). Cada hoja se
+    lee recién cuando se pide y queda en memoria como grilla de valores, así que
+    leer un mes o solo los nombres de las hojas no procesa el libro entero.
+    """
+    
+    def __init__(self, ruta):
+        self.wb = load_workbook(ruta, read_only=True, data_only=True)
+        self._hojas = {}
+    
+    @property
+    def sheetnames(self):
+        return self.wb.sheetnames
+    
+    def __getitem__(self, nombre):
+        if nombre not in self._hojas:
+            ws = self.wb[nombre]
+            ws.reset_dimensions()  # No confiar en la dimensión guardada (archivos editados a mano)
+            self._hojas[nombre] = HojaValores(list(ws.iter_rows(values_only=True)))
+        return self._hojas[nombre]
+    
+    def close(self):
+        self.wb.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def guardar_excel_atomico(wb):
+    """Guarda en un temporal y lo reemplaza, para que nadie lea un Excel a medio escribir"""
+    temporal = EXCEL_FILE + ".tmp"
+    wb.save(temporal)
+    os.replace(temporal, EXCEL_FILE)
+
+
+# ============================================================================
+# JOURNAL Y ESCRITOR DEL EXCEL
+# ============================================================================
+# Guardar el Excel reserializa las 12 hojas, así que las asignaciones no lo
+# guardan directamente: cada cambio se agrega al journal (una línea JSON con
+# fsync, antes de responder) y el hilo escritor vuelca al Excel todo lo
+# acumulado en un solo guardado. El estado real es Excel + journal: las
+# lecturas (y cualquier otro worker) aplican el journal encima del Excel, y al
+# arrancar se vuelca lo que haya quedado de una caída.
+#
+# Volcar cambia la firma del Excel sin cambiar el calendario. VOLCADOS_FILE
+# guarda, por cada volcado reciente, las firmas del Excel antes/después y el
+# tramo del journal que pasó al Excel; un modelo cargado antes se pone al día
+# con esos tramos y el journal nuevo (cambios_calendario_desde) sin releer las
+# 12 hojas.
+#
+# Orden de bloqueos: "calendario_excel" (volcado) y adentro "calendario_journal".
+
+_escritor_excel = {
+    "hilo": None,
+    "evento": threading.Event()   # Hay cambios en el journal para volcar
+}
+_escritor_excel_lock = threading.Lock()
+
+
+def tamano_journal():
+    """Tamaño en bytes del journal (0 si no existe)"""
+    try:
+        return os.path.getsize(JOURNAL_FILE)
+    except OSError:
+        return 0
+
+
+def leer_journal(desde=0):
+    """
+    Lee las entradas completas del journal a partir del offset `desde`.
+    Una última línea sin salto (escritura cortada por una caída) se ignora.
+    
+    Returns:
+        tuple: (entradas, offset donde termina la última entrada completa)
+    """
+    try:
+        with open(JOURNAL_FILE, 'rb') as f:
+            f.seek(desde)
+            datos = f.read()
+    except FileNotFoundError:
+        return [], 0
+    
+    completas = datos[:datos.rfind(b'\n') + 1]
+    entradas = [json.loads(linea) for linea in completas.splitlines() if linea.strip()]
+    return entradas, desde + len(completas)
+
+
+def leer_volcados():
+    """Volcados recientes [{excel_antes, excel_despues, volcado, journal}], el último al final"""
+    try:
+        with open(VOLCADOS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def registrar_en_journal(cambios_por_mes, dias_por_mes):
+    """
+    Agrega cambios de asignaciones (de uno o varios meses) al journal como una
+    sola línea, así que se aplican todos o ninguno, y la fuerza a disco.
+    
+    Returns:
+        tuple: (firma antes, firma después) del calendario
+    """
+    entrada = {
+        "meses": {
+            mes: {str(dia): [dias_por_mes[mes][dia]['celda_ref'], persona] for dia, persona in cambios.items()}
+            for mes, cambios in cambios_por_mes.items()
+        }
+    }
+    linea = (json.dumps(entrada, ensure_ascii=False) + "\n").encode('utf-8')
+    
+    with bloqueo_entre_procesos("calendario_journal"):
+        firma_excel = firma_archivo(EXCEL_FILE)
+        with open(JOURNAL_FILE, 'a+b') as f:
+            tamano = f.seek(0, os.SEEK_END)
+            # Descartar una línea cortada por una caída antes de seguir agregando
+            _, completo = leer_journal()
+            if completo != tamano:
+                f.truncate(completo)
+                tamano = completo
+            f.write(linea)
+            f.flush()
+            os.fsync(f.fileno())
+        firma_antes = (firma_excel, tamano)
+        firma_despues = (firma_excel, tamano + len(linea))
+    
+    iniciar_escritor_excel()
+    _escritor_excel["evento"].set()
+    return firma_antes, firma_despues
+
+
+def volcar_journal_excel():
+    """
+    Aplica al Excel todas las entradas del journal en un solo guardado y las
+    quita del journal. Retorna la cantidad de entradas volcadas.
+    """
+    with bloqueo_entre_procesos("calendario_excel"):
+        with bloqueo_entre_procesos("calendario_journal"):
+            entradas, volcado = leer_journal()
+        if not entradas:
+            return 0
+        
+        firma_excel_antes = firma_archivo(EXCEL_FILE)
+        wb = load_workbook(EXCEL_FILE)
+        try:
+            for entrada in entradas:
+                for mes, cambios in entrada["meses"].items():
+                    hoja = wb[mes]
+                    for celda_ref, persona in cambios.values():
+                        hoja[celda_ref] = persona
+            guardar_excel_atomico(wb)
+        finally:
+            wb.close()
+        firma_excel_despues = firma_archivo(EXCEL_FILE)
+        
+        # Sacar del journal lo volcado; lo que llegó mientras tanto queda para el próximo volcado
+        with bloqueo_entre_procesos("calendario_journal"):
+            with open(JOURNAL_FILE, 'rb') as f:
+                datos = f.read()
+            resto = datos[volcado:]
+            temporal = JOURNAL_FILE + ".tmp"
+            with open(temporal, 'wb') as f:
+                f.write(resto)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, JOURNAL_FILE)
+            
+            # Recién ahora (journal ya recortado) los offsets del journal nuevo son válidos
+            volcados = leer_volcados()[-(VOLCADOS_GUARDADOS - 1):] + [{
+                "excel_antes": firma_excel_antes,
+                "excel_despues": firma_excel_despues,
+                "volcado": volcado,
+                "journal": datos[:volcado].decode('utf-8')
+            }]
+            temporal = VOLCADOS_FILE + ".tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(volcados, f)
+            os.replace(temporal, VOLCADOS_FILE)
+    
+    print(f"💾 Excel guardado ({len(entradas)} cambios agrupados)")
+    return len(entradas)
+
+
+def _bucle_escritor_excel():
+    """Hilo escritor: espera cambios, deja pasar INTERVALO_GUARDADO para agruparlos y vuelca"""
+    evento = _escritor_excel["evento"]
+    while True:
+        evento.wait()
+        time.sleep(INTERVALO_GUARDADO)
+        evento.clear()
+        try:
+            volcar_journal_excel()
+        except Exception:
+            # Los cambios siguen en el journal: se reintenta en la próxima vuelta
+            traceback.print_exc()
+            evento.set()
+
+
+def iniciar_escritor_excel():
+    """Arranca el hilo escritor de este proceso si todavía no corre"""
+    with _escritor_excel_lock:
+        hilo = _escritor_excel["hilo"]
+        if hilo is not None and hilo.is_alive():
+            return
+        hilo = threading.Thread(target=_bucle_escritor_excel, name="escritor-excel", daemon=True)
+        hilo.start()
+        _escritor_excel["hilo"] = hilo
+
+
+@atexit.register
+def _volcar_al_salir():
+    """Al cerrar el proceso se vuelca lo pendiente (si no, queda en el journal para el próximo arranque)"""
+    if _escritor_excel["hilo"] is not None:
+        try:
+            volcar_journal_excel()
+        except Exception:
+            traceback.print_exc()
+
+
+# ============================================================================
+# CONTADORES DE GUARDIAS POR PERSONA
+# ============================================================================
+# Para cada persona, árboles de Fenwick indexados por día del año con sus
+# guardias (total y por tipo) y sus puntos. "Guardias antes de la fecha D" es
+# una suma de prefijo en O(log n), sin recorrer los meses anteriores. Se
+# mantienen al día con cada cambio del modelo (asignar_en_modelo) y se
+# reconstruyen, la próxima vez que se consultan, si el modelo se recarga entero.
+
+CAMPOS_CONTADOR = ("total", "habil", "vispera", "feriado", "puntos")
+
+_contadores_guardias = {
+    "valido": False,
+    "personas": {}   # {persona: {campo: ArbolFenwick}}
+}
+
+
+class ArbolFenwick:
+    """Sumas de prefijo con actualización puntual, ambas en O(log n)"""
+    
+    def __init__(self, tamano):
+        self.arbol = [0] * (tamano + 1)
+    
+    def sumar(self, posicion, valor):
+        i = posicion + 1
+        while i < len(self.arbol):
+            self.arbol[i] += valor
+            i += i & -i
+    
+    def prefijo(self, posicion):
+        """Suma de las posiciones [0, posicion)"""
+        total = 0
+        i = min(posicion, len(self.arbol) - 1)
+        while i > 0:
+            total += self.arbol[i]
+            i -= i & -i
+        return total
+
+
+def _sumar_a_contadores(persona, info, signo):
+    """Suma (o resta) la guardia del día info a los contadores de la persona"""
+    arboles = _contadores_guardias["personas"].get(persona)
+    idx = _indice_dia_anio(info['fecha'])
+    if arboles is None or idx is None:
+        return
+    arboles["total"].sumar(idx, signo)
+    arboles[info['tipo']].sumar(idx, signo)
+    arboles["puntos"].sumar(idx, signo * PUNTOS_POR_TIPO[info['tipo']])
+
+
+def asignar_en_modelo(info, persona):
+    """Cambia la persona de un día del modelo manteniendo contadores y conflictos al día"""
+    anterior = info.get('persona')
+    if anterior == persona:
+        return
+    if _contadores_guardias["valido"]:
+        if anterior:
+            _sumar_a_contadores(anterior, info, -1)
+        if persona:
+            _sumar_a_contadores(persona, info, 1)
+    if _indice_conflictos["valido"]:
+        _revisar_conflicto(info, persona)
+    info['persona'] = persona
+
+
+def _reconstruir_contadores():
+    """Arma los contadores desde cero recorriendo el modelo una vez"""
+    _contadores_guardias["personas"] = {
+        persona: {campo: ArbolFenwick(DIAS_ANIO) for campo in CAMPOS_CONTADOR}
+        for persona in PERSONAS
+    }
+    for dias in _modelo_calendario["meses"].values():
+        for info in dias.values():
+            if info.get('persona'):
+                _sumar_a_contadores(info['persona'], info, 1)
+    _contadores_guardias["valido"] = True
+
+
+def guardias_antes_de(fecha, personas=None):
+    """
+    Guardias de cada persona en los días anteriores a fecha (sin incluirla).
+    
+    Returns:
+        dict: {persona: {"total", "habil", "vispera", "feriado", "puntos"}}
+    """
+    idx = _indice_dia_anio(fecha)
+    if idx is None:
+        idx = DIAS_ANIO if _fecha_a_date(fecha) >= INICIO_ANIO else 0
+    
+    with _modelo_lock:
+        asegurar_modelo_calendario()
+        if not _contadores_guardias["valido"]:
+            _reconstruir_contadores()
+        
+        resultado = {}
+        for persona in personas if personas is not None else PERSONAS:
+            arboles = _contadores_guardias["personas"].get(persona)
+            resultado[persona] = {
+                campo: (arboles[campo].prefijo(idx) if arboles else 0)
+                for campo in CAMPOS_CONTADOR
+            }
+        return resultado
+
+
+# ============================================================================
+# ÍNDICE DE CONFLICTOS DEL AÑO
+# ============================================================================
+# Días del año con alguien asignado que ese día no está disponible, con
+# cuentas por mes y por persona. Se mantiene con cada cambio del modelo
+# (asignar_en_modelo mira solo ese día) y, cuando cambia la disponibilidad, al
+# consultarlo se revisan solo las personas cuyas ventanas cambiaron y, de esas,
+# solo los días que cambiaron de estado. Si el modelo se recarga entero se
+# reconstruye la próxima vez que se consulta.
+
+_indice_conflictos = {
+    "valido": False,
+    "matriz": None,               # Matriz de disponibilidad con la que se calculó
+    "datos": None,                # Ventanas con las que se calculó
+    "dias": {},                   # {dia_del_anio: persona}
+    "por_mes": defaultdict(int),
+    "por_persona": defaultdict(int)
+}
+
+
+def _marcar_conflicto(idx, persona):
+    """Deja el día idx como conflicto de persona (o sin conflicto si None)"""
+    dias = _indice_conflictos["dias"]
+    mes = MESES[(INICIO_ANIO + timedelta(days=idx)).month - 1]
+    anterior = dias.pop(idx, None)
+    if anterior:
+        _indice_conflictos["por_mes"][mes] -= 1
+        _indice_conflictos["por_persona"][anterior] -= 1
+    if persona:
+        dias[idx] = persona
+        _indice_conflictos["por_mes"][mes] += 1
+        _indice_conflictos["por_persona"][persona] += 1
+
+
+def _revisar_conflicto(info, persona):
+    """Recalcula el conflicto del día de info si la persona asignada pasa a ser `persona`"""
+    idx = _indice_dia_anio(info['fecha'])
+    if idx is None:
+        return
+    columna = PERSONA_INDICE.get(persona)
+    en_conflicto = columna is not None and not _indice_conflictos["matriz"][idx][columna]
+    _marcar_conflicto(idx, persona if en_conflicto else None)
+
+
+def _reconstruir_conflictos():
+    """Arma el índice desde cero recorriendo el modelo una vez"""
+    motor = motor_disponibilidad()
+    _indice_conflictos.update({
+        "matriz": motor["matriz"],
+        "datos": motor["datos"],
+        "dias": {},
+        "por_mes": defaultdict(int),
+        "por_persona": defaultdict(int)
+    })
+    for dias in _modelo_calendario["meses"].values():
+        for info in dias.values():
+            if info.get('persona'):
+                _revisar_conflicto(info, info['persona'])
+    _indice_conflictos["valido"] = True
+
+
+def _sincronizar_conflictos():
+    """Aplica al índice los cambios de disponibilidad desde la última consulta"""
+    motor = motor_disponibilidad()
+    matriz_vieja = _indice_conflictos["matriz"]
+    if motor["matriz"] is matriz_vieja:
+        return
+    
+    datos_viejos = _indice_conflictos["datos"]
+    _indice_conflictos.update({"matriz": motor["matriz"], "datos": motor["datos"]})
+    for persona in PERSONAS:
+        if datos_viejos.get(persona) == motor["datos"].get(persona):
+            continue
+        columna = PERSONA_INDICE[persona]
+        for idx in range(DIAS_ANIO):
+            if matriz_vieja[idx][columna] == motor["matriz"][idx][columna]:
+                continue
+            fecha = INICIO_ANIO + timedelta(days=idx)
+            info = _modelo_calendario["meses"].get(MESES[fecha.month - 1], {}).get(fecha.day)
+            if info and info.get('persona') == persona:
+                _revisar_conflicto(info, persona)
+
+
+def conflictos_del_anio():
+    """
+    Conflictos actuales de todo el año.
+    
+    Returns:
+        dict: conflictos [{mes, dia, fecha, tipo, persona, motivo}] en orden de
+              fecha, por_mes {mes: n} y por_persona {persona: n}
+    """
+    with _modelo_lock:
+        asegurar_modelo_calendario()
+        if not _indice_conflictos["valido"]:
+            _reconstruir_conflictos()
+        else:
+            _sincronizar_conflictos()
+        
+        conflictos = []
+        for idx in sorted(_indice_conflictos["dias"]):
+            persona = _indice_conflictos["dias"][idx]
+            fecha = INICIO_ANIO + timedelta(days=idx)
+            mes = MESES[fecha.month - 1]
+            info = _modelo_calendario["meses"][mes][fecha.day]
+            conflictos.append({
+                "mes": mes,
+                "dia": fecha.day,
+                "fecha": info['fecha'],
+                "tipo": info['tipo'],
+                "persona": persona
+            })
+        por_mes = {mes: n for mes, n in _indice_conflictos["por_mes"].items() if n}
+        por_persona = {persona: n for persona, n in _indice_conflictos["por_persona"].items() if n}
+    
+    for conflicto in conflictos:
+        conflicto["motivo"] = get_motivo_indisponibilidad(conflicto["persona"], conflicto["fecha"])
+    return {"conflictos": conflictos, "por_mes": por_mes, "por_persona": por_persona}
+
+
+# ============================================================================
+# LÓGICA DE SUGERENCIAS
+# ============================================================================
+
+def sugerir_persona_para_dia_mejorado(mes, dia_num, excluir=[]):
+    """
+    Sugiere la mejor persona para un día considerando SOLO personas activas.
+    
+    CAMBIO CLAVE: Solo considera personas que estén disponibles en esa fecha específica.
+    """
+    if mes not in MAP_MESES:
+        return None
+    
+    mes_num = MAP_MESES[mes]
+    anio = 2026
+    
+    try:
+        fecha = date(anio, mes_num, dia_num)
+        fecha_str = fecha.strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+    
+    # OBTENER SOLO PERSONAS ACTIVAS EN ESA FECHA ESPECÍFICA
+    personas_disponibles = obtener_personas_activas(fecha_str)
+    
+    # Excluir las personas que ya tienen guardia ese día o están en la lista de exclusión
+    personas_disponibles = [p for p in personas_disponibles if p not in excluir]
+    
+    if not personas_disponibles:
+        return None
+    
+    # Guardias de cada persona antes de ese día (meses anteriores y días previos del mes)
+    previas = guardias_antes_de(fecha, personas_disponibles)
+    contador = {persona: previas[persona]["total"] for persona in personas_disponibles}
+    
+    # Retornar la persona con menos guardias
+    if contador:
+        persona_sugerida = min(contador.items(), key=lambda x: x[1])[0]
+        return persona_sugerida
+    
+    return None
+
+
+# ============================================================================
+# CÁLCULO DE DISTRIBUCIÓN
+# ============================================================================
+
+# Motor compartido por distribución automática, balanceo, cuotas y el reparto
+# anual. Tres métodos:
+#
+#   "greedy" - los días se recorren del más pesado al más liviano y cada uno va
+#              a la persona disponible con menos (puntos, guardias, orden de
+#              llenado). Las personas están en un heap con esa clave.
+#   "local"  - búsqueda local acotada: parte del greedy de cada tipo de día
+#              (feriado, víspera, hábil) y aplica cadenas de movimientos dentro
+#              del tipo e intercambios entre tipos mientras bajen la suma de
+#              cuadrados de los puntos. No garantiza el óptimo (puede quedar en
+#              un mínimo local). Tiene un tope de tiempo; si no termina, o si no
+#              mejora al greedy, se usa el greedy.
+#   "exacto" - reparto óptimo: minimiza la mayor desviación de puntos respecto
+#              del ideal (promedio final). Busca en forma binaria esa
+#              desviación y decide cada paso con una programación dinámica
+#              exacta sobre clases de días intercambiables (mismo tipo y mismas
+#              personas disponibles). Con el mismo tope de tiempo; si no
+#              termina se usa el greedy. Para un mes termina enseguida; el año
+#              completo puede necesitar un tope mayor.
+#
+# La disponibilidad sale de la matriz precalculada. Modos:
+#   "aplicar"    - redistribuye todo el mes desde cero; un día sin nadie
+#                  disponible va igual a la persona menos cargada
+#   "simular"    - igual, pero nunca se guarda y los días sin nadie disponible
+#                  quedan sin cubrir (DNRD)
+#   "pendientes" - solo llena los días vacíos, partiendo de lo ya asignado
+
+MODOS_PLANIFICACION = ("aplicar", "simular", "pendientes")
+METODOS_PLANIFICACION = ("greedy", "local", "exacto")
+
+
+def conteo_vacio():
+    return {'total': 0, 'puntos': 0.0, 'habil': 0, 'vispera': 0, 'feriado': 0}
+
+
+def _sumar_a_conteo(conteo, persona, tipo, signo=1):
+    datos = conteo[persona]
+    datos['total'] += signo
+    datos[tipo] += signo
+    datos['puntos'] += signo * PUNTOS_POR_TIPO[tipo]
+
+
+def _disponible_planificacion(personas):
+    """Devuelve disponible(persona, fecha) leyendo la matriz del motor de disponibilidad"""
+    matriz = motor_disponibilidad()["matriz"]
+    columnas = {p: PERSONA_INDICE.get(p) for p in personas}
+    
+    def disponible(persona, fecha):
+        idx = _indice_dia_anio(fecha)
+        if idx is None or columnas[persona] is None:
+            return persona_disponible(persona, fecha)
+        return matriz[idx][columnas[persona]]
+    
+    return disponible
+
+
+def _repartir_greedy(pendientes, candidatos, personas, conteo, cubrir_todo):
+    """
+    Reparte los días pendientes (ya ordenados) con el heap de menos cargados.
+    
+    Args:
+        pendientes: [(clave, info)]
+        candidatos: {clave: set(personas disponibles)}
+        cubrir_todo: Si no hay nadie disponible, asignar igual al menos cargado
+    
+    Returns:
+        tuple: (asignaciones {clave: persona}, sin_cubrir [clave])
+    """
+    heap = [
+        (conteo[p]['puntos'], conteo[p]['total'], PERSONA_ORDEN.get(p, 99), p)
+        for p in personas
+    ]
+    heapq.heapify(heap)
+    
+    asignaciones = {}
+    sin_cubrir = []
+    for clave, info in pendientes:
+        # Sacar del heap hasta encontrar a alguien disponible ese día
+        apartados = []
+        elegido = None
+        while heap:
+            entrada = heapq.heappop(heap)
+            if entrada[3] in candidatos[clave]:
+                elegido = entrada
+                break
+            apartados.append(entrada)
+        
+        if elegido is None and apartados and cubrir_todo:
+            # Nadie disponible: el menos cargado de todos
+            elegido = apartados.pop(0)
+        
+        for entrada in apartados:
+            heapq.heappush(heap, entrada)
+        
+        if elegido is None:
+            sin_cubrir.append(clave)
+            continue
+        
+        persona = elegido[3]
+        asignaciones[clave] = persona
+        _sumar_a_conteo(conteo, persona, info['tipo'])
+        heapq.heappush(heap, (conteo[persona]['puntos'], conteo[persona]['total'], elegido[2], persona))
+    
+    return asignaciones, sin_cubrir
+
+
+def _mover_en_cadena(origen, tipo, asignaciones, dias_de, candidatos, conteo):
+    """
+    Busca un camino de aumento para sacarle a `origen` un día de `tipo`: origen
+    cede un día a q1, q1 cede otro del mismo tipo a q2, ... hasta una persona
+    qk que quede por debajo de origen. Como los días intermedios son del mismo
+    tipo, solo cambian los puntos de los extremos.
+    
+    Returns:
+        bool: True si encontró un camino y lo aplicó
+    """
+    peso = PUNTOS_POR_TIPO[tipo]
+    limite = conteo[origen]['puntos'] - peso - 1e-9
+    padre = {origen: None}
+    cola = deque([origen])
+    mejor = None
+    while cola:
+        persona = cola.popleft()
+        for clave in dias_de[persona][tipo]:
+            for siguiente in candidatos[clave]:
+                if siguiente in padre:
+                    continue
+                padre[siguiente] = (persona, clave)
+                if conteo[siguiente]['puntos'] < limite and (
+                        mejor is None or conteo[siguiente]['puntos'] < conteo[mejor]['puntos']):
+                    mejor = siguiente
+                cola.append(siguiente)
+    
+    if mejor is None:
+        return False
+    
+    destino = mejor
+    while padre[destino] is not None:
+        anterior, clave = padre[destino]
+        dias_de[anterior][tipo].discard(clave)
+        dias_de[destino][tipo].add(clave)
+        asignaciones[clave] = destino
+        destino = anterior
+    _sumar_a_conteo(conteo, origen, tipo, -1)
+    _sumar_a_conteo(conteo, mejor, tipo)
+    return True
+
+
+def _intercambiar_tipos(personas, tipos_de, asignaciones, dias_de, candidatos, conteo):
+    """
+    Intercambia un día pesado de una persona con uno más liviano de otra si
+    achica la diferencia entre ambas (sirve cuando un tipo no alcanza a
+    compensar solo, p. ej. alguien no disponible en los feriados).
+    """
+    orden = sorted(personas, key=lambda p: -conteo[p]['puntos'])
+    for a in orden:
+        for b in reversed(orden):
+            diferencia = conteo[a]['puntos'] - conteo[b]['puntos']
+            if diferencia <= 1e-9:
+                break
+            for tipo_a in tipos_de:
+                for tipo_b in tipos_de:
+                    delta = PUNTOS_POR_TIPO[tipo_a] - PUNTOS_POR_TIPO[tipo_b]
+                    if delta <= 0 or delta >= diferencia - 1e-9:
+                        continue
+                    clave_a = next((c for c in dias_de[a][tipo_a] if b in candidatos[c]), None)
+                    if clave_a is None:
+                        continue
+                    clave_b = next((c for c in dias_de[b][tipo_b] if a in candidatos[c]), None)
+                    if clave_b is None:
+                        continue
+                    dias_de[a][tipo_a].discard(clave_a)
+                    dias_de[b][tipo_a].add(clave_a)
+                    dias_de[b][tipo_b].discard(clave_b)
+                    dias_de[a][tipo_b].add(clave_b)
+                    asignaciones[clave_a] = b
+                    asignaciones[clave_b] = a
+                    _sumar_a_conteo(conteo, a, tipo_a, -1)
+                    _sumar_a_conteo(conteo, b, tipo_a)
+                    _sumar_a_conteo(conteo, b, tipo_b, -1)
+                    _sumar_a_conteo(conteo, a, tipo_b)
+                    return True
+    return False
+
+
+def _repartir_local(pendientes, candidatos, personas, conteo, cubrir_todo, fin):
+    """
+    Reparto por búsqueda local sobre la suma de cuadrados de los puntos. Cada
+    tipo de día arranca con el greedy y se mejora con cadenas de movimientos
+    (días → personas disponibles) hasta que ninguna baje el costo; al final se
+    prueban intercambios entre tipos. Puede terminar en un mínimo local.
+    
+    Returns:
+        tuple: (asignaciones, sin_cubrir), o None si se pasó del tiempo `fin`
+    """
+    tipos = sorted({info['tipo'] for _, info in pendientes}, key=lambda t: -PUNTOS_POR_TIPO[t])
+    asignaciones = {}
+    sin_cubrir = []
+    dias_de = {p: {t: set() for t in tipos} for p in personas}
+    
+    for tipo in tipos:
+        # Arranque greedy del tipo y luego cadenas de movimientos mientras mejoren
+        del_tipo = [(clave, info) for clave, info in pendientes if info['tipo'] == tipo]
+        parcial, faltan = _repartir_greedy(del_tipo, candidatos, personas, conteo, cubrir_todo)
+        sin_cubrir.extend(faltan)
+        for clave, persona in parcial.items():
+            asignaciones[clave] = persona
+            dias_de[persona][tipo].add(clave)
+        
+        mejoro = True
+        while mejoro:
+            if time.monotonic() > fin:
+                return None
+            mejoro = False
+            for persona in sorted(personas, key=lambda p: -conteo[p]['puntos']):
+                if _mover_en_cadena(persona, tipo, asignaciones, dias_de, candidatos, conteo):
+                    mejoro = True
+                    break
+    
+    # Con los tres tipos ya repartidos, pulir: mover dentro de cada tipo con los
+    # puntos finales e intercambiar entre tipos, mientras quede tiempo
+    mejoro = True
+    while mejoro and time.monotonic() <= fin:
+        mejoro = any(
+            _mover_en_cadena(persona, tipo, asignaciones, dias_de, candidatos, conteo)
+            for persona in sorted(personas, key=lambda p: -conteo[p]['puntos'])
+            for tipo in tipos
+        ) or _intercambiar_tipos(personas, tipos, asignaciones, dias_de, candidatos, conteo)
+    
+    return asignaciones, sin_cubrir
+
+
+class TiempoAgotado(Exception):
+    """El método "exacto" no terminó dentro de su tope de tiempo (o de combinaciones)"""
+
+
+def _controlar_tiempo(fin):
+    """Corta el método "exacto" si se pasó de `fin` o si se canceló su trabajo"""
+    if time.monotonic() > fin:
+        raise TiempoAgotado()
+    informar_progreso(0.5)
+
+
+def _desplazar_rango(mascara, desde, hasta):
+    """OR de mascara << k para todo k en [desde, hasta] (conjuntos de sumas como bits)"""
+    ancho = hasta - desde + 1
+    extendida, cubierto = mascara, 1
+    while cubierto * 2 <= ancho:
+        extendida |= extendida << cubierto
+        cubierto *= 2
+    return (extendida | (extendida << (ancho - cubierto))) << desde
+
+
+def _reparto_factible(clases, personas, cotas, fin):
+    """
+    Decide de forma exacta si las clases de días se pueden repartir dejando la
+    carga de cada persona dentro de sus cotas, y si se puede devuelve cuántos
+    días de cada clase recibe cada una.
+    
+    Programación dinámica persona por persona sobre lo que queda de cada clase.
+    La clase más numerosa no entra en el estado: como sus días son
+    intercambiables alcanza con saber qué cantidades ya se dieron, y ese
+    conjunto se lleva como bits de un entero.
+    
+    Args:
+        clases: [(peso en medios puntos, cantidad de días, personas disponibles)]
+        cotas: {persona: (mínimo, máximo)} de medios puntos a recibir
+        fin: time.monotonic() límite
+    
+    Returns:
+        dict: {persona: [días por clase]}, o None si no hay reparto
+    
+    Raises:
+        TiempoAgotado: Si se pasa de `fin` o de MAX_OPCIONES_EXACTO
+    """
+    agregada = max(range(len(clases)), key=lambda i: clases[i][1])
+    peso_k, cantidad_k, disponibles_k = clases[agregada]
+    resto = [i for i in range(len(clases)) if i != agregada]
+    
+    # Opciones de cada persona: días de cada clase del resto y rango de días de la agregada
+    opciones = []
+    for persona in personas:
+        minimo, maximo = cotas[persona]
+        propias = [j for j, i in enumerate(resto) if persona in clases[i][2]]
+        lista = []
+        vector = [0] * len(resto)
+        
+        def armar(n, carga):
+            if time.monotonic() > fin:
+                raise TiempoAgotado()
+            if n == len(propias):
+                if persona in disponibles_k:
+                    desde = max(0, -((carga - minimo) // peso_k))
+                    hasta = min(cantidad_k, (maximo - carga) // peso_k)
+                else:
+                    desde, hasta = 0, (0 if carga >= minimo else -1)
+                if desde <= hasta:
+                    if len(lista) >= MAX_OPCIONES_EXACTO:
+                        raise TiempoAgotado()
+                    lista.append((tuple(vector), desde, hasta))
+                return
+            j = propias[n]
+            peso, cantidad, _ = clases[resto[j]]
+            for x in range(min(cantidad, (maximo - carga) // peso) + 1):
+                vector[j] = x
+                armar(n + 1, carga + peso * x)
+            vector[j] = 0
+        
+        _controlar_tiempo(fin)
+        if maximo >= 0:
+            armar(0, 0)
+        if not lista:
+            return None
+        opciones.append(lista)
+    
+    # Lo que todavía pueden recibir las personas que faltan (mínimo y máximo sumados)
+    pendiente_min = [0] * (len(personas) + 1)
+    pendiente_max = [0] * (len(personas) + 1)
+    for idx in reversed(range(len(personas))):
+        minimo, maximo = cotas[personas[idx]]
+        pendiente_min[idx] = pendiente_min[idx + 1] + max(minimo, 0)
+        pendiente_max[idx] = pendiente_max[idx + 1] + maximo
+    
+    capas = [{tuple(clases[i][1] for i in resto): 1}]
+    for idx in range(len(personas)):
+        quedan = set(personas[idx + 1:])
+        siguiente = {}
+        for estado, mascara in capas[-1].items():
+            _controlar_tiempo(fin)
+            for vector, desde, hasta in opciones[idx]:
+                if time.monotonic() > fin:
+                    raise TiempoAgotado()
+                if any(x > r for x, r in zip(vector, estado)):
+                    continue
+                nuevo = tuple(r - x for r, x in zip(estado, vector))
+                siguiente[nuevo] = siguiente.get(nuevo, 0) | _desplazar_rango(mascara, desde, hasta)
+        
+        # Podar: lo que queda tiene que entrar en lo que pueden recibir los que faltan
+        for estado in list(siguiente):
+            _controlar_tiempo(fin)
+            if any(r and not (clases[i][2] & quedan) for i, r in zip(resto, estado)):
+                del siguiente[estado]
+                continue
+            carga = sum(clases[i][0] * r for i, r in zip(resto, estado))
+            dados_min = max(0, cantidad_k - (pendiente_max[idx + 1] - carga) // peso_k)
+            dados_max = min(cantidad_k, cantidad_k + (carga - pendiente_min[idx + 1]) // peso_k)
+            mascara = siguiente[estado] & ((1 << (dados_max + 1)) - (1 << dados_min)) if dados_min <= dados_max else 0
+            if mascara:
+                siguiente[estado] = mascara
+            else:
+                del siguiente[estado]
+        if not siguiente:
+            return None
+        capas.append(siguiente)
+    
+    estado = tuple(0 for _ in resto)
+    if not (capas[-1].get(estado, 0) >> cantidad_k) & 1:
+        return None
+    
+    # Reconstruir hacia atrás: para cada persona, una opción que venga de un estado alcanzado
+    reparto = {}
+    dados = cantidad_k
+    for idx in reversed(range(len(personas))):
+        for vector, desde, hasta in opciones[idx]:
+            anterior = tuple(r + x for r, x in zip(estado, vector))
+            mascara = capas[idx].get(anterior, 0)
+            y = next((y for y in range(desde, min(hasta, dados) + 1) if (mascara >> (dados - y)) & 1), None)
+            if y is not None:
+                break
+        cantidades = [0] * len(clases)
+        for i, x in zip(resto, vector):
+            cantidades[i] = x
+        cantidades[agregada] = y
+        reparto[personas[idx]] = cantidades
+        estado, dados = anterior, dados - y
+    return reparto
+
+
+def _repartir_exacto(pendientes, candidatos, personas, conteo, cubrir_todo, fin, referencia):
+    """
+    Reparto óptimo: minimiza la mayor desviación de los puntos finales de cada
+    persona respecto del ideal (el promedio de puntos al final).
+    
+    Los días del mismo tipo con las mismas personas disponibles son
+    intercambiables y se agrupan en clases. Se busca en forma binaria la menor
+    desviación posible entre las que puede tomar alguna persona (partiendo de
+    la del reparto `referencia`, que ya es alcanzable) y cada paso se decide
+    con _reparto_factible, que es exacto.
+    
+    Args:
+        referencia: Conteo final de un reparto conocido (el greedy)
+    
+    Returns:
+        tuple: (asignaciones, sin_cubrir), o None si se pasó del tiempo `fin`
+    """
+    grupos = defaultdict(list)
+    sin_cubrir = []
+    for clave, info in pendientes:
+        disponibles = candidatos[clave] or (set(personas) if cubrir_todo else set())
+        if not disponibles:
+            sin_cubrir.append(clave)
+            continue
+        grupos[(info['tipo'], frozenset(disponibles))].append((info['fecha'], clave))
+    grupos = list(grupos.items())
+    if not grupos:
+        return {}, sin_cubrir
+    clases = [(round(2 * PUNTOS_POR_TIPO[tipo]), len(dias), disponibles) for (tipo, disponibles), dias in grupos]
+    
+    # En medios puntos: carga de partida de cada persona e ideal (promedio al final)
+    base = {p: 2 * conteo[p]['puntos'] for p in personas}
+    ideal = (sum(base.values()) + sum(peso * cantidad for peso, cantidad, _ in clases)) / len(personas)
+    alcance = {p: sum(peso * cantidad for peso, cantidad, disponibles in clases if p in disponibles) for p in personas}
+    
+    def cotas(desviacion):
+        return {
+            p: (math.ceil(ideal - desviacion - base[p] - 1e-6), math.floor(ideal + desviacion - base[p] + 1e-6))
+            for p in personas
+        }
+    
+    techo = max(abs(2 * referencia[p]['puntos'] - ideal) for p in personas)
+    posibles = sorted({
+        round(abs(base[p] + s - ideal), 6)
+        for p in personas for s in range(alcance[p] + 1)
+        if abs(base[p] + s - ideal) < techo - 1e-6
+    }) + [techo]
+    
+    try:
+        inicio, fin_busqueda, reparto = 0, len(posibles) - 1, None
+        while inicio < fin_busqueda:
+            informar_progreso(0.9 - 0.4 * (fin_busqueda - inicio) / len(posibles), "optimizando")
+            medio = (inicio + fin_busqueda) // 2
+            encontrado = _reparto_factible(clases, personas, cotas(posibles[medio]), fin)
+            if encontrado is None:
+                inicio = medio + 1
+            else:
+                fin_busqueda, reparto = medio, encontrado
+        if reparto is None:
+            reparto = _reparto_factible(clases, personas, cotas(posibles[fin_busqueda]), fin)
+    except TiempoAgotado:
+        return None
+    if reparto is None:
+        return None
+    
+    # Días de cada clase a quien corresponde, intercalando personas en orden de fecha
+    asignaciones = {}
+    for i, ((tipo, _), dias) in enumerate(grupos):
+        dias.sort()
+        cupos = {p: reparto[p][i] for p in personas if reparto[p][i]}
+        turno = iter(dias)
+        while cupos:
+            for persona in list(cupos):
+                _, clave = next(turno)
+                asignaciones[clave] = persona
+                _sumar_a_conteo(conteo, persona, tipo)
+                cupos[persona] -= 1
+                if not cupos[persona]:
+                    del cupos[persona]
+    return asignaciones, sin_cubrir
+
+
+def costo_distribucion(conteo, personas):
+    """(diferencia máxima de puntos, suma de cuadrados): menor es más equitativo"""
+    puntos = [conteo[p]['puntos'] for p in personas]
+    if not puntos:
+        return (0.0, 0.0)
+    return (round(max(puntos) - min(puntos), 6), round(sum(x * x for x in puntos), 6))
+
+
+def repartir_dias(pendientes, personas, conteo, cubrir_todo=True, metodo="greedy", tiempo=None):
+    """
+    Reparte días pendientes entre personas partiendo del conteo dado.
+    
+    Args:
+        pendientes: [(clave, info)] con info['fecha'] e info['tipo']
+        personas: Personas que participan
+        conteo: {persona: conteo} inicial (no se modifica)
+        cubrir_todo: Si un día sin nadie disponible va igual al menos cargado
+        metodo: Uno de METODOS_PLANIFICACION
+        tiempo: Tope en segundos para "local" y "exacto" (por defecto TIEMPO_OPTIMIZADOR)
+    
+    Returns:
+        dict: asignaciones {clave: persona}, conteo final, sin_cubrir [clave] y
+              metodo efectivamente usado
+    """
+    if metodo not in METODOS_PLANIFICACION:
+        raise ValueError(f"Método de planificación desconocido: {metodo}")
+    
+    # Más pesados primero (feriado > víspera > hábil), y por fecha dentro de cada tipo
+    pendientes = sorted(pendientes, key=lambda x: (-PUNTOS_POR_TIPO[x[1]['tipo']], x[1]['fecha']))
+    disponible = _disponible_planificacion(personas)
+    candidatos = {
+        clave: {p for p in personas if disponible(p, info['fecha'])}
+        for clave, info in pendientes
+    }
+    
+    conteo_greedy = deepcopy(conteo)
+    asignaciones, sin_cubrir = _repartir_greedy(pendientes, candidatos, personas, conteo_greedy, cubrir_todo)
+    resultado = {"asignaciones": asignaciones, "conteo": conteo_greedy,
+                 "sin_cubrir": sin_cubrir, "metodo": "greedy"}
+    
+    if metodo == "local":
+        informar_progreso(0.5, "optimizando")
+        fin = time.monotonic() + (TIEMPO_OPTIMIZADOR if tiempo is None else tiempo)
+        conteo_local = deepcopy(conteo)
+        local = _repartir_local(pendientes, candidatos, personas, conteo_local, cubrir_todo, fin)
+        if local is None:
+            print("⚠️  Búsqueda local sin terminar en el tiempo disponible, se usa el greedy")
+        elif costo_distribucion(conteo_local, personas) <= costo_distribucion(conteo_greedy, personas):
+            resultado = {"asignaciones": local[0], "conteo": conteo_local,
+                         "sin_cubrir": local[1], "metodo": "local"}
+    elif metodo == "exacto" and personas:
+        informar_progreso(0.5, "optimizando")
+        fin = time.monotonic() + (TIEMPO_OPTIMIZADOR if tiempo is None else tiempo)
+        conteo_exacto = deepcopy(conteo)
+        exacto = _repartir_exacto(pendientes, candidatos, personas, conteo_exacto, cubrir_todo, fin, conteo_greedy)
+        if exacto is None:
+            print("⚠️  Reparto exacto sin terminar en el tiempo disponible, se usa el greedy")
+        else:
+            resultado = {"asignaciones": exacto[0], "conteo": conteo_exacto,
+                         "sin_cubrir": exacto[1], "metodo": "exacto"}
+    
+    return resultado
+
+
+def planificar_guardias(mes, dias, personas, modo, guardar=True, metodo="greedy", tiempo=None):
+    """
+    Calcula (y en los modos "aplicar"/"pendientes", si guardar, persiste) la
+    distribución de un mes.
+    
+    Args:
+        mes: Nombre del mes
+        dias: {dia: info} del mes (obtener_dias_mes)
+        personas: Personas que participan, en orden de llenado
+        modo: Uno de MODOS_PLANIFICACION
+        guardar: False para solo calcular
+        metodo: Uno de METODOS_PLANIFICACION (ver repartir_dias)
+        tiempo: Tope en segundos de "local" y "exacto"
+    
+    Returns:
+        dict: asignaciones {dia: persona} nuevas, conteo {persona: conteo} final
+              (incluye lo ya asignado en modo "pendientes"), sin_cubrir
+              [{dia, fecha, tipo}] (solo en modo "simular") y metodo usado
+    """
+    if modo not in MODOS_PLANIFICACION:
+        raise ValueError(f"Modo de planificación desconocido: {modo}")
+    
+    conteo = {p: conteo_vacio() for p in personas}
+    pendientes = []
+    for dia_num in sorted(dias):
+        info = dias[dia_num]
+        persona = info.get('persona')
+        if modo == "pendientes" and persona in conteo:
+            _sumar_a_conteo(conteo, persona, info['tipo'])
+        else:
+            pendientes.append((dia_num, info))
+    
+    plan = repartir_dias(pendientes, personas, conteo, cubrir_todo=(modo != "simular"),
+                         metodo=metodo, tiempo=tiempo)
+    asignaciones = plan["asignaciones"]
+    
+    if guardar and modo in ("aplicar", "pendientes"):
+        informar_progreso(0.9, "guardando")
+    if guardar and modo == "aplicar":
+        # Se limpia el mes completo y se aplica lo calculado
+        nuevas = {dia_num: asignaciones.get(dia_num) for dia_num in dias}
+        guardar_asignaciones(mes, nuevas, esperado={d: info.get('persona') for d, info in dias.items()})
+    elif guardar and modo == "pendientes" and asignaciones:
+        guardar_asignaciones(mes, asignaciones, esperado={d: dias[d].get('persona') for d in asignaciones})
+    
+    plan["sin_cubrir"] = [
+        {'dia': dia_num, 'fecha': dias[dia_num]['fecha'], 'tipo': dias[dia_num]['tipo']}
+        for dia_num in sorted(plan["sin_cubrir"])
+    ]
+    return plan
+
+
+def planificar_anio(desde_mes, metodo="greedy", tiempo=None, guardar=True):
+    """
+    Reparte en una sola pasada todos los días sin asignar desde `desde_mes`
+    hasta fin de año, arrastrando el saldo de cada persona.
+    
+    El saldo es puntos reales del año (lo ya asignado, en cualquier mes) menos
+    puntos ideales (en cada mes, los puntos de los días que cuentan divididos
+    entre las personas activas ese mes, como en
+    calcular_distribucion_planificada_mejorada). Cuentan solo los días ya
+    asignados y los pendientes que se van a repartir: los días vacíos antes de
+    `desde_mes` no los hizo nadie y no suman al ideal de quienes estaban. El
+    reparto empareja saldos, así quien estuvo de licencia no tiene que
+    "recuperar" y quien hizo de más recibe menos.
+    
+    Returns:
+        dict: meses, asignaciones {mes: {dia: persona}}, personas {persona:
+              {asignados, puntos_reales, puntos_ideales, saldo}}, sin_cubrir y metodo
+    """
+    meses_plan = MESES[MESES.index(desde_mes):]
+    dias_por_mes = {}
+    for mes in MESES:
+        dias = obtener_dias_mes(mes, con_disponibilidad=False)
+        if dias is not None:
+            dias_por_mes[mes] = dias
+    
+    # Puntos reales e ideales del año completo
+    reales = defaultdict(conteo_vacio)
+    ideales = defaultdict(float)
+    pendientes = []
+    for mes, dias in dias_por_mes.items():
+        puntos_mes = 0.0
+        for dia_num, info in dias.items():
+            if info.get('persona'):
+                _sumar_a_conteo(reales, info['persona'], info['tipo'])
+            elif mes in meses_plan:
+                pendientes.append(((mes, dia_num), info))
+            else:
+                continue
+            puntos_mes += PUNTOS_POR_TIPO[info['tipo']]
+        activos = personas_activas_en_dias(dias)
+        for persona in activos:
+            ideales[persona] += puntos_mes / len(activos)
+    
+    informar_progreso(0.2, "año leído")
+    
+    # Participan quienes estén disponibles en algún día pendiente
+    personas = []
+    if pendientes:
+        fechas = [info['fecha'] for _, info in pendientes]
+        personas = sorted(personas_activas_en_rango(min(fechas), max(fechas)),
+                          key=lambda p: PERSONA_ORDEN.get(p, 99))
+    
+    conteo = {}
+    for persona in personas:
+        conteo[persona] = dict(reales[persona])
+        conteo[persona]['puntos'] -= ideales[persona]
+    
+    plan = repartir_dias(pendientes, personas, conteo, metodo=metodo, tiempo=tiempo)
+    
+    asignaciones = defaultdict(dict)
+    for (mes, dia_num), persona in plan["asignaciones"].items():
+        asignaciones[mes][dia_num] = persona
+    
+    if guardar and asignaciones:
+        informar_progreso(0.9, "guardando")
+        guardar_asignaciones_lote(
+            asignaciones,
+            {mes: {dia_num: None for dia_num in cambios} for mes, cambios in asignaciones.items()}
+        )
+    
+    resumen = {}
+    for persona in personas:
+        final = plan["conteo"][persona]
+        resumen[persona] = {
+            'asignados': {tipo: final[tipo] - reales[persona][tipo] for tipo in ('habil', 'vispera', 'feriado', 'total')},
+            'puntos_reales': round(final['puntos'] + ideales[persona], 2),
+            'puntos_ideales': round(ideales[persona], 2),
+            'saldo': round(final['puntos'], 2)
+        }
+    
+    return {
+        "meses": [mes for mes in meses_plan if mes in dias_por_mes],
+        "asignaciones": {mes: asignaciones[mes] for mes in MESES if mes in asignaciones},
+        "personas": resumen,
+        "sin_cubrir": [{'mes': mes, 'dia': dia_num} for mes, dia_num in plan["sin_cubrir"]],
+        "metodo": plan["metodo"]
+    }
+
+
+def rebalancear_mes(dias, personas, tolerancia, protegidos=(), tiempo=None):
+    """
+    Busca pocos cambios sobre lo ya asignado que dejen la diferencia de puntos
+    entre personas dentro de `tolerancia`: mover un día a otra persona o
+    intercambiar dos días de distinto tipo entre dos personas.
+    
+    Búsqueda local con tope de tiempo: en cada paso se aplica el cambio que más
+    baja la suma de cuadrados de los puntos por cada día nuevo que toca. Los
+    días protegidos (auto-asignados) solo se tocan si sin ellos no hay mejora.
+    Al final se deshacen los cambios que no hacen falta para cumplir la tolerancia.
+    
+    Args:
+        dias: {dia: info} del mes
+        personas: Personas que participan (los días de otras no se tocan)
+        tolerancia: Diferencia máxima de puntos buscada
+        protegidos: Días a tocar solo como último recurso
+        tiempo: Tope en segundos (por defecto TIEMPO_OPTIMIZADOR)
+    
+    Returns:
+        dict: cambios {dia: (antes, despues)}, conteo final, alcanzado (bool) y
+              diferencia_inicial
+    """
+    inicio = time.monotonic()
+    tope = TIEMPO_OPTIMIZADOR if tiempo is None else tiempo
+    fin = inicio + tope
+    disponible = _disponible_planificacion(personas)
+    original = {d: info['persona'] for d, info in dias.items() if info.get('persona') in personas}
+    actual = dict(original)
+    candidatos = {d: {p for p in personas if disponible(p, dias[d]['fecha'])} for d in actual}
+    peso = {d: PUNTOS_POR_TIPO[dias[d]['tipo']] for d in actual}
+    
+    conteo = {p: conteo_vacio() for p in personas}
+    for d, persona in actual.items():
+        _sumar_a_conteo(conteo, persona, dias[d]['tipo'])
+    
+    def diferencia():
+        puntos = [conteo[p]['puntos'] for p in personas]
+        return max(puntos) - min(puntos) if puntos else 0.0
+    
+    diferencia_inicial = diferencia()
+    
+    def mover(d, persona):
+        _sumar_a_conteo(conteo, actual[d], dias[d]['tipo'], -1)
+        _sumar_a_conteo(conteo, persona, dias[d]['tipo'])
+        actual[d] = persona
+    
+    def buscar(con_protegidos):
+        """Mejor cambio (días, personas destino) por baja de costo / días nuevos tocados"""
+        def tocados(*ds):
+            nuevos = [d for d in ds if actual[d] == original[d]]
+            if not con_protegidos and any(d in protegidos for d in nuevos):
+                return None
+            return max(len(nuevos), 0.5)
+        
+        mejor, mejor_valor = None, -1e-9
+        for d, a in actual.items():
+            w = peso[d]
+            for b in candidatos[d]:
+                ganancia = 2 * w * (conteo[b]['puntos'] - conteo[a]['puntos'] + w)
+                if b == a or ganancia >= -1e-9:
+                    continue
+                toque = tocados(d)
+                if toque is not None and ganancia / toque < mejor_valor:
+                    mejor, mejor_valor = ((d, b),), ganancia / toque
+        for d1, a in actual.items():
+            for d2, b in actual.items():
+                delta = peso[d1] - peso[d2]
+                if a == b or delta <= 0 or b not in candidatos[d1] or a not in candidatos[d2]:
+                    continue
+                ganancia = 2 * delta * (conteo[b]['puntos'] - conteo[a]['puntos'] + delta)
+                if ganancia >= -1e-9:
+                    continue
+                toque = tocados(d1, d2)
+                if toque is not None and ganancia / toque < mejor_valor:
+                    mejor, mejor_valor = ((d1, b), (d2, a)), ganancia / toque
+        return mejor
+    
+    while diferencia() > tolerancia + 1e-9 and time.monotonic() <= fin:
+        informar_progreso(0.8 * (time.monotonic() - inicio) / tope if tope > 0 else 0, "rebalanceando")
+        cambio = buscar(False) or buscar(True)
+        if cambio is None:
+            break
+        for d, persona in cambio:
+            mover(d, persona)
+    
+    alcanzado = diferencia() <= tolerancia + 1e-9
+    if alcanzado:
+        # Deshacer lo que sobre, empezando por los días protegidos
+        for d in sorted(actual, key=lambda d: (d not in protegidos, d)):
+            if actual[d] == original[d]:
+                continue
+            persona = actual[d]
+            mover(d, original[d])
+            if diferencia() > tolerancia + 1e-9:
+                mover(d, persona)
+    
+    cambios = {d: (original[d], actual[d]) for d in sorted(actual) if actual[d] != original[d]}
+    return {"cambios": cambios, "conteo": conteo, "alcanzado": alcanzado,
+            "diferencia_inicial": diferencia_inicial}
+
+
+def disponibilidad_en_anio(persona):
+    """Columna de la persona en la matriz del año: [bool por día desde INICIO_ANIO]"""
+    return matriz_disponibilidad(INICIO_ANIO, INICIO_ANIO + timedelta(days=DIAS_ANIO - 1), [persona])[1][persona]
+
+
+def conflictos_por_cambio(persona, antes, despues):
+    """
+    Guardias de la persona que pasaron a ser conflicto con un cambio de
+    disponibilidad: solo se miran los días que pasaron de disponible a no
+    disponible (columnas de disponibilidad_en_anio antes y después).
+    
+    Returns:
+        list: [(mes, dia)] con la persona asignada y ahora no disponible
+    """
+    conflictos = []
+    with _modelo_lock:
+        asegurar_modelo_calendario()
+        for idx, (estaba, esta) in enumerate(zip(antes, despues)):
+            if not estaba or esta:
+                continue
+            fecha = INICIO_ANIO + timedelta(days=idx)
+            mes = MESES[fecha.month - 1]
+            info = _modelo_calendario["meses"].get(mes, {}).get(fecha.day)
+            if info and info.get('persona') == persona:
+                conflictos.append((mes, fecha.day))
+    return conflictos
+
+
+def reparar_conflictos(conflictos, aplicar=False, metodo="greedy", tiempo=None):
+    """
+    Propone (y si aplicar, guarda) reemplazos para guardias en conflicto sin
+    recalcular nada más: por cada mes afectado el motor parte del conteo actual
+    del mes (sin los días en conflicto) y reparte solo esos días entre quienes
+    estén disponibles.
+    
+    Args:
+        conflictos: [(mes, dia)]
+    
+    Returns:
+        dict: propuesta [{mes, dia, fecha, tipo, antes, despues}] y
+              sin_reemplazo [{mes, dia, fecha, tipo, antes}] (nadie disponible)
+    """
+    por_mes = defaultdict(list)
+    for mes, dia_num in conflictos:
+        por_mes[mes].append(dia_num)
+    
+    propuesta = []
+    sin_reemplazo = []
+    for mes in MESES:
+        if mes not in por_mes:
+            continue
+        dias = obtener_dias_mes(mes, con_disponibilidad=False)
+        en_conflicto = set(por_mes[mes])
+        personas = sorted(personas_activas_en_dias({d: dias[d] for d in en_conflicto}),
+                          key=lambda p: PERSONA_ORDEN.get(p, 99))
+        
+        conteo = {p: conteo_vacio() for p in personas}
+        for dia_num, info in dias.items():
+            if dia_num not in en_conflicto and info.get('persona') in conteo:
+                _sumar_a_conteo(conteo, info['persona'], info['tipo'])
+        
+        plan = repartir_dias([(d, dias[d]) for d in en_conflicto], personas, conteo,
+                             cubrir_todo=False, metodo=metodo, tiempo=tiempo)
+        for dia_num in sorted(en_conflicto):
+            info = dias[dia_num]
+            item = {"mes": mes, "dia": dia_num, "fecha": info['fecha'], "tipo": info['tipo'],
+                    "antes": info.get('persona')}
+            if dia_num in plan["asignaciones"]:
+                propuesta.append(dict(item, despues=plan["asignaciones"][dia_num]))
+            else:
+                sin_reemplazo.append(item)
+    
+    if aplicar and propuesta:
+        cambios_por_mes = defaultdict(dict)
+        esperado_por_mes = defaultdict(dict)
+        for item in propuesta:
+            cambios_por_mes[item["mes"]][item["dia"]] = item["despues"]
+            esperado_por_mes[item["mes"]][item["dia"]] = item["antes"]
+        guardar_asignaciones_lote(cambios_por_mes, esperado_por_mes)
+        
+        meses = [mes for mes in MESES if mes in cambios_por_mes]
+        registrar_en_historial({
+            "accion": "reparar_conflictos",
+            "mes": meses[0],
+            "meses": meses,
+            "cambios": len(propuesta),
+            "asignaciones": [
+                {"mes": i["mes"], "dia": i["dia"], "antes": i["antes"], "despues": i["despues"]}
+                for i in propuesta
+            ]
+        })
+    
+    return {"propuesta": propuesta, "sin_reemplazo": sin_reemplazo}
+
+
+def parametros_planificacion(data):
+    """
+    Lee método y tope de tiempo del cuerpo JSON o de la query string.
+    
+    Returns:
+        tuple: (metodo, tiempo) - tiempo es None si no se indicó (o no es válido)
+    """
+    metodo = data.get('metodo') or request.args.get('metodo') or "greedy"
+    try:
+        tiempo = float(data.get('tiempo') or request.args.get('tiempo'))
+        tiempo = min(max(tiempo, 0.1), 30.0)
+    except (TypeError, ValueError):
+        tiempo = None
+    return metodo, tiempo
+
+
+def calcular_distribucion_planificada_mejorada(solo_activos=True):
+    """
+    Calcula la distribución planificada de guardias por mes.
+    """
+    distribucion = {}
+    acumulado_real = defaultdict(int)
+    acumulado_ideal = defaultdict(float)
+    
+    # Determinar qué personas considerar
+    if solo_activos:
+        personas_considerar = obtener_personas_activas()
+    else:
+        personas_considerar = PERSONAS.copy()
+    
+    for mes in MESES:
+        dias_mes = obtener_dias_mes(mes, con_disponibilidad=False)
+        if dias_mes is None:
+            continue
+        
+        # Contar guardias asignadas en el mes
+        guardias_mes = defaultdict(int)
+        for info in dias_mes.values():
             persona = info.get('persona')
             if persona:
                 guardias_mes[persona] += 1
@@ -563,11 +2542,7 @@ def calcular_distribucion_planificada_mejorada(wb, solo_activos=True):
         total_dias = len(dias_mes)
         
         # Contar solo personas activas día por día
-        personas_activas_mes = set()
-        for dia_num, info in dias_mes.items():
-            fecha = info.get('fecha')
-            activos_dia = obtener_personas_activas(fecha)
-            personas_activas_mes.update(activos_dia)
+        personas_activas_mes = personas_activas_en_dias(dias_mes)
         
         num_personas_activas = len(personas_activas_mes)
         
@@ -603,39 +2578,903 @@ def calcular_distribucion_planificada_mejorada(wb, solo_activos=True):
             else:
                 estado = "debe_mas"
             
-            distribucion[mes]["distribucion"][persona] = {
-                "real_mes": real_mes,
-                "ideal_mes": round(ideal_mes, 2),
-                "acumulado_real": real_acum,
-                "acumulado_ideal": round(ideal_acum, 2),
-                "diferencia_acumulada": round(diferencia, 2),
-                "estado": estado,
-                "activo": persona_disponible(persona)
-            }
+            distribucion[mes]["distribucion"][persona] = {
+                "real_mes": real_mes,
+                "ideal_mes": round(ideal_mes, 2),
+                "acumulado_real": real_acum,
+                "acumulado_ideal": round(ideal_acum, 2),
+                "diferencia_acumulada": round(diferencia, 2),
+                "estado": estado,
+                "activo": persona_disponible(persona)
+            }
+    
+    return distribucion
+
+
+# ============================================================================
+# FUNCIÓN DE HISTORIAL
+# ============================================================================
+
+# El historial es un log append-only: un evento JSON por línea. Registrar un
+# evento es una sola escritura al final del archivo y las consultas leen solo
+# los eventos que necesitan (por offset).
+#
+# HISTORIAL_INDICE_FILE es un índice lateral, también append-only, con una línea
+# [offset, largo, timestamp, claves] por evento. En memoria se arma
+# {campo: {valor: [offsets]}} para filtrar sin recorrer el log.
+
+CAMPOS_INDICE_HISTORIAL = ("persona", "mes", "accion", "por")
+
+_historial_lock = threading.Lock()
+_historial_indice = {
+    "tamano": None,     # Bytes del log cubiertos por el índice
+    "offsets": [],      # Offset de cada evento (orden de escritura = orden cronológico)
+    "largos": {},       # {offset: largo en bytes}
+    "timestamps": [],   # Timestamp de cada evento (paralelo a offsets)
+    "claves": {campo: defaultdict(list) for campo in CAMPOS_INDICE_HISTORIAL}
+}
+
+
+def migrar_historial_legacy():
+    """
+    Convierte una única vez el historial en array JSON al formato de una línea
+    por evento. El archivo anterior queda como estaba (de respaldo); la
+    migración no se repite porque ya existe HISTORIAL_FILE.
+    """
+    if os.path.exists(HISTORIAL_FILE) or not os.path.exists(HISTORIAL_LEGACY_FILE):
+        return
+    
+    with bloqueo_entre_procesos("historial"):
+        # Otro proceso pudo migrar mientras se esperaba el bloqueo
+        if os.path.exists(HISTORIAL_FILE):
+            return
+        
+        with open(HISTORIAL_LEGACY_FILE, 'r', encoding='utf-8') as f:
+            historial = json.load(f)
+        
+        temporal = HISTORIAL_FILE + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            for evento in historial:
+                f.write(json.dumps(evento, ensure_ascii=False) + "\n")
+        os.replace(temporal, HISTORIAL_FILE)
+    print(f"📜 Historial migrado a {HISTORIAL_FILE} ({len(historial)} eventos)")
+
+
+def claves_evento_historial(evento):
+    """
+    Valores indexados de un evento: {campo: [valores]}. Los eventos agrupados
+    (lotes) aportan además las personas de cada asignación y la lista "meses".
+    """
+    personas = []
+    for item in [evento] + list(evento.get("asignaciones") or []):
+        for campo in ("persona", "antes", "despues"):
+            valor = item.get(campo)
+            if isinstance(valor, str) and valor and valor not in personas:
+                personas.append(valor)
+    
+    claves = {"persona": personas}
+    for campo in ("mes", "accion", "por"):
+        valor = evento.get(campo)
+        claves[campo] = [valor] if isinstance(valor, str) and valor else []
+    for mes in evento.get("meses") or []:
+        if isinstance(mes, str) and mes not in claves["mes"]:
+            claves["mes"].append(mes)
+    return claves
+
+
+def _agregar_al_indice(offset, largo, timestamp, claves):
+    """Agrega un evento al índice en memoria"""
+    _historial_indice["offsets"].append(offset)
+    _historial_indice["largos"][offset] = largo
+    _historial_indice["timestamps"].append(timestamp)
+    for campo, valores in claves.items():
+        for valor in valores:
+            _historial_indice["claves"][campo][valor].append(offset)
+    _historial_indice["tamano"] = offset + largo
+
+
+def _reiniciar_indice_historial():
+    _historial_indice.update({
+        "tamano": 0,
+        "offsets": [],
+        "largos": {},
+        "timestamps": [],
+        "claves": {campo: defaultdict(list) for campo in CAMPOS_INDICE_HISTORIAL}
+    })
+
+
+def _indexar_desde(posicion, persistir=True):
+    """Indexa los eventos del log a partir de `posicion` (eventos escritos por otro proceso)"""
+    lineas_indice = []
+    with open(HISTORIAL_FILE, 'rb') as f:
+        f.seek(posicion)
+        for linea in f:
+            if not linea.endswith(b'\n'):
+                break  # Línea todavía en escritura
+            largo = len(linea)
+            if linea.strip():
+                evento = json.loads(linea)
+                timestamp = evento.get('timestamp', '')
+                claves = claves_evento_historial(evento)
+                _agregar_al_indice(posicion, largo, timestamp, claves)
+                lineas_indice.append([posicion, largo, timestamp, claves])
+            else:
+                _historial_indice["tamano"] = posicion + largo
+            posicion += largo
+    
+    if persistir and lineas_indice:
+        with open(HISTORIAL_INDICE_FILE, 'a', encoding='utf-8') as f:
+            for entrada in lineas_indice:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+
+
+def _cargar_indice_persistido():
+    """
+    Carga HISTORIAL_INDICE_FILE. Retorna False si no existe o no es consistente
+    con el log (huecos, offsets fuera del archivo); en ese caso hay que reconstruir.
+    """
+    if not os.path.exists(HISTORIAL_INDICE_FILE):
+        return False
+    
+    entradas = {}
+    with open(HISTORIAL_INDICE_FILE, 'r', encoding='utf-8') as f:
+        for linea in f:
+            if linea.endswith("\n") and linea.strip():
+                offset, largo, timestamp, claves = json.loads(linea)
+                entradas[offset] = (largo, timestamp, claves)
+    
+    tamano_log = os.path.getsize(HISTORIAL_FILE)
+    _reiniciar_indice_historial()
+    esperado = 0
+    for offset in sorted(entradas):
+        largo, timestamp, claves = entradas[offset]
+        if offset < esperado:
+            continue
+        if offset != esperado or offset + largo > tamano_log:
+            return False
+        _agregar_al_indice(offset, largo, timestamp, claves)
+        esperado = offset + largo
+    return True
+
+
+def asegurar_indice_historial():
+    """
+    Deja el índice en memoria al día con el log (llamar con _historial_lock
+    tomado y después de migrar_historial_legacy, que usa el bloqueo "historial")
+    """
+    tamano_log = firma_archivo(HISTORIAL_FILE)
+    tamano_log = tamano_log[1] if tamano_log else 0
+    
+    if _historial_indice["tamano"] == tamano_log:
+        return
+    
+    if _historial_indice["tamano"] is None or _historial_indice["tamano"] > tamano_log:
+        if not tamano_log:
+            _reiniciar_indice_historial()
+            return
+        if not _cargar_indice_persistido():
+            print("📇 Reconstruyendo índice del historial...")
+            _reiniciar_indice_historial()
+            with open(HISTORIAL_INDICE_FILE, 'w', encoding='utf-8'):
+                pass
+    
+    if _historial_indice["tamano"] < tamano_log:
+        _indexar_desde(_historial_indice["tamano"])
+
+
+def registrar_en_historial(evento):
+    """
+    Registra un evento en el historial. Un error del almacenamiento no se
+    silencia: llega al endpoint, que lo informa al cliente.
+    """
+    evento['timestamp'] = datetime.now().isoformat()
+    almacenamiento().registrar_evento(evento)
+
+
+def contar_eventos_historial():
+    """Cantidad total de eventos del historial"""
+    return almacenamiento().contar_eventos()
+
+
+def consultar_historial(filtros=None, desde=None, hasta=None, cursor=None, limite=100):
+    """
+    Consulta paginada del historial.
+    
+    Args:
+        filtros: {campo: valor} con campos de CAMPOS_INDICE_HISTORIAL
+        desde/hasta: Timestamps ISO (o fechas YYYY-MM-DD, hasta inclusive)
+        cursor: 'siguiente_cursor' devuelto por la página anterior
+        limite: Cantidad máxima de eventos
+    
+    Returns:
+        dict: {eventos (orden cronológico), total, siguiente_cursor}.
+        Las páginas avanzan de los eventos más nuevos a los más viejos.
+        Sin filtros ni cursor retorna los últimos `limite` eventos.
+    """
+    filtros = {campo: valor for campo, valor in (filtros or {}).items() if valor}
+    if hasta and len(hasta) == 10:
+        hasta = hasta + "\uffff"
+    return almacenamiento().consultar_eventos(filtros, desde, hasta, cursor, limite)
+
+
+def dias_autoasignados(mes, dias):
+    """
+    Días del mes cuya asignación actual la hizo la propia persona (auto-asignación,
+    o una asignación/lote donde "por" es quien queda de guardia), según el historial.
+    
+    Args:
+        dias: {dia: info} actual del mes, para descartar lo que cambió después
+    
+    Returns:
+        set: números de día
+    """
+    paginas = []
+    cursor = None
+    while True:
+        pagina = consultar_historial({"mes": mes}, cursor=cursor, limite=1000)
+        paginas.append(pagina["eventos"])
+        cursor = pagina["siguiente_cursor"]
+        if cursor is None:
+            break
+    
+    autor = {}
+    for eventos in reversed(paginas):
+        for evento in eventos:
+            accion = evento.get("accion")
+            if accion == "auto_asignacion":
+                autor[evento.get("dia")] = evento.get("persona")
+            elif accion in ("asignar", "eliminar") and evento.get("mes") == mes:
+                propia = accion == "asignar" and evento.get("por") == evento.get("despues")
+                autor[evento.get("dia")] = evento.get("despues") if propia else None
+            for item in evento.get("asignaciones") or []:
+                if item.get("mes") == mes:
+                    propia = accion == "asignar_lote" and evento.get("por") == item.get("despues")
+                    autor[item.get("dia")] = item.get("despues") if propia else None
+    
+    return {
+        dia for dia, persona in autor.items()
+        if persona and dia in dias and dias[dia].get('persona') == persona
+    }
+
+
+def historial_jsonl_registrar(evento):
+    """
+    Append de una línea al log + su entrada de índice. Ambas escrituras van bajo
+    el bloqueo "historial" para que otro proceso no intercale eventos entre el
+    offset leído y la entrada del índice.
+    """
+    migrar_historial_legacy()
+    linea = (json.dumps(evento, ensure_ascii=False) + "\n").encode('utf-8')
+    
+    with _historial_lock:
+        with bloqueo_entre_procesos("historial"):
+            asegurar_indice_historial()
+            with open(HISTORIAL_FILE, 'ab') as f:
+                offset = os.fstat(f.fileno()).st_size
+                f.write(linea)
+            
+            if _historial_indice["tamano"] == offset:
+                claves = claves_evento_historial(evento)
+                _agregar_al_indice(offset, len(linea), evento['timestamp'], claves)
+                with open(HISTORIAL_INDICE_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps([offset, len(linea), evento['timestamp'], claves], ensure_ascii=False) + "\n")
+
+
+def historial_jsonl_contar():
+    """Cantidad total de eventos del log"""
+    migrar_historial_legacy()
+    with _historial_lock:
+        asegurar_indice_historial()
+        return len(_historial_indice["offsets"])
+
+
+def leer_eventos_historial(offsets):
+    """Lee del log solo los eventos en los offsets indicados"""
+    eventos = []
+    with open(HISTORIAL_FILE, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            eventos.append(json.loads(f.read(_historial_indice["largos"][offset])))
+    return eventos
+
+
+def historial_jsonl_consultar(filtros, desde, hasta, cursor, limite):
+    """Consulta del log usando el índice de offsets (el cursor es un offset)"""
+    migrar_historial_legacy()
+    with _historial_lock:
+        asegurar_indice_historial()
+        offsets = _historial_indice["offsets"]
+        timestamps = _historial_indice["timestamps"]
+        
+        # Rango de offsets según el rango de tiempo (el log está en orden cronológico)
+        inicio = bisect_left(timestamps, desde) if desde else 0
+        fin = bisect_right(timestamps, hasta) if hasta else len(offsets)
+        if inicio >= fin:
+            return {"eventos": [], "total": 0, "siguiente_cursor": None}
+        offset_min = offsets[inicio]
+        offset_max = offsets[fin - 1] if cursor is None else min(offsets[fin - 1], cursor - 1)
+        
+        # Listas de offsets por filtro, recortadas al rango
+        listas = []
+        for campo, valor in filtros.items():
+            lista = _historial_indice["claves"][campo].get(valor, [])
+            listas.append(lista[bisect_left(lista, offset_min):bisect_right(lista, offset_max)])
+        if not listas:
+            listas = [offsets[bisect_left(offsets, offset_min):bisect_right(offsets, offset_max)]]
+        
+        # Intersección: recorrer la lista más corta y buscar en las demás
+        listas.sort(key=len)
+        base, resto = listas[0], listas[1:]
+        
+        def en_todas(offset):
+            for lista in resto:
+                i = bisect_left(lista, offset)
+                if i == len(lista) or lista[i] != offset:
+                    return False
+            return True
+        
+        coincidencias = [o for o in base if en_todas(o)] if resto else base
+        
+        pagina = coincidencias[-limite:] if limite > 0 else []
+        eventos = leer_eventos_historial(pagina)
+        quedan = len(coincidencias) > len(pagina)
     
-    return distribucion
+    return {
+        "eventos": eventos,
+        "total": len(coincidencias),
+        "siguiente_cursor": pagina[0] if quedan and pagina else None
+    }
 
 
 # ============================================================================
-# FUNCIÓN DE HISTORIAL
+# ALMACENAMIENTO
 # ============================================================================
+# Capa de persistencia intercambiable. Todo el resto de la app accede a los datos
+# a través de almacenamiento(), que según ALMACENAMIENTO usa:
+#   - "archivos": Excel + disponibilidad.json + usuarios.json + historial JSONL
+#   - "sqlite":   base embebida en DB_FILE; el Excel es solo una exportación
+#
+# Las firmas (firma_calendario / firma_disponibilidad) cambian con cada escritura
+# y permiten a cada proceso detectar cambios hechos por otro.
 
-def registrar_en_historial(evento):
-    """Registra un evento en el historial"""
-    try:
+_bloqueos_hilos = defaultdict(threading.Lock)
+_bloqueos_hilos_lock = threading.Lock()
+
+
+@contextmanager
+def bloqueo_entre_procesos(nombre):
+    """
+    Bloqueo exclusivo identificado por nombre, válido entre hilos y entre procesos
+    (archivo en BLOQUEOS_DIR con flock en Linux/Mac o msvcrt en Windows).
+    """
+    with _bloqueos_hilos_lock:
+        lock_hilo = _bloqueos_hilos[nombre]
+    
+    with lock_hilo:
+        os.makedirs(BLOQUEOS_DIR, exist_ok=True)
+        with open(os.path.join(BLOQUEOS_DIR, f"{nombre}.lock"), 'a+b') as f:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == 'nt':
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class AlmacenamientoArchivos:
+    """Backend original: Excel para asignaciones y archivos JSON para el resto"""
+    
+    nombre = "archivos"
+    
+    # Calendario
+    def existe_calendario(self):
+        return os.path.exists(EXCEL_FILE)
+    
+    def firma_calendario(self):
+        firma_excel = firma_archivo(EXCEL_FILE)
+        if firma_excel is None:
+            return None
+        return (firma_excel, tamano_journal())
+    
+    def leer_calendario(self):
+        return leer_calendario_excel()
+    
+    def cambios_calendario_desde(self, firma_vieja, firma_nueva):
+        """
+        Entradas agregadas al journal entre dos firmas, o None si el Excel cambió
+        por algo distinto de volcados del journal
+        """
+        excel, desde = list(firma_vieja[0]), firma_vieja[1]
+        previas = []
+        if excel != list(firma_nueva[0]):
+            siguiente = {tuple(v["excel_antes"]): v for v in leer_volcados()}
+            # Recorrer los volcados desde la firma del modelo hasta la actual: lo
+            # volcado que el modelo no tenía sale del registro y lo que seguía
+            # quedó al principio del journal siguiente
+            while excel != list(firma_nueva[0]):
+                volcado = siguiente.pop(tuple(excel), None)
+                if volcado is None:
+                    return None
+                tramo = volcado["journal"].encode('utf-8')[desde:]
+                previas += [json.loads(linea) for linea in tramo.splitlines() if linea.strip()]
+                excel, desde = volcado["excel_despues"], max(desde - volcado["volcado"], 0)
+        if firma_nueva[1] < desde:
+            return None
+        entradas, fin = leer_journal(desde)
+        if fin != firma_nueva[1]:
+            return None
+        entradas = previas + entradas
+        return [
+            (mes, {int(dia): persona for dia, (_, persona) in cambios.items()})
+            for e in entradas
+            for mes, cambios in e["meses"].items()
+        ]
+    
+    def escribir_asignaciones(self, cambios_por_mes, dias_por_mes):
+        return registrar_en_journal(cambios_por_mes, dias_por_mes)
+    
+    def guardar_calendario_nuevo(self, wb):
+        # El calendario nuevo reemplaza también lo pendiente en el journal
+        with bloqueo_entre_procesos("calendario_excel"):
+            with bloqueo_entre_procesos("calendario_journal"):
+                guardar_excel_atomico(wb)
+                if os.path.exists(JOURNAL_FILE):
+                    os.remove(JOURNAL_FILE)
+    
+    def archivo_excel(self):
+        volcar_journal_excel()
+        return EXCEL_FILE
+    
+    # Disponibilidad
+    def firma_disponibilidad(self):
+        return firma_archivo(DISPONIBILIDAD_FILE)
+    
+    def leer_disponibilidad(self):
+        return leer_disponibilidad_json()
+    
+    def escribir_disponibilidad(self, disponibilidad):
+        escribir_disponibilidad_json(disponibilidad)
+    
+    # Usuarios
+    def leer_usuarios(self):
+        return leer_usuarios_json()
+    
+    def escribir_usuarios(self, usuarios):
+        escribir_usuarios_json(usuarios)
+    
+    # Historial
+    def registrar_evento(self, evento):
+        historial_jsonl_registrar(evento)
+    
+    def contar_eventos(self):
+        return historial_jsonl_contar()
+    
+    def consultar_eventos(self, filtros, desde, hasta, cursor, limite):
+        return historial_jsonl_consultar(filtros, desde, hasta, cursor, limite)
+
+
+class AlmacenamientoSQLite:
+    """
+    Backend SQLite: asignaciones, disponibilidad, usuarios e historial en una sola
+    base con índices y transacciones. El Excel se genera a pedido en /api/descargar.
+    """
+    
+    nombre = "sqlite"
+    
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            clave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS dias (
+            mes TEXT NOT NULL,
+            dia INTEGER NOT NULL,
+            fecha TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            dia_semana TEXT NOT NULL,
+            celda_ref TEXT NOT NULL,
+            persona TEXT,
+            PRIMARY KEY (mes, dia)
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_dias_fecha ON dias(fecha);
+        CREATE INDEX IF NOT EXISTS idx_dias_persona ON dias(persona, fecha);
+        CREATE TABLE IF NOT EXISTS disponibilidad (
+            persona TEXT PRIMARY KEY,
+            activo INTEGER NOT NULL,
+            motivo TEXT,
+            desde TEXT,
+            hasta TEXT
+        );
+        -- Ventanas de inactividad (varias por persona; las columnas de
+        -- disponibilidad quedan del formato anterior y se migran una vez)
+        CREATE TABLE IF NOT EXISTS inactividades (
+            persona TEXT NOT NULL,
+            desde TEXT,
+            hasta TEXT,
+            motivo TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_inactividades_persona ON inactividades(persona, desde);
+        CREATE TABLE IF NOT EXISTS usuarios (
+            usuario_id TEXT PRIMARY KEY,
+            nombre TEXT NOT NULL UNIQUE,
+            hash TEXT NOT NULL,
+            creado TEXT,
+            modificado TEXT
+        );
+        CREATE TABLE IF NOT EXISTS historial (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            accion TEXT,
+            mes TEXT,
+            por TEXT,
+            datos TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_historial_timestamp ON historial(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_historial_accion ON historial(accion, id);
+        CREATE INDEX IF NOT EXISTS idx_historial_mes ON historial(mes, id);
+        CREATE INDEX IF NOT EXISTS idx_historial_por ON historial(por, id);
+        CREATE TABLE IF NOT EXISTS historial_personas (
+            persona TEXT NOT NULL,
+            evento_id INTEGER NOT NULL REFERENCES historial(id),
+            PRIMARY KEY (persona, evento_id)
+        );
+        -- Meses adicionales de eventos que abarcan varios (el primero va en historial.mes)
+        CREATE TABLE IF NOT EXISTS historial_meses (
+            mes TEXT NOT NULL,
+            evento_id INTEGER NOT NULL REFERENCES historial(id),
+            PRIMARY KEY (mes, evento_id)
+        );
+    """
+    
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        with self.conexion() as conn:
+            conn.executescript(self.ESQUEMA)
+        if not self._leer_meta("migrado"):
+            migrar_archivos_a_sqlite(self)
+        if not self._leer_meta("inactividades"):
+            self._migrar_inactividades()
+    
+    def conexion(self):
+        """Conexión propia de cada hilo"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def _transaccion(self, conn=None):
+        """
+        Transacción propia que se confirma al salir, o la del llamador si pasa
+        conn: en ese caso solo se ejecutan las sentencias y el llamador confirma.
+        """
+        if conn is not None:
+            yield conn
+            return
+        c = self.conexion()
+        with c:
+            yield c
+    
+    def _leer_meta(self, clave):
+        fila = self.conexion().execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+    
+    @staticmethod
+    def _incrementar_meta(conn, clave):
+        conn.execute(
+            "INSERT INTO meta (clave, valor) VALUES (?, 1) "
+            "ON CONFLICT(clave) DO UPDATE SET valor = valor + 1",
+            (clave,)
+        )
+    
+    # Calendario
+    def existe_calendario(self):
+        return self.conexion().execute("SELECT 1 FROM dias LIMIT 1").fetchone() is not None
+    
+    def firma_calendario(self):
+        if not self.existe_calendario():
+            return None
+        return (self.nombre, self._leer_meta("version_calendario"))
+    
+    def leer_calendario(self):
+        # Firma antes que los datos: si alguien escribe entre medio, la firma
+        # queda vieja y se relee en la próxima consulta
+        firma = self.firma_calendario()
+        filas = self.conexion().execute(
+            "SELECT mes, dia, fecha, tipo, dia_semana, celda_ref, persona FROM dias ORDER BY fecha"
+        ).fetchall()
+        meses = {}
+        for mes, dia, fecha, tipo, dia_semana, celda_ref, persona in filas:
+            meses.setdefault(mes, {})[dia] = {
+                "tipo": tipo,
+                "celda_ref": celda_ref,
+                "persona": persona,
+                "dia_semana": dia_semana,
+                "fecha": fecha
+            }
+        hojas = [mes for mes in MESES if mes in meses]
+        return hojas, meses, firma
+    
+    def cambios_calendario_desde(self, firma_vieja, firma_nueva):
+        return None
+    
+    def escribir_asignaciones(self, cambios_por_mes, dias_por_mes=None):
+        conn = self.conexion()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            version = self._leer_meta("version_calendario")
+            conn.executemany(
+                "UPDATE dias SET persona = ? WHERE mes = ? AND dia = ?",
+                [
+                    (persona, mes, dia)
+                    for mes, cambios in cambios_por_mes.items()
+                    for dia, persona in cambios.items()
+                ]
+            )
+            self._incrementar_meta(conn, "version_calendario")
+        return (self.nombre, version), (self.nombre, (version or 0) + 1)
+    
+    def guardar_calendario_nuevo(self, wb):
+        meses = {mes: leer_dias_de_hoja(wb[mes], mes) for mes in wb.sheetnames if mes in MESES}
+        self.importar_calendario(meses)
+    
+    def importar_calendario(self, meses, conn=None):
+        """Reemplaza todos los días (estructura + asignaciones)"""
+        filas = [
+            (mes, dia, info['fecha'], info['tipo'], info['dia_semana'], info['celda_ref'], info.get('persona'))
+            for mes, dias in meses.items()
+            for dia, info in dias.items()
+        ]
+        with self._transaccion(conn) as c:
+            c.execute("DELETE FROM dias")
+            c.executemany("INSERT INTO dias VALUES (?, ?, ?, ?, ?, ?, ?)", filas)
+            self._incrementar_meta(c, "version_calendario")
+    
+    def archivo_excel(self):
+        """Exporta el calendario a un Excel en memoria con el formato del generador"""
+        from io import BytesIO
+        
+        wb = construir_libro_calendario()
+        for mes, dia, celda_ref, persona in self.conexion().execute(
+            "SELECT mes, dia, celda_ref, persona FROM dias WHERE persona IS NOT NULL"
+        ):
+            if mes in wb.sheetnames:
+                wb[mes][celda_ref] = persona
+        
+        salida = BytesIO()
+        wb.save(salida)
+        salida.seek(0)
+        return salida
+    
+    # Disponibilidad
+    def firma_disponibilidad(self):
+        return (self.nombre, self._leer_meta("version_disponibilidad"))
+    
+    def leer_disponibilidad(self):
+        conn = self.conexion()
+        personas = [fila[0] for fila in conn.execute("SELECT persona FROM disponibilidad")]
+        if not personas:
+            return None
+        disponibilidad = {persona: {"inactividades": []} for persona in personas}
+        for persona, desde, hasta, motivo in conn.execute(
+            "SELECT persona, desde, hasta, motivo FROM inactividades ORDER BY persona, desde"
+        ):
+            disponibilidad.setdefault(persona, {"inactividades": []})["inactividades"].append(
+                {"desde": desde, "hasta": hasta, "motivo": motivo}
+            )
+        return disponibilidad
+    
+    def escribir_disponibilidad(self, disponibilidad, conn=None):
+        disponibilidad = {
+            persona: normalizar_registro_disponibilidad(info)
+            for persona, info in disponibilidad.items()
+        }
+        with self._transaccion(conn) as c:
+            c.executemany(
+                "INSERT OR REPLACE INTO disponibilidad (persona, activo, motivo, desde, hasta) VALUES (?, ?, NULL, NULL, NULL)",
+                [(persona, int(not info["inactividades"])) for persona, info in disponibilidad.items()]
+            )
+            c.executemany("DELETE FROM inactividades WHERE persona = ?", [(p,) for p in disponibilidad])
+            c.executemany(
+                "INSERT INTO inactividades (persona, desde, hasta, motivo) VALUES (?, ?, ?, ?)",
+                [
+                    (persona, v["desde"], v["hasta"], v["motivo"])
+                    for persona, info in disponibilidad.items()
+                    for v in info["inactividades"]
+                ]
+            )
+            # Escrito en el formato nuevo: no hay nada que migrar
+            c.execute("INSERT OR IGNORE INTO meta (clave, valor) VALUES ('inactividades', 1)")
+            self._incrementar_meta(c, "version_disponibilidad")
+    
+    def _migrar_inactividades(self):
+        """Pasa las filas del formato anterior (una ventana por persona) a inactividades"""
+        with self.conexion() as c:
+            # Se vuelve a mirar con la base bloqueada: otro worker pudo migrar recién
+            c.execute("BEGIN IMMEDIATE")
+            if self._leer_meta("inactividades"):
+                return
+            for persona, activo, motivo, desde, hasta in c.execute(
+                "SELECT persona, activo, motivo, desde, hasta FROM disponibilidad"
+            ).fetchall():
+                if not activo:
+                    c.execute(
+                        "INSERT INTO inactividades (persona, desde, hasta, motivo) VALUES (?, ?, ?, ?)",
+                        (persona, desde, hasta, motivo)
+                    )
+            self._incrementar_meta(c, "inactividades")
+            self._incrementar_meta(c, "version_disponibilidad")
+    
+    # Usuarios
+    def leer_usuarios(self):
+        usuarios = {}
+        for usuario_id, nombre, hash_clave, creado, modificado in self.conexion().execute(
+            "SELECT usuario_id, nombre, hash, creado, modificado FROM usuarios"
+        ):
+            usuarios[usuario_id] = {"nombre": nombre, "hash": hash_clave, "creado": creado}
+            if modificado:
+                usuarios[usuario_id]["modificado"] = modificado
+        return usuarios
+    
+    def escribir_usuarios(self, usuarios, conn=None):
+        with self._transaccion(conn) as c:
+            c.executemany(
+                "INSERT INTO usuarios (usuario_id, nombre, hash, creado, modificado) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(usuario_id) DO UPDATE SET nombre = excluded.nombre, hash = excluded.hash, "
+                "creado = excluded.creado, modificado = excluded.modificado",
+                [
+                    (usuario_id, info['nombre'], info['hash'], info.get('creado'), info.get('modificado'))
+                    for usuario_id, info in usuarios.items()
+                ]
+            )
+            ids = list(usuarios)
+            c.execute(
+                f"DELETE FROM usuarios WHERE usuario_id NOT IN ({','.join('?' * len(ids))})" if ids
+                else "DELETE FROM usuarios",
+                ids
+            )
+    
+    # Historial
+    def registrar_evento(self, evento, conn=None):
+        claves = claves_evento_historial(evento)
+        with self._transaccion(conn) as c:
+            cursor = c.execute(
+                "INSERT INTO historial (timestamp, accion, mes, por, datos) VALUES (?, ?, ?, ?, ?)",
+                (
+                    evento.get('timestamp', ''),
+                    (claves['accion'] or [None])[0],
+                    (claves['mes'] or [None])[0],
+                    (claves['por'] or [None])[0],
+                    json.dumps(evento, ensure_ascii=False)
+                )
+            )
+            c.executemany(
+                "INSERT OR IGNORE INTO historial_personas (persona, evento_id) VALUES (?, ?)",
+                [(persona, cursor.lastrowid) for persona in claves['persona']]
+            )
+            c.executemany(
+                "INSERT OR IGNORE INTO historial_meses (mes, evento_id) VALUES (?, ?)",
+                [(mes, cursor.lastrowid) for mes in claves['mes'][1:]]
+            )
+    
+    def contar_eventos(self):
+        return self.conexion().execute("SELECT COUNT(*) FROM historial").fetchone()[0]
+    
+    def consultar_eventos(self, filtros, desde, hasta, cursor, limite):
+        condiciones = []
+        parametros = []
+        for campo, valor in filtros.items():
+            if campo == "persona":
+                condiciones.append("id IN (SELECT evento_id FROM historial_personas WHERE persona = ?)")
+            elif campo == "mes":
+                condiciones.append("(mes = ? OR id IN (SELECT evento_id FROM historial_meses WHERE mes = ?))")
+                parametros.append(valor)
+            else:
+                condiciones.append(f"{campo} = ?")
+            parametros.append(valor)
+        if desde:
+            condiciones.append("timestamp >= ?")
+            parametros.append(desde)
+        if hasta:
+            condiciones.append("timestamp <= ?")
+            parametros.append(hasta)
+        if cursor is not None:
+            condiciones.append("id < ?")
+            parametros.append(cursor)
+        
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        conn = self.conexion()
+        total = conn.execute(f"SELECT COUNT(*) FROM historial {where}", parametros).fetchone()[0]
+        filas = conn.execute(
+            f"SELECT id, datos FROM historial {where} ORDER BY id DESC LIMIT ?",
+            parametros + [limite]
+        ).fetchall()
+        filas.reverse()
+        
+        return {
+            "eventos": [json.loads(datos) for _, datos in filas],
+            "total": total,
+            "siguiente_cursor": filas[0][0] if filas and total > len(filas) else None
+        }
+
+
+def migrar_archivos_a_sqlite(destino):
+    """
+    Importa una única vez a SQLite los datos del backend de archivos que existan:
+    calendario Excel, disponibilidad.json, usuarios.json e historial. Todo va en
+    una sola transacción: si algo falla no queda nada a medias y se reintenta
+    entero en el próximo arranque.
+    """
+    conn = destino.conexion()
+    
+    with conn:
+        # Con la base bloqueada se vuelve a mirar: otro worker pudo migrar recién
+        conn.execute("BEGIN IMMEDIATE")
+        if destino._leer_meta("migrado"):
+            return
+        print(f"🗄️  Migrando datos a SQLite ({destino.ruta})...")
+        
+        if os.path.exists(EXCEL_FILE):
+            _, meses, _ = leer_calendario_excel()
+            destino.importar_calendario(meses, conn)
+            print(f"  ✓ Calendario: {sum(len(d) for d in meses.values())} días")
+        
+        disponibilidad = leer_disponibilidad_json()
+        if disponibilidad:
+            destino.escribir_disponibilidad(disponibilidad, conn)
+            print(f"  ✓ Disponibilidad: {len(disponibilidad)} personas")
+        
+        usuarios = leer_usuarios_json()
+        if usuarios:
+            destino.escribir_usuarios(usuarios, conn)
+            print(f"  ✓ Usuarios: {len(usuarios)}")
+        
+        migrar_historial_legacy()
+        eventos = 0
         if os.path.exists(HISTORIAL_FILE):
             with open(HISTORIAL_FILE, 'r', encoding='utf-8') as f:
-                historial = json.load(f)
-        else:
-            historial = []
-        
-        evento['timestamp'] = datetime.now().isoformat()
-        historial.append(evento)
+                for linea in f:
+                    if linea.strip():
+                        destino.registrar_evento(json.loads(linea), conn)
+                        eventos += 1
+            print(f"  ✓ Historial: {eventos} eventos")
         
-        with open(HISTORIAL_FILE, 'w', encoding='utf-8') as f:
-            json.dump(historial, f, indent=2, ensure_ascii=False)
-    except:
-        pass
+        conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('migrado', 1)")
+
+
+_almacenamiento = None
+_almacenamiento_lock = threading.Lock()
+
+
+def almacenamiento():
+    """Backend de almacenamiento configurado (se crea una vez por proceso)"""
+    global _almacenamiento
+    if _almacenamiento is None:
+        with _almacenamiento_lock:
+            if _almacenamiento is None:
+                if ALMACENAMIENTO == "sqlite":
+                    _almacenamiento = AlmacenamientoSQLite(DB_FILE)
+                else:
+                    _almacenamiento = AlmacenamientoArchivos()
+    return _almacenamiento
+
+
+def existe_calendario():
+    """True si el almacenamiento tiene un calendario cargado"""
+    return almacenamiento().existe_calendario()
 
 
 # ============================================================================
@@ -648,6 +3487,16 @@ def hash_password(password):
 
 
 def cargar_usuarios():
+    """Carga los usuarios registrados"""
+    return almacenamiento().leer_usuarios()
+
+
+def guardar_usuarios(usuarios):
+    """Guarda los usuarios"""
+    almacenamiento().escribir_usuarios(usuarios)
+
+
+def leer_usuarios_json():
     """Carga los usuarios registrados desde archivo JSON"""
     if not os.path.exists(USUARIOS_FILE):
         return {}
@@ -655,7 +3504,7 @@ def cargar_usuarios():
         return json.load(f)
 
 
-def guardar_usuarios(usuarios):
+def escribir_usuarios_json(usuarios):
     """Guarda los usuarios en archivo JSON"""
     with open(USUARIOS_FILE, 'w', encoding='utf-8') as f:
         json.dump(usuarios, f, indent=2, ensure_ascii=False)
@@ -754,61 +3603,600 @@ def auth_configurar():
     if usuario_id in usuarios:
         return jsonify({"error": "Ese número de usuario ya está en uso. Elegí otro."}), 400
 
-    # Verificar que el nombre no esté ya registrado por otro usuario
-    for uid, info in usuarios.items():
-        if info['nombre'] == nombre:
-            return jsonify({"error": f"{nombre} ya tiene una cuenta registrada."}), 400
+    # Verificar que el nombre no esté ya registrado por otro usuario
+    for uid, info in usuarios.items():
+        if info['nombre'] == nombre:
+            return jsonify({"error": f"{nombre} ya tiene una cuenta registrada."}), 400
+
+    usuarios[usuario_id] = {
+        "nombre": nombre,
+        "hash": hash_password(clave),
+        "creado": datetime.now().isoformat()
+    }
+    guardar_usuarios(usuarios)
+
+    session['usuario_id'] = usuario_id
+    session['usuario_nombre'] = nombre
+
+    return jsonify({
+        "success": True,
+        "usuario_id": usuario_id,
+        "nombre": nombre,
+        "mensaje": f"✅ Cuenta creada. Bienvenido, {nombre}"
+    })
+
+
+@app.route('/api/auth/logout', methods=['POST'])
+def auth_logout():
+    session.clear()
+    return jsonify({"success": True})
+
+
+@app.route('/api/auth/cambiar-clave', methods=['POST'])
+@login_requerido
+def auth_cambiar_clave():
+    data = request.json or {}
+    clave_actual = data.get('clave_actual', '').strip()
+    clave_nueva = data.get('clave_nueva', '').strip()
+    clave_confirm = data.get('clave_confirm', '').strip()
+
+    if not all([clave_actual, clave_nueva, clave_confirm]):
+        return jsonify({"error": "Completá todos los campos"}), 400
+    if len(clave_nueva) < 4:
+        return jsonify({"error": "La nueva contraseña debe tener al menos 4 caracteres"}), 400
+    if clave_nueva != clave_confirm:
+        return jsonify({"error": "Las contraseñas nuevas no coinciden"}), 400
+
+    uid = session['usuario_id']
+    usuarios = cargar_usuarios()
+
+    if usuarios[uid]['hash'] != hash_password(clave_actual):
+        return jsonify({"error": "Contraseña actual incorrecta"}), 401
+
+    usuarios[uid]['hash'] = hash_password(clave_nueva)
+    usuarios[uid]['modificado'] = datetime.now().isoformat()
+    guardar_usuarios(usuarios)
+
+    return jsonify({"success": True, "mensaje": "✅ Contraseña actualizada"})
+
+
+# ============================================================================
+# VERSIONES DE DATOS (GET CONDICIONAL)
+# ============================================================================
+# Cada alcance ("mes:<Mes>", "calendario", "disponibilidad", "hoy") tiene una
+# versión: un hash del contenido, recalculado solo cuando cambia la firma del
+# almacenamiento. Toda mutación (asignar, disponibilidad, reset, distribución)
+# cambia la firma y por lo tanto la versión. Al ser hash del contenido, todos
+# los workers dan la misma versión y un volcado del journal no la cambia.
+# Los endpoints de lectura la usan como ETag y responden 304 sin calcular nada.
+# No se manda Last-Modified: cada worker solo sabría cuándo vio la versión por
+# primera vez, no cuándo cambiaron los datos, y un If-Modified-Since comparado
+# contra eso podría dar un 304 falso.
+
+_versiones_calendario = {
+    "firma": None,
+    "meses": {},        # {mes: hash de las asignaciones del mes}
+    "calendario": None  # hash de todos los meses
+}
+
+# Lecturas en curso (single-flight): si llegan pedidos iguales mientras otro ya
+# calcula la misma versión, esperan y reciben esa respuesta en vez de calcularla
+# de nuevo. Al terminar se saca de acá, así que no es un cache.
+_lecturas_en_curso = {}     # {(ruta, query string, etag): {"evento", "respuesta", "trabajo"}}
+_lecturas_lock = threading.Lock()
+_estadisticas_lecturas = {"calculadas": 0, "compartidas": 0}
+
+# Respuestas ya serializadas de los endpoints con cache=True (mes, reporte anual,
+# disponibilidad): {(ruta, query string): (etag, cuerpo, código, encabezados)}.
+# Se guarda solo la última versión de cada ruta, así que cuando cambia el mes o
+# la disponibilidad la entrada deja de coincidir y se reemplaza en el próximo
+# pedido; las demás rutas no se tocan. Como mucho MAX_CACHE_RESPUESTAS entradas
+# (se descarta la menos usada).
+MAX_CACHE_RESPUESTAS = 64
+_cache_respuestas = OrderedDict()
+_cache_lock = threading.Lock()
+_estadisticas_cache = defaultdict(lambda: {"aciertos": 0, "fallos": 0})   # {endpoint: contadores}
+
+
+def _versiones_de_calendario():
+    """Hashes por mes y total del calendario, recalculados si cambió el modelo"""
+    with _modelo_lock:
+        asegurar_modelo_calendario()
+        firma = _modelo_calendario["firma"]
+        if _versiones_calendario["firma"] != firma or firma is None:
+            meses = {}
+            for mes in _modelo_calendario["hojas"]:
+                dias = _modelo_calendario["meses"][mes]
+                contenido = json.dumps([(dia, dias[dia].get('persona')) for dia in sorted(dias)])
+                meses[mes] = hashlib.md5(contenido.encode('utf-8')).hexdigest()
+            total = hashlib.md5(json.dumps(sorted(meses.items())).encode('utf-8')).hexdigest()
+            _versiones_calendario.update({"firma": firma, "meses": meses, "calendario": total})
+        return _versiones_calendario
+
+
+def version_datos(alcances):
+    """
+    Versión combinada de los datos que usa un endpoint.
+    
+    Returns:
+        str: ETag
+    """
+    partes = []
+    for alcance in alcances:
+        if alcance == "calendario":
+            version = _versiones_de_calendario()["calendario"]
+        elif alcance.startswith("mes:"):
+            version = _versiones_de_calendario()["meses"].get(alcance[4:], "-")
+        elif alcance == "disponibilidad":
+            version = motor_disponibilidad()["version"]
+        elif alcance == "hoy":
+            version = date.today().isoformat()
+        elif alcance == "sesion":
+            version = session.get('usuario_id') or "-"
+        else:
+            raise ValueError(f"Alcance de versión desconocido: {alcance}")
+        partes.append(f"{alcance}={version}")
+    
+    return hashlib.md5("|".join(partes).encode('utf-8')).hexdigest()
+
+
+def leer_una_vez(clave, calcular):
+    """
+    Ejecuta calcular() una sola vez para todos los pedidos concurrentes con la
+    misma clave: el primero calcula y los demás esperan y reciben una copia.
+    Si calcular() lanza una excepción, todos los que esperaban reciben la misma.
+    
+    Args:
+        clave: Identifica el recurso y la versión de los datos
+        calcular: Función que arma la respuesta (la vista)
+    
+    Returns:
+        Response
+    """
+    with _lecturas_lock:
+        lectura = _lecturas_en_curso.get(clave)
+        propia = lectura is None
+        if propia:
+            lectura = {
+                "evento": threading.Event(),
+                "respuesta": None,
+                "error": None,
+                "trabajo": getattr(_trabajo_local, "trabajo", None)  # Si la calcula un trabajo cancelable
+            }
+            _lecturas_en_curso[clave] = lectura
+            _estadisticas_lecturas["calculadas"] += 1
+    
+    if propia:
+        try:
+            respuesta = make_response(calcular())
+            lectura["respuesta"] = (respuesta.get_data(), respuesta.status_code, list(respuesta.headers))
+            return respuesta
+        except Exception as e:
+            lectura["error"] = e
+            raise
+        finally:
+            with _lecturas_lock:
+                del _lecturas_en_curso[clave]
+            lectura["evento"].set()
+    
+    lectura["evento"].wait()
+    cancelada = lectura["trabajo"] is not None and lectura["trabajo"]["cancelar"].is_set()
+    if cancelada or (lectura["respuesta"] is None and lectura["error"] is None):
+        # Al que calculaba lo cancelaron: este pedido lo intenta por su cuenta
+        return make_response(calcular())
+    if lectura["error"] is not None:
+        raise lectura["error"]
+    with _lecturas_lock:
+        _estadisticas_lecturas["compartidas"] += 1
+    cuerpo, codigo, encabezados = lectura["respuesta"]
+    return app.response_class(cuerpo, status=codigo, headers=encabezados)
+
+
+def respuesta_cacheada(ruta, etag):
+    """Respuesta guardada de la ruta si es de esta versión (None si no hay)"""
+    with _cache_lock:
+        entrada = _cache_respuestas.get(ruta)
+        contadores = _estadisticas_cache[request.endpoint]
+        if entrada is None or entrada[0] != etag:
+            contadores["fallos"] += 1
+            return None
+        _cache_respuestas.move_to_end(ruta)
+        contadores["aciertos"] += 1
+    _, cuerpo, codigo, encabezados = entrada
+    return app.response_class(cuerpo, status=codigo, headers=encabezados)
+
+
+def guardar_respuesta_cacheada(ruta, etag, respuesta):
+    """Guarda la respuesta serializada de la ruta para esta versión"""
+    with _cache_lock:
+        _cache_respuestas[ruta] = (etag, respuesta.get_data(), respuesta.status_code, list(respuesta.headers))
+        _cache_respuestas.move_to_end(ruta)
+        while len(_cache_respuestas) > MAX_CACHE_RESPUESTAS:
+            _cache_respuestas.popitem(last=False)
+
+
+def estadisticas_cache():
+    """Aciertos y fallos del cache de respuestas, en total y por endpoint"""
+    with _cache_lock:
+        por_endpoint = {endpoint: dict(c) for endpoint, c in _estadisticas_cache.items()}
+        entradas = len(_cache_respuestas)
+        tamano = sum(len(entrada[1]) for entrada in _cache_respuestas.values())
+    aciertos = sum(c["aciertos"] for c in por_endpoint.values())
+    fallos = sum(c["fallos"] for c in por_endpoint.values())
+    return {
+        "aciertos": aciertos,
+        "fallos": fallos,
+        "tasa_aciertos": round(aciertos / (aciertos + fallos), 3) if aciertos + fallos else None,
+        "entradas": entradas,
+        "bytes": tamano,
+        "por_endpoint": por_endpoint
+    }
+
+
+def respuesta_condicional(*alcances, cache=False):
+    """
+    Decorador de endpoints GET: agrega el ETag según la versión de los
+    datos y responde 304 (sin ejecutar el endpoint) si el cliente ya la tiene.
+    Pedidos iguales simultáneos para la misma versión se calculan una sola vez
+    (leer_una_vez). Con cache=True además se guarda el JSON ya serializado de
+    cada versión y mientras no cambie se responde con esos bytes. Los alcances
+    pueden usar los parámetros de la ruta, p. ej. "mes:{mes}".
+    """
+    from functools import wraps
+    def decorador(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            alcances_pedido = [a.format(**kwargs) for a in alcances]
+            etag = version_datos(alcances_pedido)
+            ruta = (request.path, request.query_string)
+            
+            if not is_resource_modified(request.environ, etag=etag):
+                respuesta = app.response_class(status=304)
+            else:
+                respuesta = respuesta_cacheada(ruta, etag) if cache else None
+                if respuesta is None:
+                    respuesta = leer_una_vez(ruta + (etag,), lambda: f(*args, **kwargs))
+                    if respuesta.status_code != 200:
+                        return respuesta
+                    # Si los datos cambiaron mientras se calculaba, la respuesta
+                    # puede ser de otra versión: no se guarda
+                    if cache and version_datos(alcances_pedido) == etag:
+                        guardar_respuesta_cacheada(ruta, etag, respuesta)
+            
+            respuesta.set_etag(etag)
+            respuesta.cache_control.no_cache = True  # El navegador siempre revalida
+            return respuesta
+        return decorated
+    return decorador
+
+
+# ============================================================================
+# TRABAJOS EN SEGUNDO PLANO
+# ============================================================================
+# Las operaciones pesadas (distribuciones, cuotas, reportes anuales) se pueden
+# encolar en vez de esperarlas en el request: un pool de hilos del proceso las
+# ejecuta corriendo el mismo endpoint con los parámetros y la sesión de quien
+# la pidió, y guarda la respuesta para consultarla después. La cola tiene un
+# tope (MAX_COLA_TRABAJOS); con la cola llena se responde 503.
+#
+# Los trabajos viven en memoria del proceso: con varios workers de gunicorn la
+# consulta tiene que llegar al mismo proceso que lo recibió. Por eso la API es
+# opcional y la interfaz web sigue llamando a los endpoints directamente.
+
+TRABAJADORES = int(os.environ.get('GUARDIAS_TRABAJADORES', '2'))
+MAX_COLA_TRABAJOS = int(os.environ.get('GUARDIAS_MAX_COLA_TRABAJOS', '20'))
+MAX_TRABAJOS_GUARDADOS = 100   # Terminados que se conservan para consultar el resultado
+
+# Operaciones que se pueden encolar: tipo -> (método HTTP, ruta del endpoint)
+TIPOS_TRABAJO = {
+    "distribucion_auto": ("POST", "/api/distribucion/auto/{mes}"),
+    "distribucion_balancear": ("POST", "/api/distribucion/balancear/{mes}"),
+    "distribucion_rebalancear": ("POST", "/api/distribucion/rebalancear/{mes}"),
+    "distribucion_anual": ("POST", "/api/distribucion/anual"),
+    "cuotas_sugeridas": ("GET", "/api/cuotas/sugeridas/{mes}"),
+    "reporte_anual": ("GET", "/api/reporte/anual"),
+    "reporte_anual_detalle": ("GET", "/api/reporte/anual/detalle")
+}
+
+ESTADOS_FINALES = ("terminado", "error", "cancelado")
+
+_trabajos = {}                  # {id: trabajo}, en orden de creación
+_cola_trabajos = deque()        # ids en estado "en_cola"
+_trabajos_cond = threading.Condition()
+_hilos_trabajos = []
+_trabajo_local = threading.local()
+
+
+class TrabajoCancelado(BaseException):
+    """
+    Se pidió cancelar el trabajo que está corriendo en este hilo. Hereda de
+    BaseException para que el `except Exception` de los endpoints no la
+    convierta en un error 500: sube hasta _bucle_trabajador.
+    """
+
+
+class ColaTrabajosLlena(Exception):
+    """La cola de trabajos alcanzó MAX_COLA_TRABAJOS"""
+
+
+def informar_progreso(avance, etapa=None):
+    """
+    Registra el avance (0 a 1) del trabajo que corre en este hilo. También es el
+    punto donde se atiende la cancelación: si se pidió, lanza TrabajoCancelado.
+    Fuera de un trabajo no hace nada.
+    """
+    trabajo = getattr(_trabajo_local, "trabajo", None)
+    if trabajo is None:
+        return
+    if trabajo["cancelar"].is_set():
+        raise TrabajoCancelado("Trabajo cancelado")
+    with _trabajos_cond:
+        trabajo["progreso"] = round(max(trabajo["progreso"], min(avance, 1.0)), 2)
+        if etapa:
+            trabajo["etapa"] = etapa
+
+
+def marcar_trabajo_guardado():
+    """
+    Anota que el trabajo que corre en este hilo ya persistió cambios: desde ahí
+    una cancelación pedida no puede deshacerlos y el trabajo termina normalmente.
+    """
+    trabajo = getattr(_trabajo_local, "trabajo", None)
+    if trabajo is not None:
+        trabajo["guardado"] = True
+
+
+def en_trabajo():
+    """True si este hilo está corriendo un trabajo del pool (y no un request directo)"""
+    return getattr(_trabajo_local, "trabajo", None) is not None
+
+
+def resumen_trabajo(trabajo):
+    """Estado público de un trabajo (sin el resultado)"""
+    datos = {
+        campo: trabajo[campo]
+        for campo in ("id", "tipo", "mes", "estado", "progreso", "etapa", "creado", "iniciado", "terminado")
+    }
+    if trabajo["estado"] == "en_cola":
+        datos["posicion"] = _cola_trabajos.index(trabajo["id"]) + 1
+    if trabajo["estado"] in ("terminado", "error"):
+        datos["codigo"] = trabajo["codigo"]
+    return datos
+
+
+def encolar_trabajo(tipo, mes=None, parametros=None):
+    """
+    Encola una operación para el pool de hilos.
+    
+    Args:
+        tipo: Una clave de TIPOS_TRABAJO
+        mes: Mes de la ruta, si la ruta lo lleva
+        parametros: Body JSON (POST) o query string (GET) del endpoint
+    
+    Returns:
+        dict: El trabajo creado
+    
+    Raises:
+        ColaTrabajosLlena: Si ya hay MAX_COLA_TRABAJOS esperando
+    """
+    metodo, ruta = TIPOS_TRABAJO[tipo]
+    trabajo = {
+        "id": secrets.token_hex(8),
+        "tipo": tipo,
+        "mes": mes,
+        "metodo": metodo,
+        "ruta": ruta.format(mes=mes),
+        "parametros": parametros or {},
+        "sesion": {clave: session[clave] for clave in ('usuario_id', 'usuario_nombre') if clave in session},
+        "estado": "en_cola",
+        "progreso": 0.0,
+        "etapa": None,
+        "creado": datetime.now().isoformat(),
+        "iniciado": None,
+        "terminado": None,
+        "codigo": None,
+        "resultado": None,
+        "guardado": False,              # Ya persistió cambios (ver marcar_trabajo_guardado)
+        "cancelar": threading.Event()
+    }
+    with _trabajos_cond:
+        if len(_cola_trabajos) >= MAX_COLA_TRABAJOS:
+            raise ColaTrabajosLlena(f"Hay {len(_cola_trabajos)} trabajos en cola, reintentá en unos segundos")
+        _iniciar_hilos_trabajos()
+        _trabajos[trabajo["id"]] = trabajo
+        _cola_trabajos.append(trabajo["id"])
+        _descartar_trabajos_viejos()
+        _trabajos_cond.notify()
+    return trabajo
+
+
+def cancelar_trabajo(trabajo):
+    """
+    Cancela un trabajo: si está en cola no llega a correr; si está corriendo se
+    detiene en el próximo informar_progreso (antes de guardar nada), y si
+    termina sin haber guardado nada queda igual como cancelado. Un trabajo que
+    ya terminó no cambia.
+    """
+    with _trabajos_cond:
+        if trabajo["estado"] == "en_cola":
+            _cola_trabajos.remove(trabajo["id"])
+            trabajo.update({"estado": "cancelado", "terminado": datetime.now().isoformat()})
+        elif trabajo["estado"] == "ejecutando":
+            trabajo["cancelar"].set()
+
+
+def _descartar_trabajos_viejos():
+    """Olvida los trabajos terminados más viejos por encima de MAX_TRABAJOS_GUARDADOS"""
+    terminados = [id_ for id_, t in _trabajos.items() if t["estado"] in ESTADOS_FINALES]
+    for id_ in terminados[:max(0, len(terminados) - MAX_TRABAJOS_GUARDADOS)]:
+        del _trabajos[id_]
+
+
+def _ejecutar_trabajo(trabajo):
+    """Corre el endpoint del trabajo en un contexto de request propio"""
+    opciones = {"method": trabajo["metodo"]}
+    if trabajo["metodo"] == "GET":
+        opciones["query_string"] = trabajo["parametros"]
+    else:
+        opciones["json"] = trabajo["parametros"]
+    
+    with app.test_request_context(trabajo["ruta"], **opciones):
+        session.update(trabajo["sesion"])
+        respuesta = app.make_response(app.full_dispatch_request())
+        return respuesta.status_code, respuesta.get_json(silent=True)
+
+
+def _bucle_trabajador():
+    """Hilo del pool: toma trabajos de la cola y los ejecuta de a uno"""
+    while True:
+        with _trabajos_cond:
+            while not _cola_trabajos:
+                _trabajos_cond.wait()
+            trabajo = _trabajos[_cola_trabajos.popleft()]
+            trabajo.update({"estado": "ejecutando", "iniciado": datetime.now().isoformat()})
+        
+        _trabajo_local.trabajo = trabajo
+        try:
+            codigo, resultado = _ejecutar_trabajo(trabajo)
+            estado = "terminado" if codigo < 400 else "error"
+        except TrabajoCancelado:
+            codigo, resultado, estado = None, None, "cancelado"
+        except Exception as e:
+            traceback.print_exc()
+            codigo, resultado, estado = 500, {"error": str(e)}, "error"
+        finally:
+            _trabajo_local.trabajo = None
+        
+        # Cancelado después del último punto de control pero sin haber guardado nada
+        if trabajo["cancelar"].is_set() and not trabajo["guardado"]:
+            codigo, resultado, estado = None, None, "cancelado"
+        
+        with _trabajos_cond:
+            trabajo.update({
+                "estado": estado,
+                "progreso": 1.0 if estado == "terminado" else trabajo["progreso"],
+                "terminado": datetime.now().isoformat(),
+                "codigo": codigo,
+                "resultado": resultado
+            })
+            _descartar_trabajos_viejos()
+        print(f"⚙️  Trabajo {trabajo['id']} ({trabajo['tipo']}): {estado}")
+
 
-    usuarios[usuario_id] = {
-        "nombre": nombre,
-        "hash": hash_password(clave),
-        "creado": datetime.now().isoformat()
-    }
-    guardar_usuarios(usuarios)
+def _iniciar_hilos_trabajos():
+    """Arranca los hilos del pool la primera vez que se encola algo (con _trabajos_cond tomado)"""
+    _hilos_trabajos[:] = [hilo for hilo in _hilos_trabajos if hilo.is_alive()]
+    while len(_hilos_trabajos) < TRABAJADORES:
+        hilo = threading.Thread(target=_bucle_trabajador, name=f"trabajos-{len(_hilos_trabajos) + 1}", daemon=True)
+        hilo.start()
+        _hilos_trabajos.append(hilo)
 
-    session['usuario_id'] = usuario_id
-    session['usuario_nombre'] = nombre
 
-    return jsonify({
-        "success": True,
-        "usuario_id": usuario_id,
-        "nombre": nombre,
-        "mensaje": f"✅ Cuenta creada. Bienvenido, {nombre}"
-    })
+# ============================================================================
+# ENDPOINTS DE TRABAJOS
+# ============================================================================
 
+@app.route('/api/trabajos', methods=['POST'])
+def crear_trabajo():
+    """
+    Encola una operación pesada y responde enseguida con el id del trabajo.
+    
+    Body (JSON):
+        tipo: Una de TIPOS_TRABAJO (p. ej. "distribucion_auto")
+        mes: Para las operaciones de un mes
+        parametros: Lo que se mandaría al endpoint (body JSON o query string)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        tipo = data.get('tipo')
+        if tipo not in TIPOS_TRABAJO:
+            return jsonify({"error": f"Tipo de trabajo '{tipo}' no válido", "tipos": list(TIPOS_TRABAJO)}), 400
+        
+        mes = data.get('mes')
+        if "{mes}" in TIPOS_TRABAJO[tipo][1]:
+            if mes not in MESES:
+                return jsonify({"error": f"Mes '{mes}' no válido"}), 400
+        else:
+            mes = None
+        
+        parametros = data.get('parametros') or {}
+        if not isinstance(parametros, dict):
+            return jsonify({"error": "'parametros' tiene que ser un objeto"}), 400
+        
+        trabajo = encolar_trabajo(tipo, mes, parametros)
+        with _trabajos_cond:
+            resumen = resumen_trabajo(trabajo)
+        return jsonify(resumen), 202
+        
+    except ColaTrabajosLlena as e:
+        respuesta = jsonify({"error": str(e)})
+        respuesta.headers['Retry-After'] = '5'
+        return respuesta, 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-@app.route('/api/auth/logout', methods=['POST'])
-def auth_logout():
-    session.clear()
-    return jsonify({"success": True})
 
+@app.route('/api/trabajos')
+def listar_trabajos():
+    """Trabajos del proceso (en cola, corriendo y los últimos terminados)"""
+    try:
+        with _trabajos_cond:
+            trabajos = [resumen_trabajo(t) for t in _trabajos.values()]
+        return jsonify({
+            "en_cola": sum(1 for t in trabajos if t["estado"] == "en_cola"),
+            "ejecutando": sum(1 for t in trabajos if t["estado"] == "ejecutando"),
+            "max_cola": MAX_COLA_TRABAJOS,
+            "trabajos": trabajos
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-@app.route('/api/auth/cambiar-clave', methods=['POST'])
-@login_requerido
-def auth_cambiar_clave():
-    data = request.json or {}
-    clave_actual = data.get('clave_actual', '').strip()
-    clave_nueva = data.get('clave_nueva', '').strip()
-    clave_confirm = data.get('clave_confirm', '').strip()
 
-    if not all([clave_actual, clave_nueva, clave_confirm]):
-        return jsonify({"error": "Completá todos los campos"}), 400
-    if len(clave_nueva) < 4:
-        return jsonify({"error": "La nueva contraseña debe tener al menos 4 caracteres"}), 400
-    if clave_nueva != clave_confirm:
-        return jsonify({"error": "Las contraseñas nuevas no coinciden"}), 400
+@app.route('/api/trabajos/<id_trabajo>')
+def estado_trabajo(id_trabajo):
+    """Estado y progreso de un trabajo"""
+    try:
+        with _trabajos_cond:
+            trabajo = _trabajos.get(id_trabajo)
+            if trabajo is None:
+                return jsonify({"error": "Trabajo no encontrado"}), 404
+            return jsonify(resumen_trabajo(trabajo))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    uid = session['usuario_id']
-    usuarios = cargar_usuarios()
 
-    if usuarios[uid]['hash'] != hash_password(clave_actual):
-        return jsonify({"error": "Contraseña actual incorrecta"}), 401
+@app.route('/api/trabajos/<id_trabajo>/resultado')
+def resultado_trabajo(id_trabajo):
+    """
+    Respuesta del endpoint que corrió el trabajo, con su mismo código HTTP.
+    Mientras no terminó responde 202 con el estado.
+    """
+    try:
+        with _trabajos_cond:
+            trabajo = _trabajos.get(id_trabajo)
+            if trabajo is None:
+                return jsonify({"error": "Trabajo no encontrado"}), 404
+            if trabajo["estado"] == "cancelado":
+                return jsonify({"error": "Trabajo cancelado", "trabajo": resumen_trabajo(trabajo)}), 409
+            if trabajo["estado"] not in ESTADOS_FINALES:
+                return jsonify(resumen_trabajo(trabajo)), 202
+            return jsonify(trabajo["resultado"]), trabajo["codigo"]
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    usuarios[uid]['hash'] = hash_password(clave_nueva)
-    usuarios[uid]['modificado'] = datetime.now().isoformat()
-    guardar_usuarios(usuarios)
 
-    return jsonify({"success": True, "mensaje": "✅ Contraseña actualizada"})
+@app.route('/api/trabajos/<id_trabajo>', methods=['DELETE'])
+def cancelar_trabajo_endpoint(id_trabajo):
+    """Cancela un trabajo en cola o en ejecución"""
+    try:
+        with _trabajos_cond:
+            trabajo = _trabajos.get(id_trabajo)
+            if trabajo is None:
+                return jsonify({"error": "Trabajo no encontrado"}), 404
+            cancelar_trabajo(trabajo)
+            return jsonify({"success": True, "trabajo": resumen_trabajo(trabajo)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 # ============================================================================
@@ -836,72 +4224,306 @@ def regenerar_calendario():
 
 
 @app.route('/api/disponibilidad', methods=['GET'])
+@respuesta_condicional("disponibilidad", "hoy", cache=True)
 def get_disponibilidad():
     """Obtiene el estado completo de disponibilidad"""
     try:
-        disponibilidad = cargar_disponibilidad()
-        
-        # Enriquecer con información de estado
-        for persona in disponibilidad:
-            disponibilidad[persona]['disponible_hoy'] = persona_disponible(persona)
-            disponibilidad[persona]['orden'] = PERSONA_ORDEN.get(persona, 99)
-            disponibilidad[persona]['rina'] = PERSONA_RINA.get(persona)
-        
-        return jsonify(disponibilidad)
+        return jsonify(disponibilidad_con_estado())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def disponibilidad_con_estado():
+    """Disponibilidad de cada persona con su estado de hoy, orden de llenado y RINA"""
+    disponibilidad = {persona: resumen_disponibilidad(persona) for persona in cargar_disponibilidad()}
+    
+    # Enriquecer con información de estado
+    for persona in disponibilidad:
+        disponibilidad[persona]['disponible_hoy'] = persona_disponible(persona)
+        disponibilidad[persona]['orden'] = PERSONA_ORDEN.get(persona, 99)
+        disponibilidad[persona]['rina'] = PERSONA_RINA.get(persona)
+    
+    return disponibilidad
+
+
 @app.route('/api/disponibilidad/<persona>', methods=['PUT'])
 def update_disponibilidad(persona):
-    """Actualiza la disponibilidad de una persona"""
+    """
+    Actualiza la disponibilidad de una persona.
+    
+    Body:
+        activo=False con desde/hasta/motivo: agrega una ventana de inactividad
+        activo=True: quita las ventanas que cubren hoy (las futuras quedan)
+        inactividades=[{desde, hasta, motivo}]: reemplaza la lista completa
+    
+    Si con el cambio quedan guardias suyas en días en que ya no está disponible,
+    la respuesta incluye en "reparacion" los reemplazos propuestos. Con
+    "reparar": "aplicar" en el body se guardan; con "no" no se calculan.
+    """
     try:
         if persona not in PERSONAS:
             return jsonify({"error": "Persona no encontrada"}), 404
         
         data = request.json
-        disponibilidad = cargar_disponibilidad()
+        reparar = data.get('reparar', 'proponer')
+        if reparar not in ('proponer', 'aplicar', 'no'):
+            return jsonify({"error": "reparar debe ser 'proponer', 'aplicar' o 'no'"}), 400
+        
+        try:
+            if 'inactividades' in data:
+                ventanas = [validar_ventana_inactividad(v) for v in data['inactividades'] or []]
+                nueva = None
+            elif 'activo' in data:
+                ventanas = None
+                nueva = None if data['activo'] else validar_ventana_inactividad(data)
+            else:
+                return jsonify({"error": "Indicar activo o inactividades"}), 400
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Actualizar campos
-        disponibilidad[persona]['activo'] = data.get('activo', disponibilidad[persona]['activo'])
-        disponibilidad[persona]['motivo'] = data.get('motivo')
-        disponibilidad[persona]['desde'] = data.get('desde')
-        disponibilidad[persona]['hasta'] = data.get('hasta')
+        with bloqueo_entre_procesos("disponibilidad"):
+            disponibilidad = cargar_disponibilidad()
+            disponible_antes = disponibilidad_en_anio(persona)
+            
+            registro = disponibilidad.setdefault(persona, {"inactividades": []})
+            anteriores = list(registro['inactividades'])
+            if ventanas is not None:
+                registro['inactividades'] = ventanas
+            elif nueva is None:
+                hoy = date.today().isoformat()
+                registro['inactividades'] = [
+                    v for v in anteriores
+                    if not (v['desde'] or "") <= hoy <= (v['hasta'] or "9999-12-31")
+                ]
+            else:
+                registro['inactividades'].append(nueva)
+            quitadas = [v for v in anteriores if v not in registro['inactividades']]
+            
+            guardar_disponibilidad(disponibilidad)
         
-        guardar_disponibilidad(disponibilidad)
+        resumen = resumen_disponibilidad(persona)
         
         # Registrar en historial
         registrar_en_historial({
             "accion": "cambio_disponibilidad",
             "persona": persona,
-            "activo": disponibilidad[persona]['activo'],
-            "motivo": disponibilidad[persona]['motivo'],
-            "desde": disponibilidad[persona]['desde'],
-            "hasta": disponibilidad[persona]['hasta']
+            "activo": resumen['activo'],
+            "motivo": nueva['motivo'] if nueva else resumen['motivo'],
+            "desde": nueva['desde'] if nueva else resumen['desde'],
+            "hasta": nueva['hasta'] if nueva else resumen['hasta'],
+            "quitadas": quitadas,
+            "inactividades": resumen['inactividades']
         })
         
+        # Guardias que quedaron en conflicto (solo días que dejaron de estar disponibles).
+        # La disponibilidad ya quedó guardada: si aplicar los reemplazos choca con
+        # otro cambio se informa en "reparacion" sin que falle todo el pedido.
+        reparacion = None
+        if reparar != 'no':
+            conflictos = conflictos_por_cambio(persona, disponible_antes, disponibilidad_en_anio(persona))
+            if conflictos:
+                try:
+                    reparacion = reparar_conflictos(conflictos, aplicar=(reparar == 'aplicar'))
+                    reparacion["aplicado"] = reparar == 'aplicar'
+                except ConflictoAsignacion as e:
+                    reparacion = dict(e.respuesta(), aplicado=False)
+        
         return jsonify({
             "success": True,
             "mensaje": f"✓ Disponibilidad actualizada para {persona}",
-            "disponibilidad": disponibilidad[persona]
+            "disponibilidad": resumen,
+            "reparacion": reparacion
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/disponibilidad/<persona>/inactividades', methods=['DELETE'])
+def eliminar_inactividad(persona):
+    """
+    Quita una ventana de inactividad de la persona.
+    
+    Body (JSON): {desde, hasta, motivo} de la ventana tal como se mostró. Si ya
+    no existe (otro usuario la cambió o la quitó) responde 409 sin tocar nada.
+    """
+    try:
+        if persona not in PERSONAS:
+            return jsonify({"error": "Persona no encontrada"}), 404
+        
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Indicar la ventana {desde, hasta, motivo}"}), 400
+        try:
+            buscada = validar_ventana_inactividad(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        with bloqueo_entre_procesos("disponibilidad"):
+            disponibilidad = cargar_disponibilidad()
+            ventanas = disponibilidad.get(persona, {}).get('inactividades', [])
+            if buscada not in ventanas:
+                return jsonify({
+                    "error": "conflicto",
+                    "mensaje": "⚠️ Ese período de inactividad ya no existe (otro usuario lo cambió). Recargá e intentá de nuevo.",
+                    "inactividades": ventanas
+                }), 409
+            ventanas.remove(buscada)
+            quitada = buscada
+            guardar_disponibilidad(disponibilidad)
+        
+        resumen = resumen_disponibilidad(persona)
+        
+        registrar_en_historial({
+            "accion": "cambio_disponibilidad",
+            "persona": persona,
+            "activo": resumen['activo'],
+            "quitada": quitada,
+            "inactividades": resumen['inactividades']
+        })
+        
+        return jsonify({
+            "success": True,
+            "mensaje": f"✓ Ventana de inactividad quitada para {persona}",
+            "disponibilidad": resumen
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/disponibilidad/inactividades')
+@respuesta_condicional("disponibilidad")
+def get_inactividades():
+    """
+    Ventanas de inactividad que se superponen con un rango (desde/hasta,
+    YYYY-MM-DD; por defecto todo el año), de todos o de una persona.
+    """
+    try:
+        desde = _fecha_a_date(request.args.get('desde') or INICIO_ANIO)
+        hasta = _fecha_a_date(request.args.get('hasta') or (INICIO_ANIO + timedelta(days=DIAS_ANIO - 1)))
+        if desde is None or hasta is None:
+            return jsonify({"error": "Fechas con formato YYYY-MM-DD"}), 400
+        if hasta < desde:
+            return jsonify({"error": "'hasta' es anterior a 'desde'"}), 400
+        
+        persona = request.args.get('persona')
+        if persona is not None and persona not in PERSONAS:
+            return jsonify({"error": "Persona no encontrada"}), 404
+        
+        ventanas = inactividades_en_rango(desde, hasta, persona)
+        return jsonify({
+            "desde": desde.strftime("%Y-%m-%d"),
+            "hasta": hasta.strftime("%Y-%m-%d"),
+            "total": len(ventanas),
+            "inactividades": ventanas
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/conflictos')
+@respuesta_condicional("calendario", "disponibilidad")
+def get_conflictos():
+    """
+    Guardias de todo el año asignadas a alguien que ese día no está disponible,
+    con totales por mes y por persona (filtros opcionales: mes, persona).
+    """
+    try:
+        if not existe_calendario():
+            return jsonify({"error": "Archivo no encontrado"}), 404
+        
+        mes = request.args.get('mes')
+        if mes is not None and mes not in MESES:
+            return jsonify({"error": "Mes no válido"}), 400
+        persona = request.args.get('persona')
+        if persona is not None and persona not in PERSONAS:
+            return jsonify({"error": "Persona no encontrada"}), 404
+        
+        resultado = conflictos_del_anio()
+        conflictos = [
+            c for c in resultado["conflictos"]
+            if (mes is None or c["mes"] == mes) and (persona is None or c["persona"] == persona)
+        ]
+        return jsonify({
+            "total": len(conflictos),
+            "por_mes": resultado["por_mes"],
+            "por_persona": resultado["por_persona"],
+            "conflictos": conflictos
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/conflictos/reparar', methods=['POST'])
+def reparar_conflictos_endpoint():
+    """
+    Busca reemplazos para las guardias asignadas a alguien no disponible ese día.
+    
+    Body (JSON, todo opcional):
+        persona: Solo los conflictos de esta persona (por defecto todas)
+        conflictos: [{mes, dia}] para limitarse a esos días (p. ej. los de una propuesta)
+        aplicar: Si es True guarda los reemplazos; por defecto solo los propone
+        metodo / tiempo: Como en /api/distribucion/auto
+    """
+    try:
+        if not existe_calendario():
+            return jsonify({"error": "Archivo no encontrado"}), 404
+        
+        data = request.get_json(silent=True) or {}
+        aplicar = bool(data.get('aplicar', False))
+        metodo, tiempo = parametros_planificacion(data)
+        if metodo not in METODOS_PLANIFICACION:
+            return jsonify({"error": f"Método '{metodo}' no válido (greedy, local o exacto)"}), 400
+        
+        persona = data.get('persona')
+        if persona is not None and persona not in PERSONAS:
+            return jsonify({"error": "Persona no encontrada"}), 404
+        
+        conflictos = [
+            (c["mes"], c["dia"]) for c in conflictos_del_anio()["conflictos"]
+            if persona is None or c["persona"] == persona
+        ]
+        if data.get('conflictos') is not None:
+            if not isinstance(data['conflictos'], list) or not all(isinstance(c, dict) for c in data['conflictos']):
+                return jsonify({"error": "'conflictos' tiene que ser una lista de {mes, dia}"}), 400
+            pedidos = {(c.get('mes'), c.get('dia')) for c in data['conflictos']}
+            conflictos = [c for c in conflictos if c in pedidos]
+        
+        reparacion = reparar_conflictos(conflictos, aplicar=aplicar, metodo=metodo, tiempo=tiempo)
+        
+        return jsonify({
+            "success": True,
+            "mensaje": f"✓ {len(reparacion['propuesta'])} de {len(conflictos)} conflictos "
+                       f"{'reparados' if aplicar else 'con reemplazo propuesto'}",
+            "conflictos": len(conflictos),
+            "aplicado": aplicar,
+            "propuesta": reparacion["propuesta"],
+            "sin_reemplazo": reparacion["sin_reemplazo"]
         })
         
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/personas/activas')
 def get_personas_activas():
-    """Lista personas activas (con opción de filtrar por fecha)"""
+    """Lista personas activas en una fecha (?fecha=YYYY-MM-DD, por defecto hoy)"""
     try:
-        fecha = request.args.get('fecha')  # Formato: YYYY-MM-DD
+        fecha_obj = _fecha_a_date(request.args.get('fecha') or date.today())
+        if fecha_obj is None:
+            return jsonify({"error": "Fecha con formato YYYY-MM-DD"}), 400
+        fecha = fecha_obj.isoformat()
         activas = obtener_personas_activas(fecha)
         
-        disponibilidad = cargar_disponibilidad()
         resultado = []
         
         for persona in activas:
-            info = disponibilidad.get(persona, {})
+            info = resumen_disponibilidad(persona, fecha)
             resultado.append({
                 "nombre": persona,
                 "activo": info.get('activo', True),
@@ -913,7 +4535,7 @@ def get_personas_activas():
             })
         
         return jsonify({
-            "fecha": fecha or "general",
+            "fecha": fecha,
             "total": len(resultado),
             "personas": resultado
         })
@@ -922,6 +4544,75 @@ def get_personas_activas():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/disponibilidad/matriz')
+@respuesta_condicional("disponibilidad")
+def get_matriz_disponibilidad():
+    """
+    Disponibilidad de varias personas en un rango de fechas, en un solo pedido.
+    
+    Parámetros: desde y hasta (YYYY-MM-DD) o mes (nombre, todo el mes), y
+    opcionalmente personas (separadas por coma; por defecto todas).
+    
+    Cada persona tiene un string con un carácter por fecha ("1" disponible,
+    "0" no), y para las que no están disponibles algún día, las ventanas de
+    inactividad del rango y el motivo del primer día no disponible.
+    """
+    try:
+        mes = request.args.get('mes')
+        if mes:
+            if mes not in MAP_MESES:
+                return jsonify({"error": f"Mes '{mes}' no válido"}), 400
+            mes_num = MAP_MESES[mes]
+            desde = date(2026, mes_num, 1)
+            hasta = (date(2026, mes_num + 1, 1) if mes_num < 12 else date(2027, 1, 1)) - timedelta(days=1)
+        else:
+            desde = _fecha_a_date(request.args.get('desde'))
+            hasta = _fecha_a_date(request.args.get('hasta') or request.args.get('desde'))
+            if desde is None or hasta is None:
+                return jsonify({"error": "Indicar mes o desde/hasta con formato YYYY-MM-DD"}), 400
+        
+        if hasta < desde:
+            return jsonify({"error": "'hasta' es anterior a 'desde'"}), 400
+        if (hasta - desde).days >= 366:
+            return jsonify({"error": "El rango no puede superar un año"}), 400
+        
+        personas = [p.strip() for p in request.args.get('personas', '').split(',') if p.strip()]
+        desconocidas = [p for p in personas if p not in PERSONAS]
+        if desconocidas:
+            return jsonify({"error": f"Personas no encontradas: {', '.join(desconocidas)}"}), 400
+        
+        fechas, matriz = matriz_disponibilidad(desde, hasta, personas)
+        
+        motivos = {}
+        indices = motor_disponibilidad()["indices"]
+        for persona, columna in matriz.items():
+            if not all(columna):
+                # motivo/desde/hasta (formato anterior) son los de la ventana que
+                # cubre el primer día no disponible; todas van en "ventanas"
+                ventana = indices[persona].ventana_en(fechas[columna.index(False)])
+                motivos[persona] = {
+                    "motivo": ventana['motivo'] or 'No especificado',
+                    "desde": ventana['desde'],
+                    "hasta": ventana['hasta'],
+                    "ventanas": inactividades_en_rango(desde, hasta, persona)
+                }
+        
+        return jsonify({
+            "desde": desde.strftime("%Y-%m-%d"),
+            "hasta": hasta.strftime("%Y-%m-%d"),
+            "dias": len(fechas),
+            "personas": list(matriz),
+            "disponible": {
+                persona: "".join("1" if disponible else "0" for disponible in columna)
+                for persona, columna in matriz.items()
+            },
+            "motivos": motivos
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/validar-asignacion', methods=['POST'])
 def validar_asignacion():
     """Valida si una persona puede ser asignada a una fecha específica"""
@@ -972,15 +4663,14 @@ def validar_asignacion():
 
 
 @app.route('/api/calendario')
+@respuesta_condicional("calendario", "disponibilidad", "hoy")
 def get_calendario():
     """Endpoint mejorado que incluye información de disponibilidad"""
     try:
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
-        meses_disponibles = [hoja for hoja in wb.sheetnames if hoja in MESES]
-        wb.close()
+        meses_disponibles = meses_en_calendario()
         
         # Incluir información de personas activas
         personas_activas = obtener_personas_activas()
@@ -997,65 +4687,54 @@ def get_calendario():
         return jsonify({"error": str(e)}), 500
 
 
+def resumen_mes(mes, dias):
+    """Respuesta de /api/mes/<mes>: días (con disponibilidad) y estadísticas del mes"""
+    # Contar estadísticas
+    total_dias = len(dias)
+    asignados = sum(1 for d in dias.values() if d.get('persona'))
+    pendientes = total_dias - asignados
+    
+    # Contar conflictos de disponibilidad
+    conflictos = sum(1 for d in dias.values() if d.get('persona') and not d.get('disponible'))
+    
+    # Contar por tipo
+    tipos = {"habil": 0, "vispera": 0, "feriado": 0}
+    for dia_info in dias.values():
+        tipos[dia_info['tipo']] += 1
+    
+    return {
+        "mes": mes,
+        "dias": dias,
+        "estadisticas": {
+            "total": total_dias,
+            "asignados": asignados,
+            "pendientes": pendientes,
+            "conflictos": conflictos,
+            "habiles": tipos.get("habil", 0),
+            "visperas": tipos.get("vispera", 0),
+            "feriados": tipos.get("feriado", 0)
+        }
+    }
+
+
 @app.route('/api/mes/<mes>')
+@respuesta_condicional("mes:{mes}", "disponibilidad", cache=True)
 def get_mes(mes):
     """Endpoint mejorado con validación de disponibilidad"""
     try:
         if mes not in MESES:
             return jsonify({"error": f"Mes '{mes}' no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        print(f"\n📅 Cargando mes: {mes}")
-        
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes)
         
-        if mes not in wb.sheetnames:
-            wb.close()
-            print(f"❌ Mes '{mes}' no encontrado en hojas: {wb.sheetnames}")
+        if dias is None:
+            print(f"❌ Mes '{mes}' no encontrado en hojas: {meses_en_calendario()}")
             return jsonify({"error": f"Mes '{mes}' no encontrado en el archivo"}), 404
         
-        hoja = wb[mes]
-        print(f"✓ Hoja '{mes}' encontrada")
-        
-        # Debug: mostrar primeras celdas
-        print(f"  Fila 1: {[hoja.cell(1, c).value for c in range(1, 8)]}")
-        print(f"  Fila 2: {[hoja.cell(2, c).value for c in range(1, 8)]}")
-        
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
-        wb.close()
-        
-        print(f"✓ Días detectados: {len(dias)}")
-        if len(dias) > 0:
-            print(f"  Ejemplo - Día 1: {dias.get(1, 'No encontrado')}")
-        
-        # Contar estadísticas
-        total_dias = len(dias)
-        asignados = sum(1 for d in dias.values() if d.get('persona'))
-        pendientes = total_dias - asignados
-        
-        # Contar conflictos de disponibilidad
-        conflictos = sum(1 for d in dias.values() if d.get('persona') and not d.get('disponible'))
-        
-        # Contar por tipo
-        tipos = {"habil": 0, "vispera": 0, "feriado": 0}
-        for dia_info in dias.values():
-            tipos[dia_info['tipo']] += 1
-        
-        return jsonify({
-            "mes": mes,
-            "dias": dias,
-            "estadisticas": {
-                "total": total_dias,
-                "asignados": asignados,
-                "pendientes": pendientes,
-                "conflictos": conflictos,
-                "habiles": tipos.get("habil", 0),
-                "visperas": tipos.get("vispera", 0),
-                "feriados": tipos.get("feriado", 0)
-            }
-        })
+        return jsonify(resumen_mes(mes, dias))
     except Exception as e:
         import traceback
         error_detail = traceback.format_exc()
@@ -1111,29 +4790,25 @@ def asignar_guardia():
                 }), 400
         
         # Continuar con asignación normal
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes, con_disponibilidad=False)
         
-        if mes not in wb.sheetnames:
-            wb.close()
+        if dias is None:
             return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
         
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
-        
         if dia not in dias:
-            wb.close()
             return jsonify({"error": "Día no encontrado"}), 404
         
-        celda_ref = dias[dia]['celda_ref']
         persona_anterior = dias[dia].get('persona')
         
+        # Compare-and-set: 'esperado' es quién cree el cliente que tiene el día
+        # (null = vacío). Sin 'esperado' se compara contra lo leído recién.
+        esperado = data['esperado'] if 'esperado' in data else persona_anterior
+        
         # Escribir en Excel
-        hoja[celda_ref] = persona
-        wb.save(EXCEL_FILE)
-        wb.close()
+        guardar_asignaciones(mes, {dia: persona}, esperado={dia: esperado})
         
         # Registrar en historial
         registrar_en_historial({
@@ -1146,17 +4821,143 @@ def asignar_guardia():
             "forzado": forzar and not persona_disponible(persona, fecha_str)
         })
         
-        mensaje = f"✓ Guardia asignada: {persona} el día {dia} de {mes}"
-        if forzar:
-            mensaje += " (⚠️ FORZADO - persona no disponible)"
+        mensaje = f"✓ Guardia asignada: {persona} el día {dia} de {mes}"
+        if forzar:
+            mensaje += " (⚠️ FORZADO - persona no disponible)"
+        
+        return jsonify({
+            "success": True,
+            "mensaje": mensaje,
+            "dia": dia,
+            "persona": persona,
+            "anterior": persona_anterior,
+            "forzado": forzar
+        })
+        
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/asignar/lote', methods=['POST'])
+@login_requerido
+def asignar_guardias_lote():
+    """
+    Asigna varias guardias de una vez, todo o nada.
+    
+    Body: {"operaciones": [{"mes", "dia", "persona", "forzar"?, "esperado"?}, ...]}
+    
+    Primero se validan todas (parámetros, permisos, disponibilidad, días
+    repetidos); si alguna falla no se aplica ninguna y se responde 400 con el
+    resultado de cada una. Si todas son válidas se guardan en una sola escritura
+    y se registra un único evento en el historial.
+    """
+    try:
+        data = request.json or {}
+        operaciones = data.get('operaciones')
+        
+        if not isinstance(operaciones, list) or not operaciones:
+            return jsonify({"error": "Falta la lista 'operaciones'"}), 400
+        if len(operaciones) > DIAS_ANIO:
+            return jsonify({"error": f"Máximo {DIAS_ANIO} operaciones por lote"}), 400
+        
+        if not existe_calendario():
+            return jsonify({"error": "Archivo no encontrado"}), 404
+        
+        usuario = session.get('usuario_nombre', 'desconocido')
+        
+        with _modelo_lock:
+            asegurar_modelo_calendario()
+            meses_modelo = _modelo_calendario["meses"]
+            
+            # Validar todo en una pasada
+            resultados = []
+            cambios_por_mes = defaultdict(dict)
+            esperado_por_mes = defaultdict(dict)
+            for indice, op in enumerate(operaciones):
+                op = op if isinstance(op, dict) else {}
+                mes = op.get('mes')
+                dia = op.get('dia')
+                persona = op.get('persona')
+                forzar = bool(op.get('forzar', False))
+                resultado = {"indice": indice, "mes": mes, "dia": dia, "persona": persona, "ok": False}
+                resultados.append(resultado)
+                
+                if not all([mes, dia, persona]):
+                    resultado["error"] = "Faltan parámetros"
+                    continue
+                if mes not in MESES or persona not in PERSONAS:
+                    resultado["error"] = "Mes o persona no válidos"
+                    continue
+                if not puede_modificar_persona(persona):
+                    resultado["error"] = "sin_permiso"
+                    resultado["mensaje"] = f"Solo podés asignarte a vos mismo ({usuario})"
+                    continue
+                try:
+                    fecha_str = date(2026, MAP_MESES[mes], dia).strftime("%Y-%m-%d")
+                except (ValueError, TypeError):
+                    resultado["error"] = "Día no válido"
+                    continue
+                if mes not in meses_modelo or dia not in meses_modelo[mes]:
+                    resultado["error"] = "Día no encontrado"
+                    continue
+                if dia in cambios_por_mes[mes]:
+                    resultado["error"] = "Día repetido en el lote"
+                    continue
+                
+                disponible = persona_disponible(persona, fecha_str)
+                if not disponible and not forzar:
+                    resultado["error"] = "persona_no_disponible"
+                    resultado["mensaje"] = f"⚠️ {persona} no está disponible el {fecha_str}"
+                    resultado["motivo"] = get_motivo_indisponibilidad(persona, fecha_str)
+                    continue
+                
+                anterior = meses_modelo[mes][dia].get('persona')
+                cambios_por_mes[mes][dia] = persona
+                esperado_por_mes[mes][dia] = op['esperado'] if 'esperado' in op else anterior
+                resultado.update({"ok": True, "anterior": anterior, "forzado": not disponible})
+        
+        errores = sum(1 for r in resultados if not r["ok"])
+        if errores:
+            return jsonify({
+                "error": "lote_invalido",
+                "mensaje": f"⚠️ {errores} de {len(resultados)} operaciones no son válidas; no se aplicó ninguna",
+                "resultados": resultados
+            }), 400
+        
+        # Aplicar todo junto (compare-and-set contra lo validado)
+        try:
+            guardar_asignaciones_lote(dict(cambios_por_mes), dict(esperado_por_mes))
+        except ConflictoAsignacion as e:
+            respuesta = e.respuesta()
+            respuesta["resultados"] = resultados
+            return jsonify(respuesta), 409
+        
+        asignaciones = [
+            {
+                "mes": r["mes"],
+                "dia": r["dia"],
+                "antes": r["anterior"],
+                "despues": r["persona"],
+                "forzado": r["forzado"]
+            }
+            for r in resultados
+        ]
+        meses_lote = [mes for mes in MESES if mes in cambios_por_mes]
+        registrar_en_historial({
+            "accion": "asignar_lote",
+            "mes": meses_lote[0],
+            "meses": meses_lote,
+            "cambios": len(asignaciones),
+            "asignaciones": asignaciones,
+            "por": usuario
+        })
         
         return jsonify({
             "success": True,
-            "mensaje": mensaje,
-            "dia": dia,
-            "persona": persona,
-            "anterior": persona_anterior,
-            "forzado": forzar
+            "mensaje": f"✓ {len(asignaciones)} guardias asignadas",
+            "resultados": resultados
         })
         
     except Exception as e:
@@ -1170,7 +4971,7 @@ def sugerir_persona(mes, dia):
         if mes not in MESES:
             return jsonify({"error": f"Mes '{mes}' no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
         # Construir fecha para verificar disponibilidad
@@ -1181,12 +4982,8 @@ def sugerir_persona(mes, dia):
         except ValueError:
             return jsonify({"error": "Día no válido"}), 400
         
-        wb = load_workbook(EXCEL_FILE)
-        
         # Usar función mejorada que solo considera activos
-        sugerencia = sugerir_persona_para_dia_mejorado(wb, mes, dia)
-        
-        wb.close()
+        sugerencia = sugerir_persona_para_dia_mejorado(mes, dia)
         
         if sugerencia:
             # Verificar disponibilidad (doble check)
@@ -1213,15 +5010,13 @@ def sugerir_persona(mes, dia):
 def distribucion_planificada():
     """Distribución planificada con opción de incluir inactivos"""
     try:
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
         solo_activos = request.args.get('solo_activos', 'true').lower() == 'true'
         mes_especifico = request.args.get('mes')
         
-        wb = load_workbook(EXCEL_FILE)
-        distribucion = calcular_distribucion_planificada_mejorada(wb, solo_activos=solo_activos)
-        wb.close()
+        distribucion = calcular_distribucion_planificada_mejorada(solo_activos=solo_activos)
         
         if mes_especifico:
             if mes_especifico not in MESES:
@@ -1249,12 +5044,10 @@ def distribucion_planificada():
 def get_info():
     """Endpoint de información general del sistema"""
     try:
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo Excel no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
-        meses_disponibles = [hoja for hoja in wb.sheetnames if hoja in MESES]
-        wb.close()
+        meses_disponibles = meses_en_calendario()
         
         # Obtener información de disponibilidad
         activos = obtener_personas_activas()
@@ -1276,6 +5069,75 @@ def get_info():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/bootstrap')
+@respuesta_condicional("sesion", "calendario", "disponibilidad", "hoy")
+def bootstrap():
+    """
+    Todo lo que necesita la página al cargar, en una sola respuesta y de una misma
+    foto de los datos: sesión, personal, disponibilidad, meses, totales del año y
+    el mes actual (o el indicado con ?mes=).
+    """
+    if 'usuario_id' in session:
+        sesion = {
+            "autenticado": True,
+            "usuario_id": session['usuario_id'],
+            "nombre": session['usuario_nombre']
+        }
+    else:
+        # Sin sesión la página solo muestra el login
+        return jsonify({"sesion": {"autenticado": False}})
+    
+    try:
+        if not existe_calendario():
+            return jsonify({"error": "Archivo Excel no encontrado"}), 404
+        
+        # Los dos bloqueos a la vez: ninguna escritura de este proceso queda a medias en la respuesta
+        with _modelo_lock, _disponibilidad_lock:
+            meses_disponibles = meses_en_calendario()
+            activos = obtener_personas_activas()
+            disponibilidad = disponibilidad_con_estado()
+            
+            dias_totales = 0
+            dias_asignados = 0
+            for mes in meses_disponibles:
+                dias = _modelo_calendario["meses"][mes]
+                dias_totales += len(dias)
+                dias_asignados += sum(1 for d in dias.values() if d.get('persona'))
+            
+            mes_pedido = request.args.get('mes')
+            if mes_pedido is None:
+                hoy = date.today()
+                mes_pedido = MESES[hoy.month - 1] if hoy.year == 2026 else None
+            mes_actual = None
+            if mes_pedido in meses_disponibles:
+                mes_actual = resumen_mes(mes_pedido, obtener_dias_mes(mes_pedido))
+        
+        porcentaje_cobertura = round((dias_asignados / dias_totales * 100), 1) if dias_totales > 0 else 0
+        
+        return jsonify({
+            "sesion": sesion,
+            "info": {
+                "version": "4.0",
+                "personas": PERSONAS,
+                "personas_activas": activos,
+                "total_personas": len(PERSONAS),
+                "total_activas": len(activos),
+                "total_inactivas": len(PERSONAS) - len(activos)
+            },
+            "meses": meses_disponibles,
+            "disponibilidad": disponibilidad,
+            "totales": {
+                "dias_totales": dias_totales,
+                "dias_asignados": dias_asignados,
+                "dias_pendientes": dias_totales - dias_asignados,
+                "porcentaje_cobertura": f"{porcentaje_cobertura}"
+            },
+            "mes_actual": mes_actual
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/health')
 def health_check():
     """Health check mejorado"""
@@ -1285,11 +5147,14 @@ def health_check():
         "status": "ok",
         "version": "4.0 - Con Generador Integrado",
         "timestamp": datetime.now().isoformat(),
+        "almacenamiento": almacenamiento().nombre,
         "excel_exists": os.path.exists(EXCEL_FILE),
         "disponibilidad_exists": os.path.exists(DISPONIBILIDAD_FILE),
         "personas_total": len(PERSONAS),
         "personas_activas": len(activos),
         "personas_inactivas": len(PERSONAS) - len(activos),
+        "lecturas": dict(_estadisticas_lecturas),
+        "cache": estadisticas_cache(),
         "mejoras": [
             "✅ Generador de calendario integrado",
             "✅ Creación automática al iniciar",
@@ -1302,18 +5167,29 @@ def health_check():
 
 @app.route('/api/historial')
 def get_historial():
-    """Obtiene el historial de cambios"""
+    """
+    Obtiene el historial de cambios.
+    
+    Parámetros opcionales (query string):
+        persona, mes, accion, por: Filtros exactos
+        desde, hasta: Rango de tiempo (ISO o YYYY-MM-DD)
+        cursor: 'siguiente_cursor' de la página anterior (eventos más viejos)
+        limite: Eventos por página (por defecto 100, máximo 1000)
+    """
     try:
-        if not os.path.exists(HISTORIAL_FILE):
-            return jsonify({"historial": []})
-        
-        with open(HISTORIAL_FILE, 'r', encoding='utf-8') as f:
-            historial = json.load(f)
-        
-        # Retornar últimos 100 registros
+        filtros = {campo: request.args.get(campo) for campo in CAMPOS_INDICE_HISTORIAL}
+        desde = request.args.get('desde')
+        hasta = request.args.get('hasta')
+        cursor = request.args.get('cursor', type=int)
+        limite = min(max(request.args.get('limite', 100, type=int), 1), 1000)
+        
+        # Sin parámetros: últimos 100 registros (solo se leen esos, desde el final del log)
+        resultado = consultar_historial(filtros, desde, hasta, cursor, limite)
         return jsonify({
-            "historial": historial[-100:],
-            "total": len(historial)
+            "historial": resultado["eventos"],
+            "total": resultado["total"],
+            "siguiente_cursor": resultado["siguiente_cursor"],
+            "filtros": {campo: valor for campo, valor in filtros.items() if valor}
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1340,41 +5216,31 @@ def eliminar_guardia():
         if mes not in MESES:
             return jsonify({"error": "Mes no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes, con_disponibilidad=False)
         
-        if mes not in wb.sheetnames:
-            wb.close()
+        if dias is None:
             return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
         
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
-        
         if dia not in dias:
-            wb.close()
             return jsonify({"error": f"Día {dia} no encontrado en {mes}"}), 404
         
-        celda_ref = dias[dia]['celda_ref']
         persona_anterior = dias[dia].get('persona')
         
         if not persona_anterior:
-            wb.close()
             return jsonify({"error": "No hay guardia asignada para eliminar"}), 400
 
         # CONTROL DE PERMISOS: solo puede eliminar su propia guardia
         if not puede_modificar_persona(persona_anterior):
-            wb.close()
             return jsonify({
                 "error": "sin_permiso",
                 "mensaje": f"Solo podés eliminar tus propias guardias ({session.get('usuario_nombre')})"
             }), 403
         
         # Eliminar (vaciar celda)
-        hoja[celda_ref] = None
-        wb.save(EXCEL_FILE)
-        wb.close()
+        guardar_asignaciones(mes, {dia: None}, esperado={dia: persona_anterior})
         
         # Registrar en historial
         registrar_en_historial({
@@ -1391,6 +5257,8 @@ def eliminar_guardia():
             "persona_eliminada": persona_anterior
         })
         
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1416,31 +5284,25 @@ def distribucion_automatica(mes):
         if mes not in MESES:
             return jsonify({"error": f"Mes '{mes}' no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes)
         
-        if mes not in wb.sheetnames:
-            wb.close()
+        if dias is None:
             return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
         
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
+        metodo, tiempo = parametros_planificacion(request.get_json(silent=True) or {})
+        if metodo not in METODOS_PLANIFICACION:
+            return jsonify({"error": f"Método '{metodo}' no válido (greedy, local o exacto)"}), 400
         
         # Obtener personas activas para este mes
-        mes_num = MAP_MESES[mes]
-        personas_activas_mes = set()
-        for dia_num, info in dias.items():
-            fecha = info.get('fecha')
-            activos_dia = obtener_personas_activas(fecha)
-            personas_activas_mes.update(activos_dia)
+        personas_activas_mes = personas_activas_en_dias(dias)
         
         personas_lista = sorted(list(personas_activas_mes), key=lambda p: PERSONA_ORDEN.get(p, 99))
         num_personas = len(personas_lista)
         
         if num_personas == 0:
-            wb.close()
             return jsonify({"error": "No hay personas activas disponibles"}), 400
         
         # Separar días por tipo
@@ -1458,11 +5320,7 @@ def distribucion_automatica(mes):
             dias_por_tipo[tipo].sort()
         
         # Sistema de puntos por tipo de día
-        PUNTOS = {
-            'habil': 1.0,
-            'vispera': 1.5,
-            'feriado': 2.0
-        }
+        PUNTOS = PUNTOS_POR_TIPO
         
         # Calcular puntos totales del mes
         puntos_totales = (
@@ -1474,66 +5332,12 @@ def distribucion_automatica(mes):
         # Puntos ideales por persona
         puntos_por_persona = puntos_totales / num_personas
         
-        # Inicializar tracking
-        asignaciones = {}
-        puntos_acumulados = {p: 0.0 for p in personas_lista}
-        dias_asignados = {p: {'habil': 0, 'vispera': 0, 'feriado': 0, 'total': 0} for p in personas_lista}
-        
-        # Crear lista de todos los días con su tipo y puntos
-        todos_los_dias = []
-        for tipo in ['feriado', 'vispera', 'habil']:  # Orden: más pesados primero
-            for dia_num in dias_por_tipo[tipo]:
-                todos_los_dias.append({
-                    'dia': dia_num,
-                    'tipo': tipo,
-                    'puntos': PUNTOS[tipo],
-                    'fecha': dias[dia_num]['fecha']
-                })
-        
-        # ALGORITMO DE DISTRIBUCIÓN EQUITATIVA
-        # Asignar cada día a la persona que menos puntos acumulados tenga
-        for dia_info in todos_los_dias:
-            dia_num = dia_info['dia']
-            tipo = dia_info['tipo']
-            puntos = dia_info['puntos']
-            fecha = dia_info['fecha']
-            
-            # Encontrar persona disponible con menos puntos
-            personas_disponibles = [
-                p for p in personas_lista 
-                if persona_disponible(p, fecha)
-            ]
-            
-            if not personas_disponibles:
-                # Ninguna persona disponible, buscar la menos ocupada de todas
-                personas_disponibles = personas_lista
-            
-            # Ordenar por puntos acumulados (menos puntos primero)
-            personas_disponibles.sort(key=lambda p: puntos_acumulados[p])
-            
-            # Asignar a la primera (la que tiene menos puntos)
-            persona_elegida = personas_disponibles[0]
-            
-            asignaciones[dia_num] = persona_elegida
-            puntos_acumulados[persona_elegida] += puntos
-            dias_asignados[persona_elegida][tipo] += 1
-            dias_asignados[persona_elegida]['total'] += 1
-        
-        # Aplicar asignaciones al Excel
-        # Primero, limpiar todas las asignaciones del mes
-        for dia_num, info in dias.items():
-            celda_ref = info['celda_ref']
-            hoja[celda_ref] = None
-        
-        # Luego, aplicar nuevas asignaciones
-        cambios = 0
-        for dia_num, persona in asignaciones.items():
-            celda_ref = dias[dia_num]['celda_ref']
-            hoja[celda_ref] = persona
-            cambios += 1
-        
-        wb.save(EXCEL_FILE)
-        wb.close()
+        # ALGORITMO DE DISTRIBUCIÓN EQUITATIVA (motor compartido)
+        # Asignar cada día a la persona que menos puntos acumulados tenga, y guardar
+        plan = planificar_guardias(mes, dias, personas_lista, "aplicar", metodo=metodo, tiempo=tiempo)
+        cambios = len(plan["asignaciones"])
+        puntos_acumulados = {p: plan["conteo"][p]['puntos'] for p in personas_lista}
+        dias_asignados = plan["conteo"]
         
         # Registrar en historial
         registrar_en_historial({
@@ -1541,6 +5345,7 @@ def distribucion_automatica(mes):
             "mes": mes,
             "cambios": cambios,
             "puntos_sistema": PUNTOS,
+            "metodo": plan["metodo"],
             "personas": personas_lista
         })
         
@@ -1569,6 +5374,7 @@ def distribucion_automatica(mes):
             "dias_totales": len(dias),
             "cobertura": "100%",
             "personas_participantes": num_personas,
+            "metodo": plan["metodo"],
             "sistema_puntos": {
                 "habil": f"{PUNTOS['habil']} punto",
                 "vispera": f"{PUNTOS['vispera']} puntos",
@@ -1585,6 +5391,8 @@ def distribucion_automatica(mes):
             "distribucion": conteo
         })
         
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
     except Exception as e:
         import traceback
         print(f"Error en distribución automática: {traceback.format_exc()}")
@@ -1628,27 +5436,20 @@ def asignar_usuario_a_dia(mes, dia):
             }), 400
         
         # Verificar que el día no esté ya asignado
-        wb = load_workbook(EXCEL_FILE)
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
+        dias = obtener_dias_mes(mes, con_disponibilidad=False)
         
-        if dia not in dias:
-            wb.close()
+        if dias is None or dia not in dias:
             return jsonify({"error": "Día no encontrado"}), 404
         
         if dias[dia].get('persona'):
             persona_actual = dias[dia]['persona']
-            wb.close()
             return jsonify({
                 "error": "dia_ocupado",
                 "mensaje": f"Este día ya está asignado a {persona_actual}"
             }), 400
         
-        # Asignar
-        celda_ref = dias[dia]['celda_ref']
-        hoja[celda_ref] = persona
-        wb.save(EXCEL_FILE)
-        wb.close()
+        # Asignar (solo si el día sigue libre)
+        guardar_asignaciones(mes, {dia: persona}, esperado={dia: None})
         
         # Registrar en historial
         registrar_en_historial({
@@ -1667,6 +5468,8 @@ def asignar_usuario_a_dia(mes, dia):
             "tipo_dia": dias[dia]['tipo']
         })
         
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1681,11 +5484,9 @@ def estadisticas_usuario(persona):
         if persona not in PERSONAS:
             return jsonify({"error": "Persona no encontrada"}), 404
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
-        
         stats = {
             "total": 0,
             "habil": 0,
@@ -1695,12 +5496,10 @@ def estadisticas_usuario(persona):
         }
         
         for mes in MESES:
-            if mes not in wb.sheetnames:
+            dias = obtener_dias_mes(mes, con_disponibilidad=False)
+            if dias is None:
                 continue
             
-            hoja = wb[mes]
-            dias = obtener_dias_del_mes_mejorado(hoja, mes)
-            
             mes_stats = {
                 "total": 0,
                 "habil": 0,
@@ -1726,8 +5525,6 @@ def estadisticas_usuario(persona):
             if mes_stats['total'] > 0:
                 stats['por_mes'][mes] = mes_stats
         
-        wb.close()
-        
         return jsonify({
             "persona": persona,
             "estadisticas": stats,
@@ -1754,125 +5551,61 @@ def distribucion_balancear(mes):
         if mes not in MESES:
             return jsonify({"error": f"Mes '{mes}' no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
         # Verificar si solo queremos calcular sin aplicar
         data = request.json or {}
         solo_calcular = data.get('solo_calcular', False)
+        metodo, tiempo = parametros_planificacion(data)
+        if metodo not in METODOS_PLANIFICACION:
+            return jsonify({"error": f"Método '{metodo}' no válido (greedy, local o exacto)"}), 400
         
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes)
         
-        if mes not in wb.sheetnames:
-            wb.close()
+        if dias is None:
             return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
         
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
-        
         # Obtener personas activas
-        mes_num = MAP_MESES[mes]
-        personas_activas_mes = set()
-        for dia_num, info in dias.items():
-            fecha = info.get('fecha')
-            activos_dia = obtener_personas_activas(fecha)
-            personas_activas_mes.update(activos_dia)
+        personas_activas_mes = personas_activas_en_dias(dias)
         
         personas_lista = sorted(list(personas_activas_mes), key=lambda p: PERSONA_ORDEN.get(p, 99))
         num_personas = len(personas_lista)
         
         if num_personas == 0:
-            wb.close()
             return jsonify({"error": "No hay personas activas disponibles"}), 400
         
-        # Contar guardias ya asignadas por persona
-        PUNTOS = {'habil': 1.0, 'vispera': 1.5, 'feriado': 2.0}
-        
-        conteo_actual = {p: {'total': 0, 'puntos': 0.0, 'habil': 0, 'vispera': 0, 'feriado': 0} for p in personas_lista}
-        dias_pendientes = []
-        
-        for dia_num, info in dias.items():
+        # Contar guardias ya asignadas por persona (estado inicial, solo para el log)
+        conteo_inicial = {p: conteo_vacio() for p in personas_lista}
+        for info in dias.values():
             persona = info.get('persona')
-            tipo = info['tipo']
-            
-            if persona and persona in conteo_actual:
-                # Día ya asignado
-                conteo_actual[persona]['total'] += 1
-                conteo_actual[persona][tipo] += 1
-                conteo_actual[persona]['puntos'] += PUNTOS[tipo]
-            else:
-                # Día pendiente
-                dias_pendientes.append({
-                    'dia': dia_num,
-                    'tipo': tipo,
-                    'puntos': PUNTOS[tipo],
-                    'fecha': info['fecha']
-                })
-        
-        # Ordenar días pendientes por puntos (más pesados primero)
-        dias_pendientes.sort(key=lambda x: x['puntos'], reverse=True)
+            if persona in conteo_inicial:
+                conteo_inicial[persona]['total'] += 1
+                conteo_inicial[persona]['puntos'] += PUNTOS_POR_TIPO[info['tipo']]
         
         print(f"\n📊 DISTRIBUCIÓN BALANCEADA - {mes} (Solo calcular: {solo_calcular})")
-        print(f"Días pendientes: {len(dias_pendientes)}")
         print(f"Personas activas: {num_personas}")
         
         # Estado inicial
         print("\n📋 Estado Inicial:")
-        for persona in sorted(conteo_actual.keys(), key=lambda p: conteo_actual[p]['total']):
-            datos = conteo_actual[persona]
+        for persona in sorted(conteo_inicial.keys(), key=lambda p: conteo_inicial[p]['total']):
+            datos = conteo_inicial[persona]
             print(f"  {persona}: {datos['total']} días ({datos['puntos']:.1f} pts)")
         
-        # Asignar cada día pendiente a quien tenga MENOS
-        asignaciones_nuevas = {}
-        
-        for dia_info in dias_pendientes:
-            dia_num = dia_info['dia']
-            tipo = dia_info['tipo']
-            puntos = dia_info['puntos']
-            fecha = dia_info['fecha']
-            
-            # Encontrar personas disponibles
-            personas_disponibles = [
-                p for p in personas_lista 
-                if persona_disponible(p, fecha)
-            ]
-            
-            if not personas_disponibles:
-                personas_disponibles = personas_lista
-            
-            # Ordenar por puntos acumulados (menos primero)
-            personas_disponibles.sort(key=lambda p: conteo_actual[p]['puntos'])
-            
-            # Asignar al primero (quien tiene menos)
-            persona_elegida = personas_disponibles[0]
-            
-            asignaciones_nuevas[dia_num] = {
-                'persona': persona_elegida,
-                'tipo': tipo,
-                'puntos': puntos
-            }
-            
-            # Actualizar conteo
-            conteo_actual[persona_elegida]['total'] += 1
-            conteo_actual[persona_elegida][tipo] += 1
-            conteo_actual[persona_elegida]['puntos'] += puntos
-        
+        # Asignar cada día pendiente a quien tenga MENOS (motor compartido);
         # SOLO APLICAR SI NO ES "solo_calcular"
-        cambios = 0
+        plan = planificar_guardias(mes, dias, personas_lista, "pendientes", guardar=not solo_calcular,
+                                   metodo=metodo, tiempo=tiempo)
+        conteo_actual = plan["conteo"]
+        cambios = len(plan["asignaciones"])
+        dias_pendientes = plan["asignaciones"]
+        print(f"Días pendientes: {cambios}")
+        
         if not solo_calcular:
-            for dia_num, asig in asignaciones_nuevas.items():
-                celda_ref = dias[dia_num]['celda_ref']
-                hoja[celda_ref] = asig['persona']
-                cambios += 1
-            
-            wb.save(EXCEL_FILE)
             print("\n💾 Cambios APLICADOS al Excel")
         else:
-            cambios = len(asignaciones_nuevas)
             print("\n📋 Cambios CALCULADOS (no aplicados)")
         
-        wb.close()
-        
         # Estado final
         print("\n📋 Estado Final (proyectado):")
         for persona in sorted(conteo_actual.keys(), key=lambda p: conteo_actual[p]['total'], reverse=True):
@@ -1891,6 +5624,7 @@ def distribucion_balancear(mes):
                 "accion": "distribucion_balanceada",
                 "mes": mes,
                 "cambios": cambios,
+                "metodo": plan["metodo"],
                 "diferencia_final": round(diferencia, 2)
             })
         
@@ -1901,6 +5635,7 @@ def distribucion_balancear(mes):
             "mensaje": f"✅ Distribución balanceada {mensaje_base} para {mes}",
             "mes": mes,
             "solo_calcular": solo_calcular,
+            "metodo": plan["metodo"],
             "dias_pendientes_asignados": cambios,
             "dias_que_ya_estaban": len(dias) - len(dias_pendientes),
             "personas_participantes": num_personas,
@@ -1922,23 +5657,216 @@ def distribucion_balancear(mes):
             }
         })
         
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
     except Exception as e:
         import traceback
         print(f"Error en distribución balanceada: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/distribucion/anual', methods=['POST'])
+def distribucion_anual():
+    """
+    Distribuye de una vez todos los días pendientes desde un mes hasta fin de año,
+    arrastrando el saldo (puntos reales - ideales) de cada persona entre meses.
+    
+    Body (JSON, todo opcional):
+        desde_mes: Mes desde el cual repartir (por defecto el mes actual)
+        solo_calcular: Si es True, solo calcula sin aplicar cambios
+        metodo / tiempo: Como en /api/distribucion/auto; "exacto" solo como
+                         trabajo (POST /api/trabajos), para no ocupar el request
+    """
+    try:
+        if not existe_calendario():
+            return jsonify({"error": "Archivo no encontrado"}), 404
+        
+        data = request.get_json(silent=True) or {}
+        solo_calcular = data.get('solo_calcular', False)
+        metodo, tiempo = parametros_planificacion(data)
+        if metodo not in METODOS_PLANIFICACION:
+            return jsonify({"error": f"Método '{metodo}' no válido (greedy, local o exacto)"}), 400
+        if metodo == "exacto" and not en_trabajo():
+            return jsonify({
+                "error": "El método 'exacto' para todo el año solo corre como trabajo: "
+                         "POST /api/trabajos con tipo 'distribucion_anual'"
+            }), 400
+        
+        desde_mes = data.get('desde_mes')
+        if desde_mes is None:
+            hoy = date.today()
+            desde_mes = MESES[hoy.month - 1] if hoy.year == 2026 else MESES[0]
+        if desde_mes not in MESES:
+            return jsonify({"error": f"Mes '{desde_mes}' no válido"}), 400
+        
+        plan = planificar_anio(desde_mes, metodo=metodo, tiempo=tiempo, guardar=not solo_calcular)
+        cambios = sum(len(dias) for dias in plan["asignaciones"].values())
+        
+        saldos = [datos['saldo'] for datos in plan["personas"].values()] or [0.0]
+        diferencia = max(saldos) - min(saldos)
+        
+        print(f"\n📊 DISTRIBUCIÓN ANUAL desde {desde_mes} (Solo calcular: {solo_calcular}, método: {plan['metodo']})")
+        for persona, datos in plan["personas"].items():
+            print(f"  {persona}: +{datos['asignados']['total']} días, saldo {datos['saldo']:+.1f} pts")
+        
+        if not solo_calcular and cambios:
+            registrar_en_historial({
+                "accion": "distribucion_anual",
+                "mes": desde_mes,
+                "meses": list(plan["asignaciones"]),
+                "cambios": cambios,
+                "metodo": plan["metodo"],
+                "diferencia_final": round(diferencia, 2)
+            })
+        
+        mensaje_base = "calculada" if solo_calcular else "completada"
+        
+        return jsonify({
+            "success": True,
+            "mensaje": f"✅ Distribución anual {mensaje_base} desde {desde_mes}",
+            "desde_mes": desde_mes,
+            "meses": plan["meses"],
+            "solo_calcular": solo_calcular,
+            "metodo": plan["metodo"],
+            "dias_pendientes_asignados": cambios,
+            "por_mes": {mes: len(dias) for mes, dias in plan["asignaciones"].items()},
+            "asignaciones": plan["asignaciones"],
+            "personas": plan["personas"],
+            "equidad": {
+                "saldo_minimo": round(min(saldos), 1),
+                "saldo_maximo": round(max(saldos), 1),
+                "diferencia": round(diferencia, 1),
+                "nivel": "excelente" if diferencia < 2 else "bueno" if diferencia < 4 else "aceptable"
+            }
+        })
+        
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
+    except Exception as e:
+        import traceback
+        print(f"Error en distribución anual: {traceback.format_exc()}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/distribucion/rebalancear/<mes>', methods=['POST'])
+def distribucion_rebalancear(mes):
+    """
+    Rebalanceo con cambios mínimos: parte de lo ya asignado y propone los pocos
+    movimientos o intercambios que dejan a todos dentro de la tolerancia,
+    tocando lo menos posible los días que cada uno se auto-asignó.
+    
+    Body (JSON, todo opcional):
+        tolerancia: Diferencia máxima de puntos buscada (por defecto 1.5)
+        tiempo: Tope en segundos de la búsqueda
+        solo_calcular: Por defecto True (solo propone); False para aplicar
+    """
+    try:
+        if mes not in MESES:
+            return jsonify({"error": f"Mes '{mes}' no válido"}), 400
+        
+        if not existe_calendario():
+            return jsonify({"error": "Archivo no encontrado"}), 404
+        
+        data = request.get_json(silent=True) or {}
+        solo_calcular = data.get('solo_calcular', True)
+        _, tiempo = parametros_planificacion(data)
+        try:
+            tolerancia = float(data.get('tolerancia', 1.5))
+        except (TypeError, ValueError):
+            return jsonify({"error": "La tolerancia debe ser un número"}), 400
+        
+        dias = obtener_dias_mes(mes, con_disponibilidad=False)
+        
+        if dias is None:
+            return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
+        
+        personas_lista = sorted(personas_activas_en_dias(dias), key=lambda p: PERSONA_ORDEN.get(p, 99))
+        if not personas_lista:
+            return jsonify({"error": "No hay personas activas disponibles"}), 400
+        
+        autoasignados = dias_autoasignados(mes, dias)
+        plan = rebalancear_mes(dias, personas_lista, tolerancia, protegidos=autoasignados, tiempo=tiempo)
+        conteo = plan["conteo"]
+        diferencia_antes = plan["diferencia_inicial"]
+        diferencia_despues = costo_distribucion(conteo, personas_lista)[0]
+        
+        cambios = [
+            {
+                "dia": dia,
+                "fecha": dias[dia]['fecha'],
+                "tipo": dias[dia]['tipo'],
+                "antes": antes,
+                "despues": despues,
+                "autoasignado": dia in autoasignados
+            }
+            for dia, (antes, despues) in plan["cambios"].items()
+        ]
+        
+        if not solo_calcular and cambios:
+            informar_progreso(0.9, "guardando")
+            guardar_asignaciones(
+                mes,
+                {c["dia"]: c["despues"] for c in cambios},
+                esperado={c["dia"]: c["antes"] for c in cambios}
+            )
+            registrar_en_historial({
+                "accion": "rebalanceo",
+                "mes": mes,
+                "cambios": len(cambios),
+                "asignaciones": [
+                    {"mes": mes, "dia": c["dia"], "antes": c["antes"], "despues": c["despues"]}
+                    for c in cambios
+                ],
+                "diferencia_final": round(diferencia_despues, 2),
+                "por": session.get('usuario_nombre', 'desconocido')
+            })
+        
+        print(f"\n📊 REBALANCEO - {mes} (Solo calcular: {solo_calcular}): "
+              f"{diferencia_antes:.1f} → {diferencia_despues:.1f} pts con {len(cambios)} cambios")
+        
+        mensaje_base = "calculado" if solo_calcular else "aplicado"
+        
+        return jsonify({
+            "success": True,
+            "mensaje": f"✅ Rebalanceo {mensaje_base} para {mes}: {len(cambios)} cambios",
+            "mes": mes,
+            "solo_calcular": solo_calcular,
+            "tolerancia": tolerancia,
+            "alcanzado": plan["alcanzado"],
+            "diferencia_antes": round(diferencia_antes, 1),
+            "diferencia_despues": round(diferencia_despues, 1),
+            "cambios": cambios,
+            "autoasignados_tocados": sum(1 for c in cambios if c["autoasignado"]),
+            "estado_final": {
+                persona: {
+                    'total': conteo[persona]['total'],
+                    'habil': conteo[persona]['habil'],
+                    'vispera': conteo[persona]['vispera'],
+                    'feriado': conteo[persona]['feriado'],
+                    'puntos': round(conteo[persona]['puntos'], 1)
+                }
+                for persona in personas_lista
+            }
+        })
+        
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
+    except Exception as e:
+        import traceback
+        print(f"Error en rebalanceo: {traceback.format_exc()}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/reporte/anual')
+@respuesta_condicional("calendario", cache=True)
 def reporte_anual():
     """
     Genera reporte anual completo con estadísticas de todos los meses.
     """
     try:
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
-        
         # Estadísticas generales
         dias_totales = 0
         dias_asignados = 0
@@ -1950,12 +5878,11 @@ def reporte_anual():
         meses_data = {}
         
         for mes in MESES:
-            if mes not in wb.sheetnames:
+            informar_progreso(MESES.index(mes) / len(MESES), mes)
+            dias = obtener_dias_mes(mes, con_disponibilidad=False)
+            if dias is None:
                 continue
             
-            hoja = wb[mes]
-            dias = obtener_dias_del_mes_mejorado(hoja, mes)
-            
             total_mes = len(dias)
             asignados_mes = sum(1 for d in dias.values() if d.get('persona'))
             
@@ -1985,8 +5912,6 @@ def reporte_anual():
                     
                     por_persona[persona]['por_mes'][mes] += 1
         
-        wb.close()
-        
         # Calcular porcentaje de cobertura
         porcentaje_cobertura = round((dias_asignados / dias_totales * 100), 1) if dias_totales > 0 else 0
         
@@ -2007,6 +5932,76 @@ def reporte_anual():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/reporte/anual/detalle')
+@respuesta_condicional("calendario")
+def reporte_anual_detalle():
+    """
+    Todo el año en una sola respuesta: los días de cada mes, desglose por tipo
+    y puntos por persona (mismo formato que /api/reporte/anual, ampliado).
+    Se arma en una sola pasada sobre el modelo en memoria.
+    """
+    try:
+        if not existe_calendario():
+            return jsonify({"error": "Archivo no encontrado"}), 404
+        
+        PUNTOS = PUNTOS_POR_TIPO
+        PLURALES = {'habil': 'habiles', 'vispera': 'visperas', 'feriado': 'feriados'}
+        
+        totales = {'dias_totales': 0, 'dias_asignados': 0, 'habil': 0, 'vispera': 0, 'feriado': 0, 'puntos': 0}
+        meses_data = {}
+        por_persona = {}
+        
+        for mes in MESES:
+            informar_progreso(MESES.index(mes) / len(MESES), mes)
+            dias = obtener_dias_mes(mes, con_disponibilidad=False)
+            if dias is None:
+                continue
+            
+            resumen_mes = {'total': len(dias), 'asignados': 0, 'habiles': 0, 'visperas': 0, 'feriados': 0}
+            for dia_info in dias.values():
+                tipo = dia_info['tipo']
+                resumen_mes[PLURALES[tipo]] += 1
+                
+                persona = dia_info.get('persona')
+                if not persona:
+                    continue
+                
+                resumen_mes['asignados'] += 1
+                totales[tipo] += 1
+                totales['puntos'] += PUNTOS[tipo]
+                
+                if persona not in por_persona:
+                    por_persona[persona] = {'total': 0, 'habil': 0, 'vispera': 0, 'feriado': 0, 'puntos': 0, 'por_mes': {}}
+                datos = por_persona[persona]
+                datos['total'] += 1
+                datos[tipo] += 1
+                datos['puntos'] += PUNTOS[tipo]
+                datos['por_mes'][mes] = datos['por_mes'].get(mes, 0) + 1
+            
+            resumen_mes['pendientes'] = resumen_mes['total'] - resumen_mes['asignados']
+            resumen_mes['dias'] = dias
+            meses_data[mes] = resumen_mes
+            
+            totales['dias_totales'] += resumen_mes['total']
+            totales['dias_asignados'] += resumen_mes['asignados']
+        
+        totales['dias_pendientes'] = totales['dias_totales'] - totales['dias_asignados']
+        porcentaje_cobertura = round((totales['dias_asignados'] / totales['dias_totales'] * 100), 1) if totales['dias_totales'] > 0 else 0
+        totales['porcentaje_cobertura'] = f"{porcentaje_cobertura}"
+        
+        return jsonify({
+            'totales': totales,
+            'meses': meses_data,
+            'por_persona': por_persona,
+            'puntos_sistema': PUNTOS
+        })
+        
+    except Exception as e:
+        import traceback
+        print(f"Error generando reporte anual detallado: {traceback.format_exc()}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/mes/<mes>/resetear', methods=['POST'])
 def resetear_mes(mes):
     """
@@ -2017,33 +6012,29 @@ def resetear_mes(mes):
         if mes not in MESES:
             return jsonify({"error": f"Mes '{mes}' no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes, con_disponibilidad=False)
         
-        if mes not in wb.sheetnames:
-            wb.close()
+        if dias is None:
             return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
         
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
-        
         # Contar cuántas asignaciones hay
         asignaciones_eliminadas = 0
         personas_afectadas = set()
         
         # Limpiar todas las celdas de asignación
+        vaciar = {}
         for dia_num, info in dias.items():
             persona = info.get('persona')
             if persona:
-                celda_ref = info['celda_ref']
-                hoja[celda_ref] = None
+                vaciar[dia_num] = None
                 asignaciones_eliminadas += 1
                 personas_afectadas.add(persona)
         
-        wb.save(EXCEL_FILE)
-        wb.close()
+        if vaciar:
+            guardar_asignaciones(mes, vaciar, esperado={dia_num: dias[dia_num]['persona'] for dia_num in vaciar})
         
         # Registrar en historial
         registrar_en_historial({
@@ -2062,6 +6053,8 @@ def resetear_mes(mes):
             "detalle": f"Se eliminaron {asignaciones_eliminadas} guardias de {len(personas_afectadas)} personas"
         })
         
+    except ConflictoAsignacion as e:
+        return jsonify(e.respuesta()), 409
     except Exception as e:
         import traceback
         print(f"Error al resetear mes: {traceback.format_exc()}")
@@ -2078,26 +6071,16 @@ def calcular_guardias_sugeridas(mes):
         if mes not in MESES:
             return jsonify({"error": f"Mes '{mes}' no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes)
         
-        if mes not in wb.sheetnames:
-            wb.close()
+        if dias is None:
             return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
         
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
-        wb.close()
-        
         # Obtener personas activas
-        mes_num = MAP_MESES[mes]
-        personas_activas_mes = set()
-        for dia_num, info in dias.items():
-            fecha = info.get('fecha')
-            activos_dia = obtener_personas_activas(fecha)
-            personas_activas_mes.update(activos_dia)
+        personas_activas_mes = personas_activas_en_dias(dias)
         
         personas_lista = sorted(list(personas_activas_mes), key=lambda p: PERSONA_ORDEN.get(p, 99))
         num_personas = len(personas_lista)
@@ -2187,43 +6170,33 @@ def calcular_cuotas_sugeridas(mes):
         if mes not in MESES:
             return jsonify({"error": f"Mes '{mes}' no válido"}), 400
         
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
-        wb = load_workbook(EXCEL_FILE)
+        dias = obtener_dias_mes(mes)
         
-        if mes not in wb.sheetnames:
-            wb.close()
+        if dias is None:
             return jsonify({"error": f"Mes '{mes}' no encontrado"}), 404
         
-        hoja = wb[mes]
-        dias = obtener_dias_del_mes_mejorado(hoja, mes)
-        
-        # NO cerrar wb todavía - lo necesitamos para simular
+        metodo, tiempo = parametros_planificacion({})
+        if metodo not in METODOS_PLANIFICACION:
+            return jsonify({"error": f"Método '{metodo}' no válido (greedy, local o exacto)"}), 400
         
         # Obtener personas activas
-        mes_num = MAP_MESES[mes]
-        personas_activas_mes = set()
-        for dia_num, info in dias.items():
-            fecha = info.get('fecha')
-            activos_dia = obtener_personas_activas(fecha)
-            personas_activas_mes.update(activos_dia)
+        personas_activas_mes = personas_activas_en_dias(dias)
         
         personas_lista = sorted(list(personas_activas_mes), key=lambda p: PERSONA_ORDEN.get(p, 99))
         num_personas = len(personas_lista)
         
         if num_personas == 0:
-            wb.close()
             return jsonify({"error": "No hay personas activas disponibles"}), 400
         
         # ============================================================================
         # USAR EL MISMO ALGORITMO DE DISTRIBUCIÓN AUTOMÁTICA (MODO SIMULACIÓN)
         # ============================================================================
         
-        PUNTOS = {'habil': 1.0, 'vispera': 1.5, 'feriado': 2.0}
-        
         # Contar asignaciones ACTUALES (antes de simular)
-        asignados_antes = {p: {'habil': 0, 'vispera': 0, 'feriado': 0, 'total': 0, 'puntos': 0.0} for p in personas_lista}
+        asignados_antes = {p: conteo_vacio() for p in personas_lista}
         
         for dia_num, info in dias.items():
             persona = info.get('persona')
@@ -2232,62 +6205,18 @@ def calcular_cuotas_sugeridas(mes):
             if persona and persona in asignados_antes:
                 asignados_antes[persona][tipo] += 1
                 asignados_antes[persona]['total'] += 1
-                asignados_antes[persona]['puntos'] += PUNTOS[tipo]
+                asignados_antes[persona]['puntos'] += PUNTOS_POR_TIPO[tipo]
         
-        # SIMULAR distribución completa (como distribución_automatica pero sin guardar)
-        # Crear copia de hoja para simular
-        from copy import deepcopy
-        dias_simulados = deepcopy(dias)
+        # SIMULAR distribución completa (motor compartido, sin guardar)
+        plan = planificar_guardias(mes, dias, personas_lista, "simular", metodo=metodo, tiempo=tiempo)
+        conteo_simulado = plan["conteo"]
         
-        # Resetear todas las asignaciones en la simulación
-        for dia_num in dias_simulados:
-            dias_simulados[dia_num]['persona'] = None
-        
-        # Algoritmo de distribución (igual que distribucion_automatica)
-        conteo_simulado = {p: {'total': 0, 'puntos': 0.0, 'habil': 0, 'vispera': 0, 'feriado': 0} for p in personas_lista}
-        
-        # Ordenar días por peso (feriado > víspera > hábil)
-        dias_ordenados = sorted(
-            dias_simulados.items(),
-            key=lambda x: PUNTOS[x[1]['tipo']],
-            reverse=True
-        )
-        
-        # Inicializar conteo para DNRD
-        conteo_simulado['DNRD'] = {'total': 0, 'puntos': 0.0, 'habil': 0, 'vispera': 0, 'feriado': 0, 'dias': []}
-        
-        # Asignar cada día a quien tenga menos puntos
-        for dia_num, info in dias_ordenados:
-            tipo = info['tipo']
-            fecha = info['fecha']
-            puntos = PUNTOS[tipo]
-            
-            # Encontrar personas disponibles
-            personas_disponibles = [
-                p for p in personas_lista
-                if persona_disponible(p, fecha)
-            ]
-            
-            if not personas_disponibles:
-                # Nadie disponible -> DNRD cubre este día
-                conteo_simulado['DNRD']['total'] += 1
-                conteo_simulado['DNRD'][tipo] += 1
-                conteo_simulado['DNRD']['puntos'] += puntos
-                conteo_simulado['DNRD']['dias'].append({'dia': dia_num, 'fecha': fecha, 'tipo': tipo})
-                continue
-            
-            # Ordenar por puntos acumulados (menos primero)
-            personas_disponibles.sort(key=lambda p: (conteo_simulado[p]['puntos'], conteo_simulado[p]['total']))
-            
-            # Asignar al primero
-            persona_elegida = personas_disponibles[0]
-            
-            # Actualizar conteo simulado
-            conteo_simulado[persona_elegida]['total'] += 1
-            conteo_simulado[persona_elegida][tipo] += 1
-            conteo_simulado[persona_elegida]['puntos'] += puntos
-        
-        wb.close()
+        # Días sin nadie disponible -> DNRD cubre esos días
+        conteo_simulado['DNRD'] = dict(conteo_vacio(), dias=plan["sin_cubrir"])
+        for dia in plan["sin_cubrir"]:
+            conteo_simulado['DNRD']['total'] += 1
+            conteo_simulado['DNRD'][dia['tipo']] += 1
+            conteo_simulado['DNRD']['puntos'] += PUNTOS_POR_TIPO[dia['tipo']]
         
         # ============================================================================
         # CALCULAR SUGERENCIAS (diferencia entre simulado y actual)
@@ -2404,6 +6333,7 @@ def calcular_cuotas_sugeridas(mes):
             "cuota_ideal_por_persona": round(cuota_ideal, 1),
             "puntos_ideal_por_persona": round(puntos_ideal, 1),
             "personas_activas": num_personas,
+            "metodo": plan["metodo"],
             "cuotas_sugeridas": cuotas_sugeridas
         })
         
@@ -2411,15 +6341,17 @@ def calcular_cuotas_sugeridas(mes):
         import traceback
         print(f"Error en cuotas sugeridas: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/descargar')
 def descargar_excel():
-    """Descarga el archivo Excel actualizado"""
+    """Descarga el archivo Excel actualizado (con SQLite se exporta en el momento)"""
     try:
-        if not os.path.exists(EXCEL_FILE):
+        if not existe_calendario():
             return jsonify({"error": "Archivo no encontrado"}), 404
         
         return send_file(
-            EXCEL_FILE,
+            almacenamiento().archivo_excel(),
             as_attachment=True,
             download_name=f"calendario_guardias_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         )
@@ -2449,7 +6381,7 @@ if __name__ == '__main__':
     """)
     
     # Inicializar calendario
-    inicializar_calendario()
+    inicializar_una_vez()
     
     # Obtener puerto desde variable de entorno (Render lo asigna automáticamente)
     port = int(os.environ.get('PORT', 10000))
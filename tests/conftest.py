@@ -0,0 +1,70 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import app  # noqa: E402
+
+# Datos del repositorio que se copian a cada test (el resto lo crea la app)
+ARCHIVOS_DATOS = ("calendario_guardias_2026.xlsx", "disponibilidad.json", "historial_guardias.json", "usuarios.json")
+
+# Rutas de app.py que se redirigen al directorio del test
+RUTAS = (
+    "EXCEL_FILE", "HISTORIAL_FILE", "HISTORIAL_LEGACY_FILE", "HISTORIAL_INDICE_FILE",
+    "DISPONIBILIDAD_FILE", "USUARIOS_FILE", "INDICE_CELDAS_FILE", "DB_FILE",
+    "BLOQUEOS_DIR", "JOURNAL_FILE", "VOLCADOS_FILE"
+)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def directorio_de_trabajo(tmp_path_factory):
+    """
+    Directorio de toda la sesión fuera del repositorio, para lo que corre con las
+    rutas originales después de un test (el hilo escritor) o después de pytest
+    (el volcado al salir, con atexit).
+    """
+    directorio = tmp_path_factory.mktemp("cwd")
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    yield
+    os.chdir(anterior)
+    for ruta in RUTAS:
+        setattr(app, ruta, str(directorio / os.path.basename(getattr(app, ruta))))
+
+
+def reiniciar_estado():
+    """Olvida lo que el proceso tiene cargado en memoria de los datos de otro test"""
+    app._inicializacion["hecha"] = False
+    app._almacenamiento = None
+    app._indices_celdas = None
+    app._modelo_calendario.update({"meses": {}, "hojas": [], "firma": None})
+    app._motor_disponibilidad.update({"firma": None, "datos": None})
+    app._contadores_guardias["valido"] = False
+    app._indice_conflictos["valido"] = False
+    app._historial_indice["tamano"] = None
+    app._versiones_calendario.update({"firma": None, "meses": {}, "calendario": None})
+    app._lecturas_en_curso.clear()
+    app._cache_respuestas.clear()
+
+
+@pytest.fixture(autouse=True)
+def datos(tmp_path, monkeypatch):
+    """Copia de los datos en tmp_path, con todas las rutas de la app apuntando ahí"""
+    for nombre in ARCHIVOS_DATOS:
+        shutil.copy(os.path.join(RAIZ, nombre), tmp_path / nombre)
+    monkeypatch.chdir(tmp_path)
+    for ruta in RUTAS:
+        monkeypatch.setattr(app, ruta, str(tmp_path / os.path.basename(getattr(app, ruta))))
+    monkeypatch.setattr(app, "ALMACENAMIENTO", "archivos")
+    reiniciar_estado()
+    
+    yield tmp_path
+    
+    # Lo que quedó en el journal va al Excel de este test, no al de otro
+    if app._almacenamiento is not None and app._almacenamiento.nombre == "archivos":
+        app.volcar_journal_excel()
+    reiniciar_estado()
@@ -0,0 +1,116 @@
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def sin_volcado_automatico(monkeypatch):
+    """El journal queda como lo dejó cada escritura: el hilo escritor no lo vacía"""
+    monkeypatch.setattr(app, "INTERVALO_GUARDADO", 3600)
+
+
+def cliente_de(persona):
+    """Cliente de prueba con la sesión iniciada como `persona`"""
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['usuario_id'] = "test"
+        sesion['usuario_nombre'] = persona
+    return cliente
+
+
+def dia_de_otro(mes, persona):
+    """Un día del mes que hoy no tiene a `persona`, con quien lo tiene"""
+    dias = app.obtener_dias_mes(mes, con_disponibilidad=False)
+    dia = next(d for d in sorted(dias) if dias[d].get('persona') != persona)
+    return dia, dias[dia].get('persona')
+
+
+def test_guardar_con_esperado_distinto_no_escribe():
+    persona = app.PERSONAS[0]
+    dia, actual = dia_de_otro("Junio", persona)
+    esperado = next(p for p in app.PERSONAS if p not in (persona, actual))
+    
+    with pytest.raises(app.ConflictoAsignacion) as error:
+        app.guardar_asignaciones("Junio", {dia: persona}, esperado={dia: esperado})
+    assert (error.value.esperado, error.value.actual) == (esperado, actual)
+    assert app.tamano_journal() == 0
+    assert app.obtener_dias_mes("Junio")[dia].get('persona') == actual
+
+
+def test_asignar_con_esperado_distinto_responde_409():
+    persona = app.PERSONAS[0]
+    dia, actual = dia_de_otro("Junio", persona)
+    esperado = next(p for p in app.PERSONAS if p not in (persona, actual))
+    cliente = cliente_de(persona)
+    eventos = app.contar_eventos_historial()
+    
+    respuesta = cliente.post('/api/asignar', json={
+        "mes": "Junio", "dia": dia, "persona": persona, "forzar": True, "esperado": esperado
+    })
+    assert respuesta.status_code == 409
+    cuerpo = respuesta.get_json()
+    assert cuerpo["error"] == "conflicto"
+    assert (cuerpo["dia"], cuerpo["esperado"], cuerpo["actual"]) == (dia, esperado, actual)
+    
+    assert app.tamano_journal() == 0
+    assert app.contar_eventos_historial() == eventos
+    assert app.obtener_dias_mes("Junio")[dia].get('persona') == actual
+    
+    # Con el valor que realmente tiene el día sí se aplica
+    respuesta = cliente.post('/api/asignar', json={
+        "mes": "Junio", "dia": dia, "persona": persona, "forzar": True, "esperado": actual
+    })
+    assert respuesta.status_code == 200
+    assert app.obtener_dias_mes("Junio")[dia]['persona'] == persona
+
+
+def test_lote_con_una_operacion_invalida_no_aplica_ninguna():
+    persona = app.PERSONAS[0]
+    dias = app.obtener_dias_mes("Julio", con_disponibilidad=False)
+    validos = [d for d in sorted(dias) if dias[d].get('persona') != persona][:2]
+    cliente = cliente_de(persona)
+    eventos = app.contar_eventos_historial()
+    
+    operaciones = [{"mes": "Julio", "dia": dia, "persona": persona, "forzar": True} for dia in validos]
+    operaciones.append({"mes": "Julio", "dia": 40, "persona": persona, "forzar": True})
+    respuesta = cliente.post('/api/asignar/lote', json={"operaciones": operaciones})
+    
+    assert respuesta.status_code == 400
+    cuerpo = respuesta.get_json()
+    assert cuerpo["error"] == "lote_invalido"
+    assert [r["ok"] for r in cuerpo["resultados"]] == [True, True, False]
+    
+    assert app.tamano_journal() == 0
+    assert app.contar_eventos_historial() == eventos
+    for dia in validos:
+        assert app.obtener_dias_mes("Julio")[dia].get('persona') == dias[dia].get('persona')
+
+
+def test_lote_valido_registra_un_solo_evento():
+    persona = app.PERSONAS[0]
+    operaciones = []
+    antes = {}
+    for mes in ("Agosto", "Septiembre"):
+        dia, actual = dia_de_otro(mes, persona)
+        operaciones.append({"mes": mes, "dia": dia, "persona": persona, "forzar": True})
+        antes[(mes, dia)] = actual
+    cliente = cliente_de(persona)
+    eventos = app.contar_eventos_historial()
+    
+    respuesta = cliente.post('/api/asignar/lote', json={"operaciones": operaciones})
+    assert respuesta.status_code == 200
+    assert all(r["ok"] for r in respuesta.get_json()["resultados"])
+    
+    for (mes, dia) in antes:
+        assert app.obtener_dias_mes(mes)[dia]['persona'] == persona
+    entradas, _ = app.leer_journal()
+    assert len(entradas) == 1
+    
+    assert app.contar_eventos_historial() == eventos + 1
+    evento = app.consultar_historial(limite=1)["eventos"][-1]
+    assert evento["accion"] == "asignar_lote"
+    assert evento["meses"] == ["Agosto", "Septiembre"]
+    assert evento["por"] == persona
+    assert [(a["mes"], a["dia"], a["antes"], a["despues"]) for a in evento["asignaciones"]] == [
+        (mes, dia, actual, persona) for (mes, dia), actual in antes.items()
+    ]
@@ -0,0 +1,68 @@
+import random
+from datetime import timedelta
+
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def sin_volcado_automatico(monkeypatch):
+    """Los cambios quedan en el journal: el hilo escritor no recarga nada en el medio"""
+    monkeypatch.setattr(app, "INTERVALO_GUARDADO", 3600)
+
+
+def conflictos_recorriendo_el_anio():
+    """Días con alguien asignado que no está disponible, mirando cada día"""
+    conflictos = []
+    for mes in app.MESES:
+        dias = app.obtener_dias_mes(mes, con_disponibilidad=False)
+        for dia in sorted(dias):
+            persona = dias[dia].get('persona')
+            if persona and not app.persona_disponible(persona, dias[dia]['fecha']):
+                conflictos.append((mes, dia, persona))
+    return conflictos
+
+
+def resumen(resultado):
+    return [(c["mes"], c["dia"], c["persona"]) for c in resultado["conflictos"]]
+
+
+def ventana_al_azar(azar):
+    inicio = app.INICIO_ANIO + timedelta(days=azar.randrange(app.DIAS_ANIO))
+    fin = inicio + timedelta(days=azar.randrange(60))
+    return {
+        "desde": None if azar.random() < 0.1 else inicio.isoformat(),
+        "hasta": None if azar.random() < 0.1 else fin.isoformat(),
+        "motivo": "test"
+    }
+
+
+def test_indice_incremental_coincide_con_recalcular_todo():
+    azar = random.Random(22)
+    app.conflictos_del_anio()
+    
+    for _ in range(8):
+        # Asignaciones al azar en algunos meses
+        for mes in azar.sample(app.MESES, 3):
+            dias = app.obtener_dias_mes(mes, con_disponibilidad=False)
+            elegidos = azar.sample(sorted(dias), 8)
+            app.guardar_asignaciones(mes, {dia: azar.choice(app.PERSONAS + [None]) for dia in elegidos})
+        
+        # Ventanas de inactividad que se agregan, se reemplazan y se quitan
+        disponibilidad = app.cargar_disponibilidad()
+        for persona in azar.sample(app.PERSONAS, 3):
+            ventanas = disponibilidad[persona]["inactividades"]
+            if ventanas and azar.random() < 0.4:
+                ventanas.pop(azar.randrange(len(ventanas)))
+            else:
+                ventanas.append(ventana_al_azar(azar))
+        app.guardar_disponibilidad(disponibilidad)
+        
+        assert app._indice_conflictos["valido"]
+        incremental = app.conflictos_del_anio()
+        assert resumen(incremental) == conflictos_recorriendo_el_anio()
+    
+    assert incremental["conflictos"], "el test tendría que generar algún conflicto"
+    app._indice_conflictos["valido"] = False
+    assert app.conflictos_del_anio() == incremental
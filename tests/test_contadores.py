@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def sin_volcado_automatico(monkeypatch):
+    """Los cambios quedan en el journal: el hilo escritor no recarga nada en el medio"""
+    monkeypatch.setattr(app, "INTERVALO_GUARDADO", 3600)
+
+
+def contar_linealmente(fecha):
+    """guardias_antes_de recorriendo el modelo día por día"""
+    resultado = {persona: dict.fromkeys(app.CAMPOS_CONTADOR, 0) for persona in app.PERSONAS}
+    for dias in app._modelo_calendario["meses"].values():
+        for info in dias.values():
+            persona = info.get('persona')
+            if persona in resultado and info['fecha'] < fecha:
+                resultado[persona]["total"] += 1
+                resultado[persona][info['tipo']] += 1
+                resultado[persona]["puntos"] += app.PUNTOS_POR_TIPO[info['tipo']]
+    return resultado
+
+
+def test_arbol_fenwick_coincide_con_la_suma_lineal():
+    azar = random.Random(2026)
+    valores = [0] * 50
+    arbol = app.ArbolFenwick(len(valores))
+    for _ in range(300):
+        posicion = azar.randrange(len(valores))
+        valor = azar.choice([-2, -1, 1, 1.5, 2])
+        valores[posicion] += valor
+        arbol.sumar(posicion, valor)
+        for fin in (0, 1, posicion, posicion + 1, len(valores), len(valores) + 10):
+            assert arbol.prefijo(fin) == sum(valores[:fin])
+
+
+FECHAS = ("2025-12-31", "2026-01-01", "2026-01-02", "2026-02-15", "2026-03-01", "2026-07-01", "2026-07-16", "2026-12-31", "2027-01-01")
+
+
+def test_guardias_antes_de_coincide_con_el_conteo_lineal():
+    for fecha in FECHAS:
+        assert app.guardias_antes_de(fecha) == contar_linealmente(fecha), fecha
+    assert app._contadores_guardias["valido"]
+    
+    # Reasignar días (asignar, cambiar de persona, dejar vacíos) con los
+    # contadores ya armados los mantiene al día sin reconstruirlos
+    azar = random.Random(17)
+    for _ in range(5):
+        for mes in ("Enero", "Febrero", "Julio", "Diciembre"):
+            dias = app.obtener_dias_mes(mes, con_disponibilidad=False)
+            elegidos = azar.sample(sorted(dias), 6)
+            app.guardar_asignaciones(mes, {dia: azar.choice(app.PERSONAS + [None]) for dia in elegidos})
+        assert app._contadores_guardias["valido"]
+        for fecha in FECHAS:
+            assert app.guardias_antes_de(fecha) == contar_linealmente(fecha), fecha
+    
+    # Y coinciden con los que se arman desde cero
+    parcial = {fecha: app.guardias_antes_de(fecha) for fecha in FECHAS}
+    app._contadores_guardias["valido"] = False
+    assert {fecha: app.guardias_antes_de(fecha) for fecha in FECHAS} == parcial
+
+
+def test_guardias_antes_de_solo_las_personas_pedidas():
+    personas = app.PERSONAS[:2]
+    resultado = app.guardias_antes_de("2026-06-01", personas)
+    assert list(resultado) == personas
+    assert resultado == {p: contar_linealmente("2026-06-01")[p] for p in personas}
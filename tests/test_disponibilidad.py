@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+import app
+
+
+def ventana(desde, hasta, motivo=None):
+    return {
+        "desde": desde.isoformat() if desde else None,
+        "hasta": hasta.isoformat() if hasta else None,
+        "motivo": motivo
+    }
+
+
+def cubre(v, fecha):
+    return (v["desde"] or "") <= fecha.isoformat() <= (v["hasta"] or "9999-12-31")
+
+
+def test_indice_inactividad_coincide_con_recorrer_las_ventanas():
+    d = date(2026, 1, 1)
+    ventanas = [
+        ventana(None, d + timedelta(days=10), "sin inicio"),
+        ventana(d + timedelta(days=5), d + timedelta(days=40), "larga"),
+        ventana(d + timedelta(days=8), d + timedelta(days=12), "dentro de la larga"),
+        ventana(d + timedelta(days=60), d + timedelta(days=60), "un día"),
+        ventana(d + timedelta(days=90), None, "sin fin"),
+        ventana(d + timedelta(days=95), d + timedelta(days=100), "dentro de la sin fin"),
+    ]
+    indice = app.IndiceInactividad(ventanas)
+    
+    fechas = [d + timedelta(days=k) for k in range(-30, 400)] + [date.min, date.max]
+    for fecha in fechas:
+        encontrada = indice.ventana_en(fecha)
+        if any(cubre(v, fecha) for v in ventanas):
+            assert encontrada is not None and cubre(encontrada, fecha), fecha
+        else:
+            assert encontrada is None, fecha
+    
+    for desde, hasta in [(d - timedelta(days=30), d - timedelta(days=1)), (d + timedelta(days=11), d + timedelta(days=11)),
+                         (d + timedelta(days=41), d + timedelta(days=59)), (d + timedelta(days=41), d + timedelta(days=60)),
+                         (d + timedelta(days=9), d + timedelta(days=96)), (d + timedelta(days=200), d + timedelta(days=300))]:
+        esperadas = [
+            v for v in indice.ventanas
+            if (v["desde"] or "") <= hasta.isoformat() and desde.isoformat() <= (v["hasta"] or "9999-12-31")
+        ]
+        assert indice.superpuestas(desde, hasta) == esperadas, (desde, hasta)
+    
+    assert app.IndiceInactividad([]).ventana_en(d) is None
+    assert app.IndiceInactividad([]).superpuestas(d, d) == []
+
+
+def test_reactivar_quita_solo_las_ventanas_de_hoy():
+    persona = app.PERSONAS[0]
+    hoy = date.today()
+    pasada = ventana(hoy - timedelta(days=30), hoy - timedelta(days=20), "pasada")
+    hasta_hoy = ventana(hoy - timedelta(days=5), hoy, "termina hoy")
+    superpuesta = ventana(hoy - timedelta(days=1), hoy + timedelta(days=3), "superpuesta")
+    sin_inicio = ventana(None, hoy + timedelta(days=1), "sin inicio")
+    futura = ventana(hoy + timedelta(days=1), hoy + timedelta(days=9), "futura")
+    sin_fin = ventana(hoy + timedelta(days=20), None, "sin fin")
+    cliente = app.app.test_client()
+    
+    respuesta = cliente.put(f'/api/disponibilidad/{persona}', json={
+        "inactividades": [pasada, hasta_hoy, superpuesta, sin_inicio, futura, sin_fin], "reparar": "no"
+    })
+    assert respuesta.status_code == 200
+    assert not app.persona_disponible(persona)
+    
+    respuesta = cliente.put(f'/api/disponibilidad/{persona}', json={"activo": True, "reparar": "no"})
+    assert respuesta.status_code == 200
+    
+    quedan = app.cargar_disponibilidad()[persona]["inactividades"]
+    assert quedan == [pasada, futura, sin_fin]
+    assert app.persona_disponible(persona)
+    assert not app.persona_disponible(persona, hoy + timedelta(days=1))
+    evento = app.consultar_historial({"persona": persona, "accion": "cambio_disponibilidad"}, limite=1)["eventos"][-1]
+    assert sorted(evento["quitadas"], key=lambda v: v["motivo"]) == [sin_inicio, superpuesta, hasta_hoy]
+    
+    # Reactivar sin ventanas que cubran hoy no quita nada
+    respuesta = cliente.put(f'/api/disponibilidad/{persona}', json={"activo": True, "reparar": "no"})
+    assert respuesta.status_code == 200
+    assert app.cargar_disponibilidad()[persona]["inactividades"] == [pasada, futura, sin_fin]
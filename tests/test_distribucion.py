@@ -0,0 +1,50 @@
+import time
+
+import app
+
+
+def test_exacto_anual_respeta_el_tope_de_tiempo():
+    """Con tiempo=1 el reparto exacto de todo el año no termina y vuelve al greedy a tiempo"""
+    pendientes = [
+        ((mes, dia_num), info)
+        for mes in app.MESES
+        for dia_num, info in sorted(app.obtener_dias_mes(mes, con_disponibilidad=False).items())
+    ]
+    personas = list(app.PERSONAS)
+    conteo = {p: app.conteo_vacio() for p in personas}
+    
+    inicio = time.monotonic()
+    plan = app.repartir_dias(pendientes, personas, conteo, metodo="exacto", tiempo=1)
+    assert plan["metodo"] == "greedy"
+    assert len(plan["asignaciones"]) == len(pendientes)
+    assert time.monotonic() - inicio < 5
+
+
+def test_exacto_anual_solo_como_trabajo():
+    """Un request directo no puede ocupar su hilo con el reparto anual exacto"""
+    cliente = app.app.test_client()
+    respuesta = cliente.post('/api/distribucion/anual', json={
+        "desde_mes": "Enero", "solo_calcular": True, "metodo": "exacto"
+    })
+    assert respuesta.status_code == 400
+
+
+def test_exacto_anual_como_trabajo_vuelve_al_greedy():
+    """Encolado con tiempo=1, el reparto anual exacto vuelve al greedy a tiempo"""
+    cliente = app.app.test_client()
+    inicio = time.monotonic()
+    respuesta = cliente.post('/api/trabajos', json={
+        "tipo": "distribucion_anual",
+        "parametros": {"desde_mes": "Enero", "solo_calcular": True, "metodo": "exacto", "tiempo": 1}
+    })
+    assert respuesta.status_code == 202
+    id_trabajo = respuesta.get_json()["id"]
+    
+    while time.monotonic() - inicio < 5:
+        respuesta = cliente.get(f'/api/trabajos/{id_trabajo}/resultado')
+        if respuesta.status_code != 202:
+            break
+        time.sleep(0.05)
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()["metodo"] == "greedy"
+    assert time.monotonic() - inicio < 5
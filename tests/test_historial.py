@@ -0,0 +1,107 @@
+import json
+
+import app
+
+
+def todos_los_eventos():
+    """El log leído entero, sin índice: lo que cualquier consulta tiene que respetar"""
+    with open(app.HISTORIAL_FILE, 'r', encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def coincide(evento, filtros):
+    claves = app.claves_evento_historial(evento)
+    return all(valor in claves[campo] for campo, valor in filtros.items())
+
+
+def todas_las_paginas(filtros, limite):
+    """Recorre las páginas con el cursor y las deja en orden cronológico"""
+    paginas = []
+    cursor = None
+    while True:
+        pagina = app.consultar_historial(filtros, cursor=cursor, limite=limite)
+        paginas.append(pagina["eventos"])
+        cursor = pagina["siguiente_cursor"]
+        if cursor is None:
+            break
+    return [evento for eventos in reversed(paginas) for evento in eventos]
+
+
+def registrar_eventos():
+    """Eventos con personas, meses y acciones cruzadas (incluye un lote)"""
+    a, b, c = app.PERSONAS[:3]
+    for i, (mes, persona, accion) in enumerate([
+        ("Marzo", a, "asignar"), ("Marzo", b, "asignar"), ("Abril", a, "eliminar"),
+        ("Abril", a, "asignar"), ("Marzo", a, "eliminar"), ("Mayo", c, "asignar"),
+    ]):
+        app.registrar_en_historial({"accion": accion, "mes": mes, "dia": i + 1, "antes": None, "despues": persona, "por": persona})
+    app.registrar_en_historial({
+        "accion": "asignar_lote", "mes": "Marzo", "meses": ["Marzo", "Abril"], "cambios": 2, "por": b,
+        "asignaciones": [
+            {"mes": "Marzo", "dia": 9, "antes": None, "despues": a},
+            {"mes": "Abril", "dia": 9, "antes": c, "despues": b},
+        ]
+    })
+
+
+def test_filtros_se_intersectan():
+    registrar_eventos()
+    a, b, c = app.PERSONAS[:3]
+    eventos = todos_los_eventos()
+    
+    for filtros in ({"persona": a}, {"persona": a, "mes": "Marzo"}, {"persona": a, "mes": "Abril", "accion": "asignar"},
+                    {"persona": c, "mes": "Abril"}, {"mes": "Mayo", "accion": "eliminar"}, {"por": b, "mes": "Abril"}):
+        esperados = [e for e in eventos if coincide(e, filtros)]
+        resultado = app.consultar_historial(filtros, limite=1000)
+        assert resultado["eventos"] == esperados, filtros
+        assert resultado["total"] == len(esperados)
+        assert resultado["siguiente_cursor"] is None
+
+
+def test_cursor_estable_entre_paginas():
+    registrar_eventos()
+    filtros = {"persona": app.PERSONAS[0]}
+    esperados = [e for e in todos_los_eventos() if coincide(e, filtros)]
+    assert todas_las_paginas(filtros, limite=2) == esperados
+    
+    # Eventos nuevos entre una página y la siguiente no corren el cursor
+    primera = app.consultar_historial(filtros, limite=2)
+    registrar_eventos()
+    segunda = app.consultar_historial(filtros, cursor=primera["siguiente_cursor"], limite=1000)
+    assert segunda["eventos"] + primera["eventos"] == esperados
+    assert segunda["siguiente_cursor"] is None
+    
+    # Sin filtros, las páginas cubren el log entero sin huecos ni repetidos
+    assert todas_las_paginas({}, limite=7) == todos_los_eventos()
+
+
+def test_indice_viejo_se_reconstruye():
+    registrar_eventos()
+    filtros = {"persona": app.PERSONAS[0], "mes": "Marzo"}
+    esperados = [e for e in todos_los_eventos() if coincide(e, filtros)]
+    assert app.consultar_historial(filtros, limite=1000)["eventos"] == esperados
+    
+    # El .idx pierde una entrada del medio (otro proceso se cayó a mitad de escribirlo)
+    with open(app.HISTORIAL_INDICE_FILE, 'r', encoding='utf-8') as f:
+        lineas = f.readlines()
+    del lineas[len(lineas) // 2]
+    with open(app.HISTORIAL_INDICE_FILE, 'w', encoding='utf-8') as f:
+        f.writelines(lineas)
+    app._historial_indice["tamano"] = None
+    
+    assert app.consultar_historial(filtros, limite=1000)["eventos"] == esperados
+    assert app.contar_eventos_historial() == len(todos_los_eventos())
+    
+    # El .idx reconstruido vuelve a cubrir todo el log y se puede cargar tal cual
+    with open(app.HISTORIAL_INDICE_FILE, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == len(todos_los_eventos())
+    app._historial_indice["tamano"] = None
+    assert app._cargar_indice_persistido()
+    
+    # Un .idx que apunta más allá del log (log reemplazado) también se descarta
+    with open(app.HISTORIAL_INDICE_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps([10 ** 9, 10, "2026-12-31T00:00:00", {}]) + "\n")
+    app._historial_indice["tamano"] = None
+    assert not app._cargar_indice_persistido()
+    app._historial_indice["tamano"] = None
+    assert app.consultar_historial(filtros, limite=1000)["eventos"] == esperados
@@ -0,0 +1,101 @@
+from openpyxl import load_workbook
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def sin_volcado_automatico(monkeypatch):
+    """Los volcados los hace cada test: el hilo escritor no se mete en el medio"""
+    monkeypatch.setattr(app, "INTERVALO_GUARDADO", 3600)
+
+
+def dias_libres(mes, cantidad):
+    """Primeros días del mes con (día, celda, persona distinta de la actual)"""
+    dias = app.obtener_dias_mes(mes, con_disponibilidad=False)
+    elegidos = []
+    for dia in sorted(dias)[:cantidad]:
+        persona = next(p for p in app.PERSONAS if p != dias[dia].get('persona'))
+        elegidos.append((dia, dias[dia]['celda_ref'], persona))
+    return elegidos
+
+
+def test_escrituras_van_al_journal_y_se_vuelcan_juntas():
+    (dia1, celda1, persona1), (dia2, celda2, persona2) = dias_libres("Marzo", 2)
+    app.guardar_asignaciones("Marzo", {dia1: persona1})
+    app.guardar_asignaciones("Marzo", {dia2: persona2})
+    
+    entradas, _ = app.leer_journal()
+    assert len(entradas) == 2
+    assert app.obtener_dias_mes("Marzo")[dia1]['persona'] == persona1
+    
+    assert app.volcar_journal_excel() == 2
+    assert app.tamano_journal() == 0
+    wb = load_workbook(app.EXCEL_FILE)
+    assert wb["Marzo"][celda1].value == persona1
+    assert wb["Marzo"][celda2].value == persona2
+    wb.close()
+    
+    # Un modelo recién cargado (otro worker) ve lo mismo desde el Excel
+    app.cargar_modelo_calendario()
+    assert app.obtener_dias_mes("Marzo")[dia2]['persona'] == persona2
+
+
+def test_modelo_viejo_se_pone_al_dia_sin_releer_el_excel(monkeypatch):
+    (dia1, _, persona1), (dia2, _, persona2) = dias_libres("Abril", 2)
+    app.obtener_dias_mes("Abril")
+    firma_vieja = app._modelo_calendario["firma"]
+    antes = {dia: app._modelo_calendario["meses"]["Abril"][dia].get('persona') for dia in (dia1, dia2)}
+    
+    # Un cambio que ya pasó al Excel y otro que sigue en el journal
+    app.guardar_asignaciones("Abril", {dia1: persona1})
+    app.volcar_journal_excel()
+    app.guardar_asignaciones("Abril", {dia2: persona2})
+    
+    firma_nueva = app.almacenamiento().firma_calendario()
+    cambios = app.almacenamiento().cambios_calendario_desde(firma_vieja, firma_nueva)
+    assert cambios == [("Abril", {dia1: persona1}), ("Abril", {dia2: persona2})]
+    
+    # El modelo de este proceso vuelve a como estaba antes de escribir (worker atrasado)
+    for dia, persona in antes.items():
+        app._modelo_calendario["meses"]["Abril"][dia]['persona'] = persona
+    app._modelo_calendario["firma"] = firma_vieja
+    
+    def sin_recargar():
+        raise AssertionError("se releyó el Excel entero")
+    monkeypatch.setattr(app, "cargar_modelo_calendario", sin_recargar)
+    
+    dias = app.obtener_dias_mes("Abril", con_disponibilidad=False)
+    assert dias[dia1]['persona'] == persona1
+    assert dias[dia2]['persona'] == persona2
+    assert app._modelo_calendario["firma"] == firma_nueva
+
+
+def test_linea_cortada_al_final_del_journal_se_descarta():
+    (dia1, celda1, persona1), (dia2, celda2, persona2) = dias_libres("Mayo", 2)
+    app.guardar_asignaciones("Mayo", {dia1: persona1})
+    completo = app.tamano_journal()
+    
+    # Caída a mitad de una escritura: queda una línea sin terminar
+    with open(app.JOURNAL_FILE, 'ab') as f:
+        f.write(b'{"meses": {"Mayo": {"3": ["C4", "')
+    
+    entradas, fin = app.leer_journal()
+    assert len(entradas) == 1
+    assert fin == completo
+    app.cargar_modelo_calendario()
+    assert app.obtener_dias_mes("Mayo")[dia1]['persona'] == persona1
+    
+    # La próxima escritura recorta la línea cortada antes de agregar la suya
+    app.guardar_asignaciones("Mayo", {dia2: persona2})
+    with open(app.JOURNAL_FILE, 'rb') as f:
+        assert f.read().endswith(b'\n')
+    entradas, fin = app.leer_journal()
+    assert len(entradas) == 2
+    assert fin == app.tamano_journal()
+    
+    assert app.volcar_journal_excel() == 2
+    wb = load_workbook(app.EXCEL_FILE)
+    assert wb["Mayo"][celda1].value == persona1
+    assert wb["Mayo"][celda2].value == persona2
+    wb.close()
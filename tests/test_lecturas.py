@@ -0,0 +1,130 @@
+import threading
+
+from flask import jsonify
+
+import app
+
+
+class EventoContado(threading.Event):
+    """Event que avisa cada vez que alguien se pone a esperarlo"""
+    
+    def __init__(self):
+        super().__init__()
+        self.esperando = threading.Semaphore(0)
+    
+    def wait(self, timeout=None):
+        self.esperando.release()
+        return super().wait(timeout)
+
+
+def leer_en_paralelo(clave, calcular, cantidad):
+    """
+    Un hilo empieza a calcular y queda frenado hasta que los otros `cantidad - 1`
+    están esperando su resultado. Retorna lo que recibió cada hilo.
+    """
+    soltar = threading.Event()
+    resultados = [None] * cantidad
+    
+    def calcular_frenado():
+        soltar.wait()
+        return calcular()
+    
+    def leer(i):
+        with app.app.test_request_context('/'):
+            try:
+                respuesta = app.leer_una_vez(clave, calcular_frenado)
+                resultados[i] = (respuesta.status_code, respuesta.get_json())
+            except Exception as e:
+                resultados[i] = e
+    
+    hilos = [threading.Thread(target=leer, args=(i,)) for i in range(cantidad)]
+    hilos[0].start()
+    while clave not in app._lecturas_en_curso:
+        pass
+    evento = EventoContado()
+    app._lecturas_en_curso[clave]["evento"] = evento
+    for hilo in hilos[1:]:
+        hilo.start()
+    for _ in hilos[1:]:
+        assert evento.esperando.acquire(timeout=5)
+    soltar.set()
+    for hilo in hilos:
+        hilo.join(timeout=5)
+    assert clave not in app._lecturas_en_curso
+    return resultados
+
+
+def test_pedidos_simultaneos_comparten_un_calculo():
+    llamadas = []
+    
+    def calcular():
+        llamadas.append(1)
+        return jsonify({"valor": 42})
+    
+    resultados = leer_en_paralelo(("/api/x", b"", "v1"), calcular, 6)
+    assert len(llamadas) == 1
+    assert resultados == [(200, {"valor": 42})] * 6
+    
+    # Pasado el cálculo, un pedido nuevo vuelve a calcular
+    with app.app.test_request_context('/'):
+        app.leer_una_vez(("/api/x", b"", "v1"), calcular)
+    assert len(llamadas) == 2
+
+
+def test_error_del_calculo_llega_a_todos():
+    llamadas = []
+    
+    def calcular():
+        llamadas.append(1)
+        raise ValueError("se rompió")
+    
+    resultados = leer_en_paralelo(("/api/x", b"", "v1"), calcular, 4)
+    assert len(llamadas) == 1
+    assert all(isinstance(r, ValueError) and str(r) == "se rompió" for r in resultados)
+
+
+def test_cache_descarta_la_ruta_menos_usada(monkeypatch):
+    monkeypatch.setattr(app, "MAX_CACHE_RESPUESTAS", 3)
+    with app.app.test_request_context('/'):
+        for n in range(3):
+            app.guardar_respuesta_cacheada((f"/r{n}", b""), "v1", jsonify({"n": n}))
+        
+        # Usar /r0 la deja como la más reciente: al entrar /r3 sale /r1
+        assert app.respuesta_cacheada(("/r0", b""), "v1").get_json() == {"n": 0}
+        app.guardar_respuesta_cacheada(("/r3", b""), "v1", jsonify({"n": 3}))
+        assert list(app._cache_respuestas) == [("/r2", b""), ("/r0", b""), ("/r3", b"")]
+        assert app.respuesta_cacheada(("/r1", b""), "v1") is None
+        
+        # Una versión nueva de una ruta la reemplaza sin agregar otra entrada
+        assert app.respuesta_cacheada(("/r2", b""), "v2") is None
+        app.guardar_respuesta_cacheada(("/r2", b""), "v2", jsonify({"n": 22}))
+        assert len(app._cache_respuestas) == 3
+        assert app.respuesta_cacheada(("/r2", b""), "v1") is None
+        assert app.respuesta_cacheada(("/r2", b""), "v2").get_json() == {"n": 22}
+
+
+def test_etag_nuevo_invalida_la_respuesta_cacheada():
+    persona = app.PERSONAS[0]
+    cliente = app.app.test_client()
+    
+    primera = cliente.get('/api/disponibilidad')
+    assert primera.status_code == 200
+    etag = primera.headers["ETag"]
+    assert len(app._cache_respuestas) == 1
+    
+    # Misma versión: sale del cache, y con If-None-Match es 304
+    antes = app.estadisticas_cache()["aciertos"]
+    assert cliente.get('/api/disponibilidad').get_data() == primera.get_data()
+    assert app.estadisticas_cache()["aciertos"] == antes + 1
+    assert cliente.get('/api/disponibilidad', headers={"If-None-Match": etag}).status_code == 304
+    
+    # Cambia la disponibilidad: ETag nuevo y respuesta recalculada
+    respuesta = cliente.put(f'/api/disponibilidad/{persona}', json={"activo": False, "motivo": "test", "reparar": "no"})
+    assert respuesta.status_code == 200
+    segunda = cliente.get('/api/disponibilidad', headers={"If-None-Match": etag})
+    assert segunda.status_code == 200
+    assert segunda.headers["ETag"] != etag
+    assert segunda.get_json()[persona]["activo"] is False
+    assert segunda.get_json()[persona]["motivo"] == "test"
+    assert app.estadisticas_cache()["aciertos"] == antes + 1
+    assert list(app._cache_respuestas.values())[0][0] == segunda.headers["ETag"].strip('"')
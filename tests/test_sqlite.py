@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import app
+from conftest import reiniciar_estado
+
+
+def lecturas():
+    """Lo que la app muestra, leído a través del backend activo"""
+    paginas = []
+    cursor = None
+    while True:
+        pagina = app.consultar_historial(cursor=cursor, limite=50)
+        paginas.append(pagina["eventos"])
+        cursor = pagina["siguiente_cursor"]
+        if cursor is None:
+            break
+    return {
+        "calendario": {mes: app.obtener_dias_mes(mes) for mes in app.MESES},
+        "disponibilidad": {
+            persona: sorted(
+                (v["desde"] or "", v["hasta"] or "", v["motivo"] or "")
+                for v in app.normalizar_registro_disponibilidad(info)["inactividades"]
+            )
+            for persona, info in (app.almacenamiento().leer_disponibilidad() or {}).items()
+        },
+        "usuarios": app.almacenamiento().leer_usuarios(),
+        "historial": [evento for eventos in reversed(paginas) for evento in eventos],
+        "eventos": app.contar_eventos_historial(),
+    }
+
+
+@pytest.fixture
+def pasar_a_sqlite(monkeypatch):
+    """Cambia el backend como lo haría GUARDIAS_ALMACENAMIENTO=sqlite en el próximo arranque"""
+    def pasar():
+        monkeypatch.setattr(app, "ALMACENAMIENTO", "sqlite")
+        reiniciar_estado()
+        assert app.almacenamiento().nombre == "sqlite"
+    return pasar
+
+
+def test_migracion_conserva_las_lecturas(pasar_a_sqlite):
+    persona = app.PERSONAS[0]
+    dias = app.obtener_dias_mes("Octubre", con_disponibilidad=False)
+    dia = next(d for d in sorted(dias) if dias[d].get('persona') != persona)
+    # Una asignación que todavía está en el journal también tiene que migrarse
+    app.guardar_asignaciones("Octubre", {dia: persona})
+    app.registrar_en_historial({"accion": "asignar", "mes": "Octubre", "dia": dia, "despues": persona, "por": persona})
+    antes = lecturas()
+    assert not os.path.exists(app.DB_FILE)
+    
+    pasar_a_sqlite()
+    assert os.path.exists(app.DB_FILE)
+    despues = lecturas()
+    
+    for clave in antes:
+        assert despues[clave] == antes[clave], clave
+    assert despues["calendario"]["Octubre"][dia]['persona'] == persona
+    
+    # Otro arranque sobre la misma base no vuelve a importar
+    app.AlmacenamientoSQLite(app.DB_FILE)
+    assert app.contar_eventos_historial() == antes["eventos"]
+
+
+def test_escrituras_en_sqlite_no_tocan_los_archivos(pasar_a_sqlite):
+    with open(app.EXCEL_FILE, 'rb') as f:
+        excel = f.read()
+    pasar_a_sqlite()
+    
+    persona = app.PERSONAS[1]
+    dias = app.obtener_dias_mes("Noviembre", con_disponibilidad=False)
+    dia = next(d for d in sorted(dias) if dias[d].get('persona') != persona)
+    app.guardar_asignaciones("Noviembre", {dia: persona})
+    
+    assert app.obtener_dias_mes("Noviembre")[dia]['persona'] == persona
+    assert not os.path.exists(app.JOURNAL_FILE)
+    with open(app.EXCEL_FILE, 'rb') as f:
+        assert f.read() == excel
+    
+    # Un proceso nuevo lee lo mismo de la base
+    reiniciar_estado()
+    assert app.obtener_dias_mes("Noviembre")[dia]['persona'] == persona